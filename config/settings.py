@@ -1,18 +1,32 @@
 from pathlib import Path
-from decouple import config as decouple_config
+from django.core.exceptions import ImproperlyConfigured
+from decouple import config as decouple_config, Csv
 
 
 # BUILD PATHS INSIDE THE PROJECT LIKE THIS: BASE_DIR / 'SUBDIR'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+# DEPLOYMENT PROFILE, SELECTED WITH DJANGO_PROFILE:
+#   production - POSTGRESQL WITH A CONNECTION POOL (DEFAULT)
+#   benchmark  - PRODUCTION-LIKE, DEBUG OFF, LARGER POOL, LOCALHOST ALLOWED
+#   local      - SQLITE FILE, SO THE APP RUNS AND CAN BE LOAD-TESTED WITHOUT AN EXTERNAL DATABASE
+SETTINGS_PROFILE = decouple_config('DJANGO_PROFILE', default='production')
+SETTINGS_PROFILES = ('production', 'benchmark', 'local')
+if SETTINGS_PROFILE not in SETTINGS_PROFILES:
+    raise ImproperlyConfigured(f'DJANGO_PROFILE must be one of {SETTINGS_PROFILES}, got {SETTINGS_PROFILE!r}')
+
 # THE SECRET KEY IS PLACED IN .ENV FOLDER TO EXCLUDE IT FROM GIT
 SECRET_KEY = decouple_config('DJANGO_SECRET_KEY')
-DEBUG = decouple_config('DEBUG')
+DEBUG = decouple_config('DEBUG', default=SETTINGS_PROFILE == 'local', cast=bool)
 
-ALLOWED_HOSTS = []
+ALLOWED_HOSTS = decouple_config(
+    'ALLOWED_HOSTS',
+    default='127.0.0.1,localhost' if SETTINGS_PROFILE == 'benchmark' else '',
+    cast=Csv(),
+)
 
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
+    'users.backends.ShardedModelBackend',
 ]
 
 # CUSTOM USER AUTHENTIFICATION MODEL
@@ -28,24 +42,56 @@ EMAIL_HOST_PASSWORD = decouple_config('EMAIL_PW')
 
 DEFAULT_FROM_EMAIL = decouple_config('EMAIL_ID')
 
+# NEW ACCOUNTS STAY INACTIVE UNTIL THE EMAILED LINK IS FOLLOWED (OFF FOR THE MVP)
+VERIFY_EMAIL = decouple_config('VERIFY_EMAIL', default=False, cast=bool)
+
+# BACKGROUND TASKS (core.tasks), SELECTED WITH TASKS_BACKEND:
+#   database  - QUEUED IN THE DATABASE AND RUN BY `manage.py run_tasks` WORKERS
+#   thread    - RUN BY AN IN-PROCESS THREAD POOL ONCE THE REQUEST'S TRANSACTION COMMITS
+#   immediate - RUN INLINE, FOR DEBUGGING
+TASKS_BACKEND = decouple_config(
+    'TASKS_BACKEND', default='thread' if SETTINGS_PROFILE == 'local' else 'database'
+)
+TASKS_THREAD_WORKERS = decouple_config('TASKS_THREAD_WORKERS', default=4, cast=int)
+# FAILED TASKS ARE RETRIED AFTER 5s, 10s, 20s, ... UP TO 15 MINUTES
+TASKS_RETRY_BASE_DELAY = 5
+TASKS_RETRY_MAX_DELAY = 15 * 60
+# RUNNING TASKS OLDER THAN THIS ARE ASSUMED TO BELONG TO A DEAD WORKER
+TASKS_LOCK_TIMEOUT = 10 * 60
+# TASKS QUEUED BY `run_tasks` EVERY N SECONDS (DATABASE BACKEND ONLY)
+TASKS_PERIODIC = {
+    'universities.tasks.expire_stale_reports': 5 * 60,
+    'universities.tasks.record_occupancy_history': 60,
+    'universities.tasks.prune_occupancy_history': 60 * 60,
+}
+
 # APPLICATION DEFINITION
 INSTALLED_APPS = [
-    'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
-    "verify_email.apps.VerifyEmailConfig",
     'core',
     'users',
     'universities'
 
 ]
 
+# OPTIONAL APPS ARE ONLY LOADED WHERE THEY ARE USED, WHICH SHORTENS THE COLD START OF EVERY WORKER.
+# THE ADMIN IS OFF IN THE BENCHMARK PROFILE; EMAIL VERIFICATION FOLLOWS VERIFY_EMAIL
+ADMIN_ENABLED = decouple_config('ADMIN_ENABLED', default=SETTINGS_PROFILE != 'benchmark', cast=bool)
+if ADMIN_ENABLED:
+    INSTALLED_APPS.insert(0, 'django.contrib.admin')
+if VERIFY_EMAIL:
+    INSTALLED_APPS.insert(INSTALLED_APPS.index('core'), 'verify_email.apps.VerifyEmailConfig')
+
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.MachineEndpointMiddleware',
+    'core.middleware.CompressionMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'universities.middleware.ShardMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -65,24 +111,154 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'core.pagecache.csrf_placeholder',
             ],
         },
     },
 ]
 
+# OUTSIDE THE LOCAL PROFILE, COMPILED TEMPLATES ARE KEPT FOR THE LIFETIME OF THE WORKER
+if SETTINGS_PROFILE != 'local':
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'config.wsgi.application'
 
-# POSTGRESQL DATABASE CONFIGURATION
+# SET WHEN A FORKING SERVER LOADS THE APP ONCE BEFORE FORKING ITS WORKERS (E.G. gunicorn --preload):
+# URLS, VIEWS AND TEMPLATES ARE THEN LOADED IN THE PARENT AND SHARED BY ALL WORKERS (core.startup)
+PRELOAD_APP = decouple_config('PRELOAD_APP', default=False, cast=bool)
+
+# DATABASE CONFIGURATION
+# DB_ENGINE IS 'postgresql' (DEFAULT) OR 'sqlite' (DEFAULT FOR THE LOCAL PROFILE)
+DB_ENGINE = decouple_config('DB_ENGINE', default='sqlite' if SETTINGS_PROFILE == 'local' else 'postgresql')
+
+# POSTGRESQL CONNECTION REUSE
+# DB_POOL USES DJANGO'S PSYCOPG CONNECTION POOL (REQUIRES psycopg[pool]); CONNECTIONS ARE HEALTH-CHECKED
+# ON CHECKOUT AND RECYCLED AFTER DB_POOL_MAX_LIFETIME SECONDS.
+# WITHOUT THE POOL, DB_CONN_MAX_AGE KEEPS ONE PERSISTENT CONNECTION PER WORKER THREAD INSTEAD.
+DB_POOL = decouple_config('DB_POOL', default=True, cast=bool)
+DB_POOL_OPTIONS = {
+    'min_size': decouple_config('DB_POOL_MIN_SIZE', default=2, cast=int),
+    'max_size': decouple_config(
+        'DB_POOL_MAX_SIZE', default=20 if SETTINGS_PROFILE == 'benchmark' else 10, cast=int
+    ),
+    'timeout': decouple_config('DB_POOL_TIMEOUT', default=10, cast=float),
+    'max_lifetime': decouple_config('DB_POOL_MAX_LIFETIME', default=30 * 60, cast=float),
+    'max_idle': decouple_config('DB_POOL_MAX_IDLE', default=5 * 60, cast=float),
+}
+DB_CONN_MAX_AGE = decouple_config('DB_CONN_MAX_AGE', default=60, cast=int)
+
+
+def database_settings(prefix, fallback=None):
+    """Build one DATABASES entry from the DB_* style variables starting with `prefix`."""
+    fallback = fallback or {}
+
+    if DB_ENGINE == 'sqlite':
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / decouple_config(prefix + 'NAME', default=prefix.lower().rstrip('_') + '.sqlite3'),
+            'OPTIONS': {
+                # WAL LETS READERS RUN WHILE A REPORT IS BEING WRITTEN
+                'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+                'transaction_mode': 'IMMEDIATE',
+                'timeout': 20,
+            },
+        }
+
+    return {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': decouple_config(prefix + 'NAME'),
+        'USER': decouple_config(prefix + 'USER', default=fallback.get('USER')),
+        'PASSWORD': decouple_config(prefix + 'PASSWORD', default=fallback.get('PASSWORD')),
+        'HOST': decouple_config(prefix + 'HOST', default=fallback.get('HOST', 'localhost')),
+        'PORT': decouple_config(prefix + 'PORT', default=fallback.get('PORT', '5432')),
+        # THE POOL AND PERSISTENT CONNECTIONS ARE MUTUALLY EXCLUSIVE
+        'CONN_MAX_AGE': 0 if DB_POOL else DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {'pool': DB_POOL_OPTIONS} if DB_POOL else {},
+    }
+
+
 DATABASES = {
+    'default': database_settings('DB_'),
+}
+
+# OPTIONAL PER-UNIVERSITY SHARDS, E.G. DB_SHARDS=shard_a,shard_b WITH DB_SHARD_A_NAME, DB_SHARD_A_HOST, ...
+# UNIVERSITIES ARE PLACED ON A SHARD WITH `manage.py move_university <id> <alias>`
+for shard_alias in decouple_config('DB_SHARDS', default='', cast=Csv()):
+    DATABASES[shard_alias] = database_settings(f'DB_{shard_alias.upper()}_', fallback=DATABASES['default'])
+
+DATABASE_ROUTERS = ['universities.routers.UniversityShardRouter']
+UNIVERSITY_SHARD_MAP_TTL = 60
+# IDS ON THE N-TH DATABASE ABOVE START AT N * SHARD_ID_BLOCK (RESERVED BY `manage.py migrate`), SO A MOVED
+# UNIVERSITY KEEPS ITS IDS WITHOUT COLLIDING ON THE TARGET. ONLY EVER APPEND TO DB_SHARDS: REORDERING OR
+# REMOVING A SHARD SHIFTS THE BLOCKS OF THE ONES AFTER IT
+SHARD_ID_BLOCK = 10 ** 12
+
+
+# CACHE, SHARED BY ALL WORKERS WHEN REDIS_URL IS SET (NEEDS THE redis PACKAGE), OTHERWISE PER PROCESS
+REDIS_URL = decouple_config('REDIS_URL', default='')
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': decouple_config('DB_NAME'),
-        'USER': decouple_config('DB_USER'),
-        'PASSWORD': decouple_config('DB_PASSWORD'),
-        'HOST': decouple_config('DB_HOST', default='localhost'),
-        'PORT': decouple_config('DB_PORT', default='5432'),
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# SECONDS THE PAGES ANONYMOUS VISITORS GET (LANDING PAGE, UNIVERSITY LIST) ARE CACHED (core.pagecache).
+# UNIVERSITY CHANGES DROP THEM AT ONCE, IN EVERY WORKER WITH REDIS AND ONLY IN THE CHANGING ONE WITH LOCMEM
+PAGE_CACHE_TIMEOUT = 60
+
+# SESSIONS ARE READ FROM THE CACHE, THE DATABASE IS ONLY HIT ON A CACHE MISS AND ON WRITES
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# SECONDS A WORKER KEEPS A SIGNED-IN USER AND THEIR UNIVERSITY IN MEMORY (users.backends.ShardedModelBackend).
+# LOCAL CHANGES DROP THE ENTRY AT ONCE, CHANGES MADE BY OTHER WORKERS SHOW UP WITHIN THIS WINDOW
+IDENTITY_CACHE_TTL = 30
+# USERS KEPT PER WORKER; THE LEAST RECENTLY SEEN ARE DROPPED FIRST
+IDENTITY_CACHE_MAX_SIZE = 10_000
+
+# SECONDS AFTER WHICH A LEAF'S OCCUPANCY REPORT IS CLEARED, PER SPACE TYPE (universities.tasks.expire_stale_reports)
+OCCUPANCY_REPORT_TTL = {
+    'coffee': 30 * 60,
+    'eating': 60 * 60,
+    'studying': 2 * 60 * 60,
+}
+
+# OCCUPANCY CHANGE EVENTS (universities.outbox), DELIVERED AT LEAST ONCE BY `manage.py dispatch_outbox`.
+# MORE CONSUMERS: 'name': {'BACKEND': 'universities.outbox.WebhookConsumer' OR A LOCAL SINK CLASS, ...OPTIONS}
+OUTBOX_CONSUMERS = {}
+OUTBOX_WEBHOOK_URL = decouple_config('OUTBOX_WEBHOOK_URL', default='')
+if OUTBOX_WEBHOOK_URL:
+    OUTBOX_CONSUMERS['webhook'] = {
+        'BACKEND': 'universities.outbox.WebhookConsumer',
+        'URL': OUTBOX_WEBHOOK_URL,
+        'SECRET': decouple_config('OUTBOX_WEBHOOK_SECRET', default=''),
+        'TIMEOUT': 5,
     }
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 10
+OUTBOX_LOCK_TIMEOUT = 5 * 60
+
+# TOKEN-BUCKET RATE LIMITS (core.ratelimit): `rate` REFILLS THE BUCKET, `burst` IS ITS SIZE
+# EACH KEY (user, ip) GETS ITS OWN BUCKET. IF THE CACHE IS UNREACHABLE, PER-PROCESS BUCKETS ARE USED
+# REPORTS ARE KEYED ON THE USER ONLY: A WHOLE CAMPUS MAY SHARE ONE NAT ADDRESS
+RATELIMIT_CACHE_ALIAS = 'default'
+RATELIMIT_TRUST_X_FORWARDED_FOR = decouple_config('RATELIMIT_TRUST_X_FORWARDED_FOR', default=False, cast=bool)
+RATELIMITS = {
+    'occupancy_report': {'rate': '12/m', 'burst': 5, 'keys': ['user']},
+    'signin': {'rate': '10/m', 'burst': 5, 'keys': ['ip']},
 }
+if SETTINGS_PROFILE == 'benchmark' or not decouple_config('RATELIMIT_ENABLED', default=True, cast=bool):
+    # THE LOAD TESTS (`manage.py load_test`) DRIVE MANY SYNTHETIC STUDENTS FROM A SINGLE ADDRESS
+    RATELIMITS = {}
 
 
 # PASSWORD VALIDATION
@@ -103,7 +279,56 @@ USE_TZ = True
 
 
 # STATIC FILES (CSS, JavaScript, Images)
+# `collectstatic` WRITES FINGERPRINTED NAMES PLUS .gz AND .zst VARIANTS TO STATIC_ROOT;
+# FINGERPRINTED FILES CAN BE CACHED BY BROWSERS FOR A YEAR. WITH DEBUG OFF (PRODUCTION AND BENCHMARK
+# PROFILES) PAGES NEED THAT MANIFEST: RUN `collectstatic` BEFORE STARTING THE SERVER
 STATIC_URL = 'static/'
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'core.storage.CompressedManifestStaticFilesStorage'},
+}
+# LET DJANGO SERVE STATIC_ROOT ITSELF WHEN NO WEB SERVER SITS IN FRONT (E.G. WHEN BENCHMARKING)
+SERVE_STATIC = decouple_config('SERVE_STATIC', default=SETTINGS_PROFILE == 'benchmark', cast=bool)
+
+# NEAREST-SPACE SEARCH (universities.spatial): GRID CELL SIZE AND FLOOR HEIGHT IN METRES
+SPATIAL_INDEX_CELL_SIZE = 50
+SPATIAL_INDEX_FLOOR_HEIGHT = 4
+
+# IN-PROCESS READ MODEL OF EVERY CAMPUS (universities.readmodel), USED BY THE DASHBOARD AND THE SEARCH:
+# HOW OFTEN A WORKER CATCHES UP WITH OTHER WORKERS' CHANGES (SECONDS, VIA universities.sync DELTAS).
+# THE DASHBOARD ALWAYS CHECKS THE UNIVERSITY'S CHANGE SEQUENCE FIRST
+READ_MODEL_MAX_AGE = 5
+
+# OCCUPANCY SENSORS (universities.sensors): DEVICE ENDPOINTS UNDER THIS PREFIX SKIP THE BROWSER
+# MIDDLEWARE (core.middleware.MachineEndpointMiddleware); KEYS AND SPACE MAPPINGS ARE CACHED PER WORKER
+# FOR SENSOR_CACHE_TTL SECONDS, SO A REVOKED KEY STOPS WORKING WITHIN THAT TIME
+MACHINE_ENDPOINT_PREFIX = '/universities/sensors/'
+SENSOR_CACHE_TTL = 60
+SENSOR_BATCH_MAX_READINGS = 1000
+
+# OCCUPANCY HISTORY (universities.history), RECORDED BY A PERIODIC TASK: A FULL SNAPSHOT EVERY
+# HISTORY_SNAPSHOT_INTERVAL SECONDS OR HISTORY_MAX_DELTAS DELTAS, WHICHEVER COMES FIRST, SO A PAST
+# DASHBOARD NEVER APPLIES MORE THAN HISTORY_MAX_DELTAS DELTAS. RECORDS ARE KEPT HISTORY_RETENTION_DAYS
+HISTORY_SNAPSHOT_INTERVAL = 60 * 60
+HISTORY_MAX_DELTAS = 60
+HISTORY_RETENTION_DAYS = 30
+
+# BULK ACCOUNT PROVISIONING (users.provisioning) THROUGH POST /users/provision: ACCOUNTS PER REQUEST.
+# THE REQUEST HASHES EVERY PASSWORD ITSELF (ABOUT HALF A SECOND EACH); `manage.py provision_accounts`
+# HAS NO LIMIT AND HASHES IN A PROCESS POOL (--workers)
+PROVISIONING_API_MAX_ACCOUNTS = 20
+
+# SECONDS A CAMPUS SUMMARY (universities.summary) IS CACHED. ENTRIES ARE KEYED BY THE UNIVERSITY'S
+# CHANGE SEQUENCE, SO THIS ONLY BOUNDS HOW LONG SUPERSEDED VERSIONS OCCUPY THE CACHE
+CAMPUS_SUMMARY_CACHE_TIMEOUT = 10 * 60
+
+# RESPONSE COMPRESSION (core.middleware.CompressionMiddleware): ZSTD WHEN ACCEPTED, OTHERWISE GZIP
+COMPRESSION_MIN_SIZE = 512
+COMPRESSION_GZIP_LEVEL = 6
+COMPRESSION_ZSTD_LEVEL = 3
+# RANDOM PADDING PER COMPRESSED RESPONSE, SO PAGE SIZES DO NOT LEAK THE CSRF TOKENS THEY CONTAIN (BREACH)
+COMPRESSION_MAX_RANDOM_BYTES = 100
 
 # DEFAULT PRIMARY KEY FIELD TYPE
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
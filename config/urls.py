@@ -1,11 +1,20 @@
-from django.contrib import admin
-from django.urls import path, include
+from django.conf import settings
+from django.urls import path, re_path, include
+from core.views import static_asset
 
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
     path('', include('core.urls')),
     path('users/', include('users.urls')),
-    path('verification/', include('verify_email.urls')),
     path('universities/', include('universities.urls')),
 ]
+
+# Optional apps (settings.ADMIN_ENABLED, settings.VERIFY_EMAIL) are only imported when installed
+if settings.ADMIN_ENABLED:
+    from django.contrib import admin
+    urlpatterns.append(path('admin/', admin.site.urls))
+if settings.VERIFY_EMAIL:
+    urlpatterns.append(path('verification/', include('verify_email.urls')))
+
+if settings.SERVE_STATIC:
+    urlpatterns.append(re_path(r'^' + settings.STATIC_URL.lstrip('/') + r'(?P<path>.+)$', static_asset))
@@ -1,7 +1,12 @@
 import os
+from django.conf import settings
 from django.core.wsgi import get_wsgi_application
 
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
 application = get_wsgi_application()
+
+if settings.PRELOAD_APP:
+    from core.startup import preload
+    preload()
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.template import Context, Template
+from django.utils import timezone
+
+from universities.models import Space
+
+
+class Command(BaseCommand):
+    help = "Time the dashboard tree rendering on synthetic campuses of growing size (no database needed)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+        parser.add_argument('--fanout', type=int, default=8, help='Children per composite space')
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, sizes, fanout, repeat, **options):
+        template = Template('{% load space_tree %}{% render_space_tree spaces %}')
+
+        for size in sizes:
+            spaces = self.build_campus(size, fanout)
+            context = Context({'spaces': spaces, 'csrf_token': 'benchmark'})
+
+            best = min(self.time_render(template, context) for _ in range(repeat))
+            self.stdout.write(
+                f'{size:>8} spaces: {best * 1000:8.1f} ms total, {best / size * 1e6:6.2f} us per space'
+            )
+
+    @staticmethod
+    def time_render(template, context):
+        start = time.perf_counter()
+        template.render(context)
+        return time.perf_counter() - start
+
+    @staticmethod
+    def build_campus(size, fanout):
+        # Breadth-first ids: the parent of space i is (i - 1) // fanout
+        now = timezone.now()
+        return [
+            Space(
+                id=i + 1,
+                name=f'Space {i}',
+                location='Main campus',
+                parent_id=(i - 1) // fanout + 1 if i else None,
+                current_occupancy=i % 5 + 1,
+                last_updated=now,
+            )
+            for i in range(size)
+        ]
@@ -0,0 +1,232 @@
+import re
+from contextlib import ExitStack
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from core.models import Task
+from core.tasks import claim_next_task
+from universities.models import University, Space, SpaceTombstone, OutboxMessage, StudyingAttributes
+from universities.outbox import claim_batch
+from universities.readmodel import load_campus
+from universities.sharding import forget_university, shard_for_email
+from universities.summary import compute_campus_summary
+from universities.sync import compute_aggregate, expire_report_batch, get_changes, get_stale_reports
+from universities.tasks import delete_university
+from users.backends import ShardedModelBackend
+
+
+# Full table scans in EXPLAIN output; index lookups show up as "SEARCH" (SQLite) or "Index Scan" (PostgreSQL)
+FULL_SCAN_PATTERNS = {
+    'sqlite': r'\bSCAN (?:TABLE )?"?{table}"?\b',
+    'postgresql': r'\bSeq Scan on "?{table}"?\b',
+}
+
+# Statements worth a plan; inserts and savepoints have none to speak of
+EXPLAINED_STATEMENTS = ('SELECT', 'WITH', 'UPDATE', 'DELETE')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a representative dataset, run every hot code path on it, EXPLAIN the "
+        "queries they send and fail when one of them scans its whole table instead of "
+        "using an index. Everything runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Shard the sample universities live on')
+        parser.add_argument('--universities', type=int, default=20)
+        parser.add_argument('--spaces', type=int, default=500, help='Spaces per university')
+        parser.add_argument('--users', type=int, default=200, help='Users per university')
+
+    def handle(self, database, universities, spaces, users, **options):
+        # The shard directory, sessions and tasks always live on the default database
+        aliases = list(dict.fromkeys([DEFAULT_DB_ALIAS, database]))
+        for alias in aliases:
+            if connections[alias].vendor not in FULL_SCAN_PATTERNS:
+                raise CommandError(f'Query plans cannot be checked on {connections[alias].vendor}')
+
+        failures = []
+        sample = {}
+        try:
+            with ExitStack() as stack:
+                for alias in aliases:
+                    stack.enter_context(transaction.atomic(using=alias))
+                sample = self.generate(database, universities, spaces, users)
+                for alias in aliases:
+                    with connections[alias].cursor() as cursor:
+                        cursor.execute('ANALYZE')
+                        if connections[alias].vendor == 'postgresql':
+                            # With sequential scans priced out, one is only chosen when no index can serve the query
+                            cursor.execute('SET LOCAL enable_seqscan = off')
+
+                for name, tables, run in self.get_hot_paths(database, sample):
+                    if not self.check_path(name, tables, run, aliases, options['verbosity']):
+                        failures.append(name)
+                raise Rollback
+        except Rollback:
+            pass
+        finally:
+            # The rolled back universities must not linger in this process's shard map
+            for university_id in sample.get('university_ids', []):
+                forget_university(university_id)
+
+        if failures:
+            raise CommandError(f"Full table scans in: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS('Every hot-path query uses an index'))
+
+    def check_path(self, name, tables, run, aliases, verbosity):
+        """Run one code path and EXPLAIN each distinct statement it sent to one of `tables`."""
+        with ExitStack() as stack:
+            contexts = {alias: stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in aliases}
+            run()
+
+        statements = {}
+        for alias, context in contexts.items():
+            for query in context.captured_queries:
+                sql = query['sql']
+                touched = [table for table in tables if re.search(rf'\b"?{table}"?\b', sql)]
+                if touched and sql.lstrip().upper().startswith(EXPLAINED_STATEMENTS):
+                    # Statements repeated with other ids are explained once
+                    statements.setdefault((alias, re.sub(r"'[^']*'|\b\d+\b", '?', sql)), (alias, sql, touched))
+
+        if not statements:
+            self.stdout.write(f'{name}: {self.style.ERROR("NO QUERY CAPTURED")}')
+            return False
+
+        scans = []
+        for alias, sql, touched in statements.values():
+            plan = self.explain(alias, sql)
+            pattern = FULL_SCAN_PATTERNS[connections[alias].vendor]
+            scanned = any(re.search(pattern.format(table=table), plan) for table in touched)
+            scans.append(scanned)
+            if verbosity > 1 or scanned:
+                self.stdout.write(f'  SQL:  {sql}')
+                for line in plan.splitlines():
+                    self.stdout.write(f'  plan: {line}')
+
+        ok = not any(scans)
+        status = self.style.SUCCESS('ok') if ok else self.style.ERROR('FULL SCAN')
+        self.stdout.write(f'{name}: {status} ({len(statements)} statements)')
+        return ok
+
+    @staticmethod
+    def explain(alias, sql):
+        connection = connections[alias]
+        with connection.cursor() as cursor:
+            # Captured SQL has its parameters inlined; no params, so no %-formatting either
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+
+    def generate(self, database, university_count, space_count, user_count):
+        """University trees with a fanout of 8, a third of them with reports by their users."""
+        User = get_user_model()
+        now = timezone.now()
+        tag = now.strftime('%H%M%S%f')
+
+        universities = University.objects.using(DEFAULT_DB_ALIAS).bulk_create([
+            University(name=f'Plan check {tag} {number}', email_domain=f'@plan-{tag}-{number}.test', shard=database)
+            for number in range(university_count)
+        ])
+        if database != DEFAULT_DB_ALIAS:
+            # The shard's mirror rows, as universities.signals keeps them
+            University.objects.using(database).bulk_create(universities)
+
+        for university in universities:
+            reporters = User.objects.using(database).bulk_create([
+                User(email=f'user{number}{university.email_domain}', associated_university=university, is_active=True)
+                for number in range(user_count)
+            ])
+            created = Space.objects.using(database).bulk_create([
+                Space(
+                    name=f'Space {number}',
+                    location='Campus',
+                    space_type=Space.SPACE_TYPES[number % 3][0],
+                    associated_university=university,
+                    current_occupancy=number % 5 + 1 if number % 3 == 0 else None,
+                    last_updated_by=reporters[number % len(reporters)] if number % 3 == 0 and reporters else None,
+                    last_updated=now - timedelta(minutes=number % 300),
+                    change_seq=number + 1,
+                )
+                for number in range(space_count)
+            ], batch_size=500)
+            # Breadth-first tree: the parent of space i is (i - 1) // 8
+            for number, space in enumerate(created[1:], start=1):
+                space.parent_id = created[(number - 1) // 8].pk
+            Space.objects.using(database).bulk_update(created, ['parent'], batch_size=500)
+
+            StudyingAttributes.objects.using(database).bulk_create([
+                StudyingAttributes(space=space, has_wifi=space.pk % 2 == 0)
+                for space in created if space.space_type == Space.SPACE_TYPE_STUDYING
+            ])
+            SpaceTombstone.objects.using(database).bulk_create([
+                SpaceTombstone(university_id=university.pk, space_id=10 ** 9 + number, change_seq=space_count + number)
+                for number in range(space_count // 10)
+            ])
+            University.objects.using(database).filter(pk=university.pk).update(change_seq=space_count * 2)
+
+        Task.objects.using(DEFAULT_DB_ALIAS).bulk_create([
+            Task(name='plan.check', status=Task.STATUS_DONE if number % 10 else Task.STATUS_QUEUED)
+            for number in range(university_count * 50)
+        ])
+        OutboxMessage.objects.using(database).bulk_create([
+            OutboxMessage(
+                consumer='plan-check',
+                payload={},
+                status=OutboxMessage.STATUS_DELIVERED if number % 10 else OutboxMessage.STATUS_PENDING,
+            )
+            for number in range(university_count * 50)
+        ])
+
+        university = universities[len(universities) // 2]
+        return {
+            'university_ids': [university.pk for university in universities],
+            'university': university,
+            'space': Space.objects.using(database).filter(associated_university=university, parent=None).first(),
+            'email': f'user{user_count // 2}{university.email_domain}',
+            'now': now,
+        }
+
+    def get_hot_paths(self, database, sample):
+        """(name, tables expected to be read through an index, code path to run) of each hot path."""
+        university = sample['university']
+        session_store = import_module(settings.SESSION_ENGINE).SessionStore
+
+        return [
+            ('campus read model', ['universities_space'], lambda: load_campus(university.pk)),
+            ('campus summary', ['universities_space'], lambda: compute_campus_summary(university.pk, database)),
+            ('aggregate refresh', ['universities_space'], lambda: compute_aggregate(
+                sample['space'].pk, None, database,
+            )),
+            ('delta sync', ['universities_space', 'universities_spacetombstone'], lambda: get_changes(
+                university.pk, since=0,
+            )),
+            ('report expiry', ['universities_space'], lambda: expire_report_batch(
+                get_stale_reports(database, Space.SPACE_TYPE_COFFEE, sample['now'] - timedelta(hours=1)),
+                university.pk, database, batch_size=100,
+            )),
+            ('sign-in', ['universities_university', 'users_user'], lambda: ShardedModelBackend().authenticate(
+                None, username=sample['email'], password='plan-check',
+            )),
+            ('signup domain', ['universities_university'], lambda: (
+                shard_for_email(sample['email']), get_user_model().get_university_from_email(sample['email']),
+            )),
+            # Session middleware on a cache miss
+            ('session', ['django_session'], lambda: session_store(session_key='x' * 32).load()),
+            ('task claim', ['core_task'], claim_next_task),
+            ('outbox claim', ['universities_outboxmessage'], lambda: claim_batch('plan-check', database, 100)),
+            # Last: it removes the sample university
+            ('university deletion', ['universities_space', 'users_user', 'universities_spacetombstone'], lambda: (
+                delete_university(university.pk, batch_size=100),
+            )),
+        ]
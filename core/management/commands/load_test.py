@@ -0,0 +1,319 @@
+import asyncio
+import csv
+import json
+import random
+import re
+import subprocess
+import sys
+import time
+import uuid
+from urllib.parse import urlsplit
+
+import httpx
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from universities.models import University, Space
+from universities.tasks import delete_university
+from users.provisioning import provision_accounts
+
+
+SPACE_ID = re.compile(r'name="space_id" value="(\d+)"')
+CSRF_TOKEN = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+TAP_VALUES = (1, 3, 5)  # The Free / Busy / Full buttons of the dashboard
+
+
+class Stats:
+    """Latencies and outcomes per action, filled by all simulated students."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, action, seconds, error=None):
+        self.latencies.setdefault(action, []).append(seconds)
+        if error:
+            errors = self.errors.setdefault(action, {})
+            errors[error] = errors.get(error, 0) + 1
+
+    def summary(self, elapsed):
+        actions = {}
+        for action, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            failed = sum(self.errors.get(action, {}).values())
+            actions[action] = {
+                'requests': len(latencies),
+                'per_second': len(latencies) / elapsed,
+                'error_rate': failed / len(latencies),
+                'errors': self.errors.get(action, {}),
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p90_ms': percentile(latencies, 90) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'max_ms': latencies[-1] * 1000,
+            }
+        total = sum(action['requests'] for action in actions.values())
+        failed = sum(sum(action['errors'].values()) for action in actions.values())
+        return {
+            'elapsed': elapsed,
+            'requests': total,
+            'per_second': total / elapsed if elapsed else 0,
+            'error_rate': failed / total if total else 0,
+            'actions': actions,
+        }
+
+
+def percentile(ordered, percent):
+    # Nearest rank on an already sorted list
+    index = max(0, min(len(ordered) - 1, round(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def parse_mix(value):
+    # 'dashboard=9,occupancy=1' -> {'dashboard': 9, 'occupancy': 1}
+    mix = {}
+    for part in value.split(','):
+        action, _, weight = part.partition('=')
+        if action not in ('dashboard', 'occupancy') or not weight.isdigit():
+            raise CommandError(f'Invalid --mix entry {part!r}, expected dashboard=N or occupancy=N')
+        mix[action] = int(weight)
+    if not sum(mix.values()):
+        raise CommandError('--mix needs at least one positive weight')
+    return mix
+
+
+class Student:
+    """One synthetic user with its own cookies; `stats` is switched between the sign-in and traffic phases."""
+
+    def __init__(self, base_url, email, password, timeout):
+        self.email = email
+        self.password = password
+        self.stats = None
+        self.client = httpx.AsyncClient(base_url=base_url, timeout=timeout)
+        self.space_ids = []
+        self.csrf_token = None
+
+    async def request(self, action, method, url, expected, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as error:
+            self.stats.record(action, time.perf_counter() - start, type(error).__name__)
+            return None
+        error = None if response.status_code == expected else f'HTTP {response.status_code}'
+        self.stats.record(action, time.perf_counter() - start, error)
+        return None if error else response
+
+    async def sign_in(self, stats, delay):
+        self.stats = stats
+        await asyncio.sleep(delay)
+        response = await self.request('signin_form', 'GET', '/users/signin_form', 200)
+        if response is None:
+            return False
+        response = await self.request('signin', 'POST', '/users/signin_form', 302, data={
+            'csrfmiddlewaretoken': self.read_csrf_token(response),
+            'username': self.email,
+            'password': self.password,
+        })
+        if response is None:
+            return False
+        await self.dashboard()
+        return True
+
+    def read_csrf_token(self, response):
+        match = CSRF_TOKEN.search(response.text)
+        return match.group(1) if match else self.client.cookies.get('csrftoken', '')
+
+    async def dashboard(self):
+        response = await self.request('dashboard', 'GET', '/', 200)
+        if response is not None:
+            # Taps go to spaces the student has actually seen, with the token of the page
+            self.space_ids = SPACE_ID.findall(response.text) or self.space_ids
+            self.csrf_token = self.read_csrf_token(response)
+
+    async def occupancy(self):
+        if not self.space_ids:
+            return await self.dashboard()
+        await self.request('occupancy', 'POST', '/', 302, data={
+            'csrfmiddlewaretoken': self.csrf_token,
+            'update_occupancy': '1',
+            'space_id': random.choice(self.space_ids),
+            'current_occupancy': str(random.choice(TAP_VALUES)),
+        })
+
+    async def replay(self, stats, mix, deadline, think_time):
+        self.stats = stats
+        actions, weights = list(mix), list(mix.values())
+        while time.monotonic() < deadline:
+            action = random.choices(actions, weights)[0]
+            await getattr(self, action)()
+            if think_time:
+                await asyncio.sleep(random.expovariate(1 / think_time))
+
+
+class Command(BaseCommand):
+    help = (
+        "Sign in synthetic students and replay a mix of dashboard views and occupancy taps "
+        "against a running server, then report throughput, latency percentiles and error rates. "
+        "Run the server with the benchmark profile or RATELIMIT_ENABLED=False, otherwise "
+        "sign-ins and taps are throttled."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--users', type=int, default=50, help='Concurrent students')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds of traffic after the ramp-up')
+        parser.add_argument('--ramp-up', type=float, default=5, help='Seconds over which students sign in')
+        parser.add_argument('--mix', default='dashboard=9,occupancy=1', help='Relative weights of the actions')
+        parser.add_argument('--think-time', type=float, default=1.0, help='Mean pause between actions, 0 for none')
+        parser.add_argument('--timeout', type=float, default=10)
+        parser.add_argument(
+            '--accounts',
+            help="CSV with 'email' and 'password' columns of existing accounts. "
+                 "Without it a throwaway university with --spaces spaces and --users accounts is created",
+        )
+        parser.add_argument('--spaces', type=int, default=200, help='Spaces of the throwaway university')
+        parser.add_argument('--keep', action='store_true', help='Keep the throwaway university afterwards')
+        parser.add_argument('--serve', action='store_true', help='Start `runserver` on --url for the run')
+        parser.add_argument('--json', help='Also write the results to this file')
+        parser.add_argument('--max-error-rate', type=float, help='Fail when the overall error rate is higher')
+        parser.add_argument('--max-p99', type=float, help='Fail when an action is slower at p99 (ms)')
+
+    def handle(self, **options):
+        mix = parse_mix(options['mix'])
+        university = None
+        if options['accounts']:
+            with open(options['accounts'], newline='', encoding='utf-8') as source:
+                accounts = [(row['email'], row['password']) for row in csv.DictReader(source)]
+            accounts = accounts[:options['users']]
+        else:
+            university, accounts = self.create_campus(options['users'], options['spaces'])
+
+        server = self.start_server(options['url'], options['verbosity']) if options['serve'] else None
+        try:
+            summary = asyncio.run(self.run(accounts, mix, options))
+        finally:
+            if server:
+                server.terminate()
+                server.wait()
+            if university and not options['keep']:
+                delete_university(university.id)
+
+        self.report(summary)
+        if options['json']:
+            with open(options['json'], 'w', encoding='utf-8') as target:
+                json.dump(summary, target, indent=2)
+
+        # Thresholds apply to the traffic phase, sign-ins only count when they failed
+        traffic = summary['traffic']
+        failures = []
+        if summary['signed_in'] < summary['students']:
+            failures.append(f"{summary['students'] - summary['signed_in']} students could not sign in")
+        if options['max_error_rate'] is not None and traffic['error_rate'] > options['max_error_rate']:
+            failures.append(f"error rate {traffic['error_rate']:.2%} above {options['max_error_rate']:.2%}")
+        if options['max_p99'] is not None:
+            failures += [
+                f"{action} p99 {stats['p99_ms']:.0f} ms above {options['max_p99']:.0f} ms"
+                for action, stats in traffic['actions'].items()
+                if stats['p99_ms'] > options['max_p99']
+            ]
+        if failures:
+            raise CommandError('; '.join(failures))
+
+    async def run(self, accounts, mix, options):
+        students = [Student(options['url'], email, password, options['timeout']) for email, password in accounts]
+        try:
+            # 1. SIGN EVERYBODY IN, SPREAD OVER THE RAMP-UP (password hashing dominates this phase)
+            signin_stats = Stats()
+            start = time.monotonic()
+            signed_in = await asyncio.gather(*(
+                student.sign_in(signin_stats, delay=options['ramp_up'] * number / len(students))
+                for number, student in enumerate(students)
+            ))
+            signin = signin_stats.summary(time.monotonic() - start)
+
+            # 2. REPLAY THE MIX WITH ALL SIGNED-IN STUDENTS FOR THE SAME WINDOW
+            traffic_stats = Stats()
+            start = time.monotonic()
+            deadline = start + options['duration']
+            await asyncio.gather(*(
+                student.replay(traffic_stats, mix, deadline, options['think_time'])
+                for student, ok in zip(students, signed_in) if ok
+            ))
+            traffic = traffic_stats.summary(time.monotonic() - start)
+        finally:
+            for student in students:
+                await student.client.aclose()
+
+        return {'students': len(students), 'signed_in': sum(signed_in), 'signin': signin, 'traffic': traffic}
+
+    def create_campus(self, user_count, space_count):
+        tag = uuid.uuid4().hex[:8]
+        university = University.objects.create(
+            name=f'Load test {tag}',
+            email_domain=f'@loadtest-{tag}.test',
+            is_approved=True,
+        )
+        # Buildings of 8 rooms each, every student sees the whole campus on the dashboard
+        building = None
+        for number in range(space_count):
+            space = Space(
+                name=f'Space {number}',
+                location='Load test campus',
+                space_type=Space.SPACE_TYPES[number % len(Space.SPACE_TYPES)][0],
+                associated_university=university,
+                parent=None if number % 9 == 0 else building,
+            )
+            space.save()
+            if number % 9 == 0:
+                building = space
+
+        password = uuid.uuid4().hex
+        accounts = [(f'student{number}{university.email_domain}', password) for number in range(user_count)]
+        provision_accounts(accounts)
+        self.stdout.write(f'Created {university.name}: {space_count} spaces, {user_count} students')
+        return university, accounts
+
+    def start_server(self, url, verbosity):
+        address = urlsplit(url)
+        if address.hostname not in ('127.0.0.1', 'localhost'):
+            raise CommandError('--serve only starts a server on 127.0.0.1 or localhost')
+        server = subprocess.Popen(
+            [sys.executable, str(settings.BASE_DIR / 'manage.py'), 'runserver', '--noreload',
+             f'{address.hostname}:{address.port or 80}'],
+            # The access log of every request would drown the report
+            stdout=None if verbosity > 1 else subprocess.DEVNULL,
+            stderr=None if verbosity > 1 else subprocess.DEVNULL,
+        )
+        # Wait until it answers
+        for _ in range(100):
+            try:
+                httpx.get(url, timeout=1)
+                return server
+            except httpx.TransportError:
+                if server.poll() is not None:
+                    raise CommandError('The server exited during startup')
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f'The server did not answer on {url}')
+
+    def report(self, summary):
+        self.stdout.write(f"Signed in {summary['signed_in']} of {summary['students']} students")
+        for phase in ('signin', 'traffic'):
+            self.stdout.write('')
+            self.report_phase(phase, summary[phase])
+
+    def report_phase(self, phase, summary):
+        self.stdout.write(
+            f"{phase}: {summary['requests']} requests in {summary['elapsed']:.1f} s, "
+            f"{summary['per_second']:.1f} req/s, {summary['error_rate']:.2%} errors"
+        )
+        self.stdout.write(f"{'action':<12} {'requests':>9} {'req/s':>8} {'p50 ms':>8} "
+                          f"{'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'errors':>7}")
+        for action, stats in summary['actions'].items():
+            self.stdout.write(
+                f"{action:<12} {stats['requests']:>9} {stats['per_second']:>8.1f} {stats['p50_ms']:>8.1f} "
+                f"{stats['p90_ms']:>8.1f} {stats['p99_ms']:>8.1f} {stats['max_ms']:>8.1f} "
+                f"{stats['error_rate']:>7.2%}"
+            )
+            for error, count in stats['errors'].items():
+                self.stdout.write(f'  {error}: {count}')
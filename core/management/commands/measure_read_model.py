@@ -0,0 +1,85 @@
+import gc
+import tracemalloc
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from universities.models import Space
+from universities.readmodel import COLUMNS, CampusModel, SpaceNode
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the memory a campus takes in a worker, per 10k spaces: as model instances "
+        "(like the former dashboard query), as value dicts and as read-model nodes (no database needed)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--spaces', type=int, default=10_000)
+        parser.add_argument('--fanout', type=int, default=8, help='Children per composite space')
+
+    def handle(self, spaces, fanout, **options):
+        representations = [
+            ('Space instances', lambda rows: [
+                Space.from_db('default', COLUMNS, [row[field] for field in COLUMNS]) for row in rows
+            ]),
+            ('value dicts', lambda rows: list(rows)),
+            ('SpaceNode', lambda rows: [SpaceNode(row) for row in rows]),
+            ('read model (nodes and index)', self.build_campus),
+        ]
+
+        self.stdout.write(f'{spaces} spaces, half of them located')
+        for label, build in representations:
+            size = self.measure(build, self.iter_rows(spaces, fanout))
+            self.stdout.write(
+                f'{label:>30}: {size / spaces:7.0f} bytes per space, {size / spaces * 10_000 / 2**20:6.2f} MiB per 10k'
+            )
+
+    @staticmethod
+    def measure(build, rows):
+        # What the structure keeps alive once the rows it was built from are gone, values included
+        gc.collect()
+        tracemalloc.start()
+        try:
+            before = tracemalloc.get_traced_memory()[0]
+            kept = build(rows)
+            gc.collect()
+            size = tracemalloc.get_traced_memory()[0] - before
+        finally:
+            tracemalloc.stop()
+        del kept
+        return size
+
+    @staticmethod
+    def build_campus(rows):
+        campus = CampusModel(university_id=0)
+        for row in rows:
+            campus.apply(row)
+        campus.spaces()
+        return campus
+
+    @staticmethod
+    def iter_rows(size, fanout):
+        # Breadth-first ids: the parent of space i is (i - 1) // fanout. Every value is a
+        # fresh object, as when read from a database cursor; half of the spaces are located.
+        now = timezone.now()
+        space_types = [space_type for space_type, _ in Space.SPACE_TYPES]
+        for i in range(size):
+            space_type = space_types[i % len(space_types)]
+            located = i % 2 == 0
+            yield {
+                'id': i + 1,
+                'parent_id': (i - 1) // fanout + 1 if i else None,
+                'name': f'Space {i}',
+                'location': f'Building {i % 20}',
+                'space_type': space_type.encode().decode(),
+                'current_occupancy': i % 5 + 1 if i % 3 else None,
+                'aggregate_occupancy': float(i % 5 + 1),
+                'last_updated': now - timedelta(minutes=i % 300),
+                'latitude': 45.5 + i * 1e-6 if located else None,
+                'longitude': 13.7 + i * 1e-6 if located else None,
+                'floor': i % 4 if located else None,
+                'has_wifi': i % 2 == 0 if space_type == Space.SPACE_TYPE_STUDYING else None,
+                'has_plugs': i % 4 == 0 if space_type == Space.SPACE_TYPE_STUDYING else None,
+            }
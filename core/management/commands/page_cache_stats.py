@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from core.pagecache import get_counters, reset_counters
+
+
+class Command(BaseCommand):
+    help = "Show how many anonymous page views were served from the page cache (core.pagecache)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Start counting from zero afterwards')
+
+    def handle(self, reset, **options):
+        counters = get_counters()
+        total = counters['hit'] + counters['miss']
+        ratio = counters['hit'] / total if total else 0
+        self.stdout.write(f"{counters['hit']} hits, {counters['miss']} misses, {ratio:.1%} served from cache")
+        if reset:
+            reset_counters()
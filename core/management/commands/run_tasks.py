@@ -0,0 +1,53 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core.tasks import (
+    claim_next_task, purge_finished_tasks, requeue_stale_tasks, run_task, schedule_periodic_tasks,
+)
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks (TASKS_BACKEND = 'database')."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument(
+            '--keep-done-hours', type=int, default=24,
+            help='Delete finished tasks older than this many hours',
+        )
+
+    def handle(self, once, sleep, keep_done_hours, **options):
+        keep_done = timedelta(hours=keep_done_hours)
+        requeue_stale_tasks()
+
+        try:
+            while True:
+                # Checked on every round, so a busy queue does not starve periodic tasks
+                schedule_periodic_tasks()
+                processed = self.drain()
+                if once:
+                    break
+
+                if not processed:
+                    # Idle: housekeeping, then wait for new work
+                    requeue_stale_tasks()
+                    purge_finished_tasks(keep_done)
+                    close_old_connections()
+                    time.sleep(sleep)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping task worker')
+
+    def drain(self):
+        processed = 0
+        while True:
+            task_obj = claim_next_task()
+            if task_obj is None:
+                return processed
+
+            status = run_task(task_obj)
+            processed += 1
+            self.stdout.write(f'{task_obj.name} #{task_obj.pk}: {status}')
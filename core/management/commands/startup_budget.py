@@ -0,0 +1,102 @@
+import re
+import subprocess
+import sys
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+# What a fresh process of each entry point runs before it can serve; timed in a child interpreter
+ENTRY_POINTS = {
+    'manage': 'import django; django.setup(); from django.core.management import get_commands; get_commands()',
+    'wsgi': 'import config.wsgi',
+    'asgi': 'import config.asgi',
+    # The first request additionally imports the URL conf and with it every view
+    'first-request': 'import config.wsgi; from django.urls import get_resolver; get_resolver().url_patterns',
+}
+
+CHILD = (
+    'import time; start = time.perf_counter()\n'
+    '{code}\n'
+    'print(time.perf_counter() - start)'
+)
+
+# -X importtime lines: "import time: <self us> | <cumulative us> | <indent><module>"
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def package_of(module):
+    # django.contrib.* apps are reported on their own, everything else by top-level package
+    parts = module.split('.')
+    return '.'.join(parts[:3]) if parts[:2] == ['django', 'contrib'] else parts[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cold start of manage.py, the WSGI and ASGI entry points and the first request "
+        "in fresh interpreters (under -X importtime), with the import time per package and the "
+        "slowest project modules."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'entry_points', nargs='*', metavar='entry_point',
+            help=f"Entry points to measure: {', '.join(ENTRY_POINTS)} (default: all)",
+        )
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per entry point, the fastest is reported')
+        parser.add_argument('--top', type=int, default=10, help='Packages and modules listed per entry point')
+        parser.add_argument('--budget', type=float, help='Fail when an entry point takes longer (ms)')
+
+    def handle(self, entry_points, repeat, top, budget, **options):
+        unknown = [name for name in entry_points if name not in ENTRY_POINTS]
+        if unknown:
+            raise CommandError(f"Unknown entry points: {', '.join(unknown)} (choose from {', '.join(ENTRY_POINTS)})")
+
+        over_budget = []
+        for name in entry_points or ENTRY_POINTS:
+            elapsed, imports = min(self.measure(ENTRY_POINTS[name]) for _ in range(repeat))
+            self.report(name, elapsed, imports, top)
+            if budget is not None and elapsed * 1000 > budget:
+                over_budget.append(f'{name} ({elapsed * 1000:.0f} ms)')
+
+        if over_budget:
+            raise CommandError(f"Over the {budget:.0f} ms budget: {', '.join(over_budget)}")
+
+    def measure(self, code):
+        # Bytecode caches are written by the first run, later runs time a warm disk like a deployed worker
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', CHILD.format(code=code)],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode:
+            raise CommandError(result.stderr.strip().splitlines()[-1])
+
+        imports = []
+        for line in result.stderr.splitlines():
+            match = IMPORT_LINE.match(line)
+            if match:
+                imports.append((match.group(4), int(match.group(1)), int(match.group(2))))
+        return float(result.stdout.strip().splitlines()[-1]), imports
+
+    def report(self, name, elapsed, imports, top):
+        self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {elapsed * 1000:.0f} ms, {len(imports)} modules imported'))
+
+        packages = Counter()
+        for module, self_us, _ in imports:
+            packages[package_of(module)] += self_us
+        self.stdout.write('  slowest packages (own import time):')
+        for package, self_us in packages.most_common(top):
+            self.stdout.write(f'    {self_us / 1000:7.1f} ms  {package}')
+
+        # Cumulative time of the project's own modules shows what each of them drags in
+        project_apps = {'config', 'core', 'users', 'universities'}
+        project = sorted(
+            ((cumulative, module) for module, _, cumulative in imports if package_of(module) in project_apps),
+            reverse=True,
+        )
+        self.stdout.write('  slowest project modules (including what they import):')
+        for cumulative, module in project[:top]:
+            self.stdout.write(f'    {cumulative / 1000:7.1f} ms  {module}')
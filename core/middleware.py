@@ -0,0 +1,192 @@
+import gzip
+import secrets
+import struct
+import zlib
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.views.decorators.csrf import csrf_exempt
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - zstandard is optional, gzip always works
+    zstandard = None
+
+
+COMPRESSIBLE_TYPES = (
+    'text/',
+    'application/json',
+    'application/javascript',
+    'application/xml',
+    'image/svg+xml',
+)
+
+
+def get_accepted_encodings(request):
+    # 'gzip, deflate, zstd;q=0.9' -> {'gzip', 'deflate', 'zstd'}; q=0 means "never"
+    accepted = set()
+    for item in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+def choose_encoding(request):
+    accepted = get_accepted_encodings(request)
+    if zstandard is not None and 'zstd' in accepted:
+        return 'zstd'
+    if 'gzip' in accepted:
+        return 'gzip'
+    return None
+
+
+def get_compressor(encoding, level=None):
+    if encoding == 'zstd':
+        level = level or getattr(settings, 'COMPRESSION_ZSTD_LEVEL', 3)
+        return zstandard.ZstdCompressor(level=level).compressobj()
+    level = level or getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6)
+    # wbits=31 writes a gzip header and trailer
+    return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+
+def compress_bytes(data, encoding, level=None):
+    compressor = get_compressor(encoding, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def pad(data, encoding):
+    """
+    Prefix compressed output with 0 to COMPRESSION_MAX_RANDOM_BYTES bytes of padding, as
+    Django's GZipMiddleware does: pages echo CSRF tokens, and a random length keeps
+    their compressed size from revealing them (BREACH).
+    """
+    length = secrets.randbelow(getattr(settings, 'COMPRESSION_MAX_RANDOM_BYTES', 100))
+    if encoding == 'zstd':
+        # A skippable frame, which decoders drop
+        return struct.pack('<II', 0x184D2A50, length) + bytes(length) + data
+    # A file name in the gzip header
+    header = bytearray(data[:10])
+    header[3] |= gzip.FNAME
+    return bytes(header) + b'a' * length + b'\0' + data[10:]
+
+
+def get_block_flush(encoding):
+    return zstandard.COMPRESSOBJ_FLUSH_BLOCK if encoding == 'zstd' else zlib.Z_SYNC_FLUSH
+
+
+def compress_stream(chunks, encoding):
+    # Every chunk is flushed, so clients receive streamed content as it is produced
+    compressor = get_compressor(encoding)
+    block_flush = get_block_flush(encoding)
+    padded = False
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(block_flush)
+        if not padded:
+            data, padded = pad(data, encoding), True
+        yield data
+    data = compressor.flush()
+    yield data if padded else pad(data, encoding)
+
+
+async def compress_async_stream(chunks, encoding):
+    compressor = get_compressor(encoding)
+    block_flush = get_block_flush(encoding)
+    padded = False
+    async for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(block_flush)
+        if not padded:
+            data, padded = pad(data, encoding), True
+        yield data
+    data = compressor.flush()
+    yield data if padded else pad(data, encoding)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress responses with zstd or gzip, whichever the client prefers.
+
+    Regular responses smaller than COMPRESSION_MIN_SIZE are sent as they are;
+    streaming responses are compressed chunk by chunk. Every compressed body
+    gets random-length padding, see pad().
+    """
+
+    def process_response(self, request, response):
+        if response.has_header('Content-Encoding') or response.status_code in (204, 304):
+            return response
+
+        content_type = response.get('Content-Type', '')
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = choose_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if response.is_async:
+                response.streaming_content = compress_async_stream(response.streaming_content, encoding)
+            else:
+                response.streaming_content = compress_stream(response.streaming_content, encoding)
+            response.headers.pop('Content-Length', None)
+        else:
+            if len(response.content) < getattr(settings, 'COMPRESSION_MIN_SIZE', 512):
+                return response
+
+            compressed = pad(compress_bytes(response.content, encoding), encoding)
+            if len(compressed) >= len(response.content):
+                return response
+
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        # The body changed, so a strong ETag no longer matches it byte for byte
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+def machine_endpoint(view_func):
+    """Mark a view called by devices rather than browsers: no CSRF check, served by MachineEndpointMiddleware."""
+    view_func = csrf_exempt(view_func)
+    view_func.machine_endpoint = True
+    return view_func
+
+
+class MachineEndpointMiddleware:
+    """
+    Call @machine_endpoint views under settings.MACHINE_ENDPOINT_PREFIX directly.
+
+    Devices send no cookies and read no HTML, so sessions, the shard of the
+    signed-in user, CSRF, auth, messages and compression are all skipped.
+    Sits right after SecurityMiddleware; other paths are not even resolved here.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = getattr(settings, 'MACHINE_ENDPOINT_PREFIX', None)
+
+    def __call__(self, request):
+        if self.prefix and request.path_info.startswith(self.prefix):
+            try:
+                match = resolve(request.path_info)
+            except Resolver404:
+                match = None
+            if match is not None and getattr(match.func, 'machine_endpoint', False):
+                request.resolver_match = match
+                return match.func(request, *match.args, **match.kwargs)
+        return self.get_response(request)
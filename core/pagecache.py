@@ -0,0 +1,134 @@
+import logging
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+
+logger = logging.getLogger(__name__)
+
+# Rendered in place of the visitor's CSRF token and swapped back in on every response
+CSRF_PLACEHOLDER = 'page-cache-csrf-token-placeholder'
+
+VERSION_KEY = 'page-cache:version'
+OUTCOMES = ('hit', 'miss')
+
+
+def get_cache():
+    return caches[getattr(settings, 'PAGE_CACHE_ALIAS', 'default')]
+
+
+def count(outcome):
+    # Shared by all workers when the cache is; the counters never expire
+    key = f'page-cache:{outcome}'
+    try:
+        try:
+            get_cache().incr(key)
+        except ValueError:
+            get_cache().set(key, 1, None)
+    except Exception:
+        logger.debug('Page cache counter %s not updated', key, exc_info=True)
+
+
+def get_counters():
+    values = get_cache().get_many([f'page-cache:{outcome}' for outcome in OUTCOMES])
+    return {outcome: values.get(f'page-cache:{outcome}', 0) for outcome in OUTCOMES}
+
+
+def reset_counters():
+    get_cache().delete_many([f'page-cache:{outcome}' for outcome in OUTCOMES])
+
+
+def invalidate_public_pages():
+    """Drop every cached page; called when a University changes."""
+    # A new version makes all existing keys unreachable, they expire on their own
+    try:
+        get_cache().incr(VERSION_KEY)
+    except ValueError:
+        get_cache().set(VERSION_KEY, 1, None)
+
+
+def is_anonymous_visitor(request):
+    # Decided from the cookies alone: a visitor without a session cannot be signed in,
+    # and pending messages (cookie storage) are for this visitor only
+    return (
+        request.method in ('GET', 'HEAD')
+        and not request.GET
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+        and 'messages' not in request.COOKIES
+    )
+
+
+def csrf_placeholder(request):
+    """Context processor: cacheable pages are rendered with a placeholder instead of the CSRF token."""
+    return {'csrf_token': CSRF_PLACEHOLDER} if getattr(request, '_page_cache_render', False) else {}
+
+
+def finish(request, response, content, max_age):
+    if CSRF_PLACEHOLDER.encode() in content:
+        # The token is the visitor's own, so the page may only be kept by their browser
+        response.content = content.replace(CSRF_PLACEHOLDER.encode(), get_token(request).encode())
+        patch_cache_control(response, private=True, max_age=0)
+    else:
+        response.content = content
+        if max_age:
+            patch_cache_control(response, public=True, max_age=max_age)
+    patch_vary_headers(response, ('Cookie',))
+    return response
+
+
+def cache_public_page(view_func):
+    """
+    Serve the response a view gives anonymous visitors from the cache (settings.PAGE_CACHE_TIMEOUT).
+
+    Visitors with a session or a query string always get the view itself. CSRF
+    tokens are rendered as a placeholder and filled in per visitor, so pages with
+    forms can be cached as well. Hits and misses are counted (see
+    `manage.py page_cache_stats`) and reported in the X-Cache header.
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if not is_anonymous_visitor(request):
+            response = view_func(request, *args, **kwargs)
+            # The same URL can serve both kinds of visitors
+            patch_vary_headers(response, ('Cookie',))
+            if not response.has_header('Cache-Control'):
+                patch_cache_control(response, private=True)
+            return response
+
+        timeout = getattr(settings, 'PAGE_CACHE_TIMEOUT', 60)
+        cache = get_cache()
+        try:
+            version = cache.get_or_set(VERSION_KEY, 0, None)
+            key = f'page-cache:{version}:{request.path}'
+            cached = cache.get(key)
+        except Exception:
+            logger.warning('Page cache unavailable', exc_info=True)
+            return view_func(request, *args, **kwargs)
+
+        if cached is not None:
+            count('hit')
+            content_type, content = cached
+            response = HttpResponse(content_type=content_type)
+            response['X-Cache'] = 'HIT'
+            return finish(request, response, content, timeout)
+
+        count('miss')
+        request._page_cache_render = True
+        response = view_func(request, *args, **kwargs)
+        if hasattr(response, 'render') and callable(response.render):
+            response.render()
+
+        response['X-Cache'] = 'MISS'
+        if response.streaming:
+            return response
+        if response.status_code == 200 and not response.cookies:
+            cache.set(key, (response['Content-Type'], response.content), timeout)
+            return finish(request, response, response.content, timeout)
+        # Not cacheable after all (an error, a redirect, a cookie), still gets its token
+        return finish(request, response, response.content, None)
+
+    return wrapper
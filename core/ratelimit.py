@@ -0,0 +1,149 @@
+import logging
+import math
+import threading
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import caches
+from django.http import HttpResponse
+
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+def parse_rate(rate):
+    # '30/m' -> 0.5 tokens per second
+    count, period = rate.split('/')
+    return int(count) / PERIODS[period[0].lower()]
+
+
+class LocalBucketStore:
+    """Per-process buckets, used when no shared cache is configured or it is unreachable."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, keys, rate, burst):
+        now = time.monotonic()
+        with self._lock:
+            tokens = {key: refill(*self._buckets.get(key, (burst, now)), now, rate, burst) for key in keys}
+            allowed, retry_after = check(tokens.values(), rate)
+            if allowed:
+                for key, count in tokens.items():
+                    self._buckets[key] = (count - 1, now)
+
+            # Full buckets carry no information, keep the dict bounded
+            if len(self._buckets) > 100_000:
+                self._buckets = {k: v for k, v in self._buckets.items() if v[0] < burst}
+        return allowed, retry_after
+
+
+class CacheBucketStore:
+    """
+    Buckets shared by all workers through a Django cache.
+
+    Read-modify-write is not atomic across workers, so a burst of parallel
+    requests can overdraw a bucket slightly; that is acceptable for throttling.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def take(self, keys, rate, burst):
+        cache = caches[self.alias]
+        now = time.time()
+        stored = cache.get_many(keys)
+        tokens = {key: refill(*stored.get(key, (burst, now)), now, rate, burst) for key in keys}
+        allowed, retry_after = check(tokens.values(), rate)
+        if allowed:
+            # Once the bucket would be full again the entry can expire
+            timeout = math.ceil(burst / rate) + 1
+            cache.set_many({key: (count - 1, now) for key, count in tokens.items()}, timeout=timeout)
+        return allowed, retry_after
+
+
+def refill(tokens, updated, now, rate, burst):
+    return min(burst, tokens + max(0.0, now - updated) * rate)
+
+
+def check(tokens, rate):
+    # All buckets or none: a rejected request must not spend the tokens of the buckets that had one
+    missing = [1 - count for count in tokens if count < 1]
+    if missing:
+        return False, max(missing) / rate
+    return True, 0
+
+
+_local_store = LocalBucketStore()
+
+
+def take_tokens(keys, rate, burst):
+    """Take one token from each bucket in `keys` if every one of them has it; (allowed, retry after)."""
+    alias = getattr(settings, 'RATELIMIT_CACHE_ALIAS', None)
+    if alias:
+        try:
+            return CacheBucketStore(alias).take(keys, rate, burst)
+        except Exception:
+            logger.warning('Rate limit cache %r unavailable, using in-memory buckets', alias, exc_info=True)
+    return _local_store.take(keys, rate, burst)
+
+
+def get_client_ip(request):
+    if getattr(settings, 'RATELIMIT_TRUST_X_FORWARDED_FOR', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def get_identities(request, keys):
+    identities = []
+    for key in keys:
+        if key == 'ip':
+            identities.append(f'ip:{get_client_ip(request)}')
+        elif key == 'user':
+            # Read the id from the session instead of request.user, so no User query is made
+            user_id = request.session.get(SESSION_KEY) if hasattr(request, 'session') else None
+            if user_id is not None:
+                identities.append(f'user:{user_id}')
+        else:
+            raise ValueError(f'Unknown rate limit key: {key}')
+    return identities
+
+
+def too_many_requests(retry_after):
+    # Deliberately plain: no template, no session write, no database access
+    response = HttpResponse('Too many requests, please slow down.', status=429, content_type='text/plain')
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def ratelimit(scope, condition=None):
+    """
+    Throttle a view with the token buckets configured in settings.RATELIMITS[scope].
+
+    `condition(request)` limits throttling to matching requests, e.g. only POSTs.
+    Every configured key (user, ip) has its own bucket; a request needs a token from each,
+    and a rejected request spends none.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            config = getattr(settings, 'RATELIMITS', {}).get(scope)
+            if config and (condition is None or condition(request)):
+                rate = parse_rate(config['rate'])
+                burst = config.get('burst', 1)
+                keys = [f'rl:{scope}:{identity}' for identity in get_identities(request, config.get('keys', ['ip']))]
+                allowed, retry_after = take_tokens(keys, rate, burst)
+                if not allowed:
+                    return too_many_requests(retry_after)
+            return view_func(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,59 @@
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import ImproperlyConfigured
+
+from .middleware import compress_bytes, zstandard
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Fingerprinted static files with precompressed .gz and .zst siblings.
+
+    Everything happens at collectstatic time, so serving an asset never
+    compresses it again (see core.views.static_asset).
+    """
+
+    compressible_extensions = ('.css', '.js', '.svg', '.map', '.txt', '.json', '.html')
+
+    def stored_name(self, name):
+        # Only reached with DEBUG off; without a manifest every {% static %} would fail on its own
+        if not self.hashed_files and not self.exists(self.manifest_name):
+            raise ImproperlyConfigured(
+                f'No static files manifest in {self.location}: run `manage.py collectstatic` '
+                f'before serving with DEBUG off (production and benchmark profiles)'
+            )
+        return super().stored_name(name)
+
+    def post_process(self, paths, dry_run=False, **options):
+        hashed_names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                hashed_names.add(hashed_name)
+            yield name, hashed_name, processed
+
+        if dry_run:
+            return
+
+        for hashed_name in hashed_names:
+            if hashed_name.endswith(self.compressible_extensions):
+                self.write_compressed_variants(hashed_name)
+
+    def write_compressed_variants(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as source:
+            content = source.read()
+
+        # Compressed once per deploy, so the slowest, smallest levels are affordable
+        variants = [('gzip', '.gz', 9)]
+        if zstandard is not None:
+            variants.append(('zstd', '.zst', 19))
+
+        for encoding, suffix, level in variants:
+            compressed = compress_bytes(content, encoding, level)
+            # Tiny files do not get smaller, serving the original is cheaper then
+            if len(compressed) < len(content):
+                with open(path + suffix, 'wb') as target:
+                    target.write(compressed)
+            elif os.path.exists(path + suffix):
+                os.remove(path + suffix)
@@ -0,0 +1,199 @@
+import logging
+import random
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Task
+
+
+logger = logging.getLogger(__name__)
+
+BACKEND_DATABASE = 'database'
+BACKEND_THREAD = 'thread'
+BACKEND_IMMEDIATE = 'immediate'
+
+# task name -> handler, filled as task modules are imported (see get_handler)
+_registry = {}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def task(name=None, max_attempts=5):
+    """
+    Register a function as a background task.
+
+    The decorated function keeps working as a plain function and gains an
+    `enqueue(**payload)` helper. Payloads are stored as JSON, so pass ids, not model instances.
+    Workers import the handler from its name, the function's dotted path by default; a
+    custom `name` only resolves in processes that already imported the module.
+    """
+    def decorator(func):
+        func.task_name = name or f'{func.__module__}.{func.__name__}'
+        func.max_attempts = max_attempts
+        func.enqueue = lambda **payload: enqueue(func.task_name, **payload)
+        _registry[func.task_name] = func
+        return func
+
+    return decorator
+
+
+def get_handler(name):
+    handler = _registry.get(name)
+    if handler is None:
+        # Importing the module registers the task, so processes only load the tasks they run
+        try:
+            handler = import_string(name)
+        except ImportError:
+            handler = None
+        if getattr(handler, 'task_name', None) != name:
+            raise LookupError(f'No task registered as {name!r}')
+    return handler
+
+
+def get_backend():
+    return getattr(settings, 'TASKS_BACKEND', BACKEND_DATABASE)
+
+
+def enqueue(name, **payload):
+    handler = get_handler(name)
+    backend = get_backend()
+
+    if backend == BACKEND_DATABASE:
+        # Written in the caller's transaction, so the task only exists if the caller commits
+        return Task.objects.create(name=name, payload=payload, max_attempts=handler.max_attempts)
+
+    if backend == BACKEND_THREAD:
+        transaction.on_commit(lambda: _submit(name, payload, attempt=1))
+        return None
+
+    if backend == BACKEND_IMMEDIATE:
+        handler(**payload)
+        return None
+
+    raise ValueError(f'Unknown TASKS_BACKEND: {backend}')
+
+
+def get_retry_delay(attempt):
+    base = getattr(settings, 'TASKS_RETRY_BASE_DELAY', 5)
+    cap = getattr(settings, 'TASKS_RETRY_MAX_DELAY', 15 * 60)
+    delay = min(cap, base * 2 ** (attempt - 1))
+    # Jitter keeps a burst of failures from retrying in lockstep
+    return delay * random.uniform(0.9, 1.1)
+
+
+# IN-PROCESS THREAD POOL
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'TASKS_THREAD_WORKERS', 4),
+                thread_name_prefix='task',
+            )
+    return _executor
+
+
+def _submit(name, payload, attempt):
+    get_executor().submit(_run_in_thread, name, payload, attempt)
+
+
+def _run_in_thread(name, payload, attempt):
+    handler = get_handler(name)
+    try:
+        handler(**payload)
+    except Exception:
+        if attempt >= handler.max_attempts:
+            logger.exception('Task %s failed permanently after %s attempts', name, attempt)
+            return
+
+        delay = get_retry_delay(attempt)
+        logger.warning('Task %s failed (attempt %s), retrying in %.0fs', name, attempt, delay, exc_info=True)
+        timer = threading.Timer(delay, _submit, args=(name, payload, attempt + 1))
+        timer.daemon = True
+        timer.start()
+    finally:
+        close_old_connections()
+
+
+# DATABASE QUEUE (consumed by `manage.py run_tasks`)
+
+def requeue_stale_tasks():
+    # Tasks whose worker died while running them
+    lock_timeout = getattr(settings, 'TASKS_LOCK_TIMEOUT', 10 * 60)
+    return Task.objects.filter(
+        status=Task.STATUS_RUNNING,
+        locked_at__lt=timezone.now() - timedelta(seconds=lock_timeout),
+    ).update(status=Task.STATUS_QUEUED, locked_at=None)
+
+
+def claim_next_task():
+    with transaction.atomic():
+        task_obj = (
+            Task.objects.select_for_update(skip_locked=True)
+            .filter(status=Task.STATUS_QUEUED, run_at__lte=timezone.now())
+            .order_by('run_at')
+            .first()
+        )
+        if task_obj is None:
+            return None
+
+        task_obj.status = Task.STATUS_RUNNING
+        task_obj.locked_at = timezone.now()
+        task_obj.attempts += 1
+        task_obj.save(update_fields=['status', 'locked_at', 'attempts'])
+        return task_obj
+
+
+def run_task(task_obj):
+    try:
+        get_handler(task_obj.name)(**task_obj.payload)
+    except Exception:
+        task_obj.last_error = traceback.format_exc()
+        if task_obj.attempts >= task_obj.max_attempts:
+            task_obj.status = Task.STATUS_FAILED
+            task_obj.finished_at = timezone.now()
+            logger.error('Task %s failed permanently: %s', task_obj, task_obj.last_error)
+        else:
+            task_obj.status = Task.STATUS_QUEUED
+            task_obj.run_at = timezone.now() + timedelta(seconds=get_retry_delay(task_obj.attempts))
+    else:
+        task_obj.status = Task.STATUS_DONE
+        task_obj.finished_at = timezone.now()
+        task_obj.last_error = ''
+
+    task_obj.locked_at = None
+    task_obj.save(update_fields=['status', 'run_at', 'locked_at', 'finished_at', 'last_error'])
+    return task_obj.status
+
+
+def schedule_periodic_tasks():
+    """Queue every TASKS_PERIODIC task that was not queued within its interval."""
+    now = timezone.now()
+    scheduled = 0
+    for name, interval in getattr(settings, 'TASKS_PERIODIC', {}).items():
+        recent = Task.objects.filter(name=name).filter(
+            Q(status__in=[Task.STATUS_QUEUED, Task.STATUS_RUNNING])
+            | Q(created_at__gte=now - timedelta(seconds=interval))
+        )
+        # Two workers may both miss the other's row and queue it twice; periodic tasks must tolerate that
+        if not recent.exists():
+            Task.objects.create(name=name, max_attempts=get_handler(name).max_attempts)
+            scheduled += 1
+    return scheduled
+
+
+def purge_finished_tasks(older_than):
+    return Task.objects.filter(
+        status=Task.STATUS_DONE,
+        finished_at__lt=timezone.now() - older_than,
+    ).delete()[0]
@@ -0,0 +1,141 @@
+from django import template
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.html import conditional_escape, format_html
+from django.utils.safestring import mark_safe
+from django.utils.timesince import timesince
+
+from universities.tree import build_tree, aggregate_occupancies
+
+
+register = template.Library()
+
+# Reversed once per render; the placeholder id is swapped for each space
+DELETE_URL_PLACEHOLDER = 0
+
+CARD_OPEN = '<div class="space-card">'
+ROOT_NODE_OPEN = '<div class="space-node">'
+CHILD_NODE_OPEN = '<div class="space-node space-node-child">'
+
+NODE_HEADER = (
+    '<div class="space-node-header"><div>'
+    '<h4 class="{title_class}">{name}{delete_form}</h4>'
+    '{location}</div><div class="status-badge">{badge}</div></div>'
+)
+DELETE_FORM = (
+    '<form action="{delete_url}" method="post" class="delete-form" '
+    'onsubmit="return confirm(\'Delete this space and all its sub-sections?\');">{csrf}'
+    '<button type="submit" class="btn-delete">[Delete]</button></form>'
+)
+LOCATION = '<p class="space-location">Location: {}</p>'
+
+BADGE_FREE = '<span class="badge badge-free">● FREE</span>'
+BADGE_BUSY = '<span class="badge badge-busy">● BUSY</span>'
+BADGE_FULL = '<span class="badge badge-full">● FULL</span>'
+BADGE_NO_DATA = '<span class="badge badge-none">No Data</span>'
+
+OCCUPANCY_BUTTONS = (
+    '<div class="occupancy-buttons"><form method="post">'
+    '{csrf}<input type="hidden" name="space_id" value="{space_id}">'
+    '<input type="hidden" name="update_occupancy" value="1">'
+    '<button type="submit" name="current_occupancy" value="1" class="btn-occupancy btn-free">Free</button>'
+    '<button type="submit" name="current_occupancy" value="3" class="btn-occupancy btn-busy">Busy</button>'
+    '<button type="submit" name="current_occupancy" value="5" class="btn-occupancy btn-full">Full</button>'
+    '</form></div>'
+)
+VERIFIED = '<p class="verified"><small>Verified {verified}</small></p>'
+CHILDREN_OPEN = '<div class="nested-children">'
+CLOSE = '</div>'
+
+
+def get_badge(occupancy):
+    if occupancy is None:
+        return BADGE_NO_DATA
+    if occupancy <= 2:
+        return BADGE_FREE
+    if occupancy <= 4:
+        return BADGE_BUSY
+    return BADGE_FULL
+
+
+def get_verified_label(last_updated, now, labels):
+    if last_updated is None:
+        return 'long ago'
+
+    # Below four weeks the label only depends on the elapsed minutes,
+    # so it is computed once per distinct age instead of once per space
+    minutes = int((now - last_updated).total_seconds() // 60)
+    if minutes >= 28 * 24 * 60:
+        return f'{timesince(last_updated, now)} ago'
+    if minutes not in labels:
+        labels[minutes] = f'{timesince(last_updated, now)} ago'
+    return labels[minutes]
+
+
+def get_csrf_input(context):
+    token = context.get('csrf_token')
+    if not token:
+        return ''
+    return format_html('<input type="hidden" name="csrfmiddlewaretoken" value="{}">', token)
+
+
+@register.simple_tag(takes_context=True)
+def render_space_tree(context, spaces, as_of=None):
+    """
+    Render every space card of the dashboard in one pass.
+
+    With `as_of` (a past time, see universities.history) the tree is shown
+    read-only, without the delete and report forms, and ages are counted from then.
+
+    `spaces` is the complete, already loaded list of a university's spaces
+    (Space instances or universities.readmodel nodes);
+    the tree is walked with an explicit stack, so the cost is linear in the
+    number of spaces and no query is made while rendering.
+    """
+    roots, children = build_tree(spaces)
+    occupancies = aggregate_occupancies(roots, children)
+
+    csrf = get_csrf_input(context)
+    delete_url = reverse('delete_space', args=[DELETE_URL_PLACEHOLDER])
+    delete_prefix, delete_suffix = delete_url.rsplit(str(DELETE_URL_PLACEHOLDER), 1)
+
+    now = as_of or timezone.now()
+    verified_labels = {}
+
+    parts = []
+    # Items are spaces to open, or closing markup pushed when a space was opened
+    stack = [(root, True) for root in reversed(roots)]
+    while stack:
+        space, is_root = stack.pop()
+        if isinstance(space, str):
+            parts.append(space)
+            continue
+
+        kids = children.get(space.id)
+        if is_root:
+            parts.append(CARD_OPEN)
+        parts.append(ROOT_NODE_OPEN if is_root else CHILD_NODE_OPEN)
+        parts.append(NODE_HEADER.format(
+            title_class='space-title space-title-root' if is_root else 'space-title',
+            name=conditional_escape(space.name),
+            delete_form='' if as_of else DELETE_FORM.format(
+                delete_url=f'{delete_prefix}{space.id}{delete_suffix}',
+                csrf=csrf,
+            ),
+            location=LOCATION.format(conditional_escape(space.location)) if is_root else '',
+            badge=get_badge(occupancies[space.id]),
+        ))
+
+        if not kids:
+            verified = get_verified_label(space.last_updated, now, verified_labels)
+            if not as_of:
+                parts.append(OCCUPANCY_BUTTONS.format(csrf=csrf, space_id=space.id))
+            parts.append(VERIFIED.format(verified=verified))
+            parts.append(CLOSE + CLOSE if is_root else CLOSE)
+        else:
+            parts.append(CHILDREN_OPEN)
+            # Closing markup first, so it is emitted after all children
+            stack.append((CLOSE + CLOSE + CLOSE if is_root else CLOSE + CLOSE, False))
+            stack.extend((kid, False) for kid in reversed(kids))
+
+    return mark_safe(''.join(parts))
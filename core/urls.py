@@ -4,4 +4,6 @@ from . import views
 
 urlpatterns = [
     path('', views.homepage, name='homepage'),
+    # The dashboard as it was at a past time
+    path('history', views.dashboard_history, name='dashboard_history'),
 ]
@@ -1,11 +1,35 @@
-from django.shortcuts import render, redirect, get_object_or_404
-from django.utils import timezone
-from universities.models import Space
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404
+from django.shortcuts import render, redirect
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
 from django.contrib.auth import logout
+from django.contrib.auth.decorators import login_required
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from universities.forms import SpaceCreationForm, OccupancyUpdateForm
+from universities.history import get_spaces_as_of
+from universities.models import OccupancySnapshot, Space
+from universities.readmodel import get_campus
+from universities.sync import report_occupancy
+from users.authorization import MANAGE, REPORT
 from users.views import handle_signout
+from core.ratelimit import ratelimit
+from core.pagecache import cache_public_page
+from core.middleware import get_accepted_encodings
 
 
+def is_occupancy_report(request):
+    return request.method == 'POST' and 'update_occupancy' in request.POST
+
+
+@cache_public_page
+@ratelimit('occupancy_report', condition=is_occupancy_report)
 @handle_signout
 def homepage(request):
     if not request.user.is_authenticated:
@@ -22,35 +46,36 @@ def homepage(request):
     if request.method == 'POST':
         # 1. HANDLE OCCUPANCY UPDATE
         if 'update_occupancy' in request.POST:
-            space_id = request.POST.get('space_id')
-            space = get_object_or_404(Space, id=space_id, associated_university=university)
-
-            # Using the form for validation
-            form = OccupancyUpdateForm(request.POST, instance=space)
+            # Using the form for validation only: the report is one conditional UPDATE
+            # of the occupancy columns, so it cannot clobber a concurrent edit of the space
+            form = OccupancyUpdateForm(request.POST)
             if form.is_valid():
-                updated_space = form.save(commit=False)
-                updated_space.last_updated_by = user
-                updated_space.last_updated = timezone.now()
-                updated_space.save()
+                reported = report_occupancy(
+                    university.id,
+                    form.cleaned_data['space_id'],
+                    form.cleaned_data['current_occupancy'],
+                    user.id,
+                    spaces=Space.objects.authorized(request, REPORT),
+                )
+                if not reported:
+                    raise Http404('No such space')
                 return redirect('homepage')
 
         # 2. HANDLE NEW SPACE CREATION
         elif 'create_space' in request.POST:
-            form = SpaceCreationForm(request.POST, university=university)
+            form = SpaceCreationForm(request.POST, parents=Space.objects.authorized(request, MANAGE))
             if form.is_valid():
                 new_space = form.save(commit=False)
                 new_space.associated_university = university
                 new_space.save()
                 return redirect('homepage')
 
-    # Retrieve data for the dashboard
-    university_spaces = Space.objects.filter(
-        associated_university=university,
-        parent=None
-    )
+    # The whole tree from the worker's read model, brought up to date with the university's
+    # change sequence, and rendered without queries by the render_space_tree tag
+    university_spaces = get_campus(university.id, consistent=True).spaces()
 
-    # Initialize the creation form, limited to the user's university
-    creation_form = SpaceCreationForm(university=university)
+    # Initialize the creation form, parents limited to the spaces the user may manage
+    creation_form = SpaceCreationForm(parents=Space.objects.authorized(request, MANAGE))
 
     context = {
         'associated_university': university,
@@ -59,3 +84,71 @@ def homepage(request):
         'creation_form': creation_form,
     }
     return render(request, 'core/dashboard.html', context)
+
+
+@login_required
+def dashboard_history(request):
+    # Example: /history?at=2026-10-18T14:30 (local time); the dashboard as recorded by then
+    university = request.user.associated_university
+    if university is None:
+        raise Http404('No university')
+
+    try:
+        at = parse_datetime(request.GET.get('at', ''))
+    except ValueError:
+        # Well formed but not a date, e.g. 2026-02-30T10:00
+        at = None
+    if at is not None and timezone.is_naive(at):
+        at = timezone.make_aware(at)
+
+    recorded_at, spaces = None, []
+    if at is not None:
+        records = OccupancySnapshot.objects.authorized(request).filter(university=university)
+        recorded_at, spaces = get_spaces_as_of(records, at)
+
+    return render(request, 'core/history.html', {
+        'associated_university': university,
+        'at': at,
+        'recorded_at': recorded_at,
+        'university_spaces': spaces,
+    })
+
+
+# Names produced by ManifestStaticFilesStorage, e.g. dashboard.3f2a9c1b7d4e.css
+HASHED_STATIC_NAME = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+PRECOMPRESSED_VARIANTS = (('zstd', '.zst'), ('gzip', '.gz'))
+
+
+def static_asset(request, path):
+    """
+    Serve collected static files when no web server sits in front (SERVE_STATIC).
+
+    Picks the precompressed variant written by collectstatic and marks
+    fingerprinted files as immutable, since their content never changes under that name.
+    """
+    try:
+        full_path = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404(path)
+    if not os.path.isfile(full_path):
+        raise Http404(path)
+
+    content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    accepted = get_accepted_encodings(request)
+
+    encoding = None
+    for candidate, suffix in PRECOMPRESSED_VARIANTS:
+        if candidate in accepted and os.path.isfile(full_path + suffix):
+            encoding, full_path = candidate, full_path + suffix
+            break
+
+    response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+
+    if HASHED_STATIC_NAME.search(path):
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'public, max-age=300'
+    return response
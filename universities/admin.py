@@ -1,3 +1,264 @@
-from django.contrib import admin
+from urllib.parse import urlsplit
 
-# Register your models here.
+from django import forms
+from django.conf import settings
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import HttpResponseRedirect, QueryDict
+
+from .models import University, Space, SpaceVersionConflict, StudyingAttributes, EatingAttributes, CoffeeAttributes
+from .sharding import shard_for_university, use_shard
+from users.authorization import MANAGE
+
+
+UNIVERSITY_FILTER = 'associated_university__id__exact'
+
+
+def get_university_id(request):
+    """
+    The university an admin request is about, taken from the changelist filter.
+
+    Change pages carry the filter along in `_changelist_filters`, and the parent
+    autocomplete only has it in the URL of the page it was opened from.
+    """
+    sources = [request.GET]
+    if 'field_name' in request.GET and request.headers.get('Referer'):
+        # An autocomplete request (AutocompleteJsonView)
+        sources.append(QueryDict(urlsplit(request.headers['Referer']).query))
+
+    for params in sources:
+        value = params.get(UNIVERSITY_FILTER) or QueryDict(params.get('_changelist_filters', '')).get(UNIVERSITY_FILTER)
+        if value and value.isdigit():
+            return int(value)
+    return None
+
+
+def get_default_university_id(request, object_id=None):
+    """The university to filter by when the request names none: the space's, the user's own, or the first."""
+    if object_id is not None and str(object_id).isdigit():
+        # Spaces keep their id across shards (SHARD_ID_BLOCK), so the first hit is the one
+        for alias in settings.DATABASES:
+            university_id = (
+                Space.objects.using(alias).filter(pk=object_id)
+                .values_list('associated_university_id', flat=True)
+                .first()
+            )
+            if university_id is not None:
+                return university_id
+    return (
+        getattr(request.user, 'associated_university_id', None)
+        or University.objects.order_by('name').values_list('pk', flat=True).first()
+    )
+
+
+def with_university_filter(request, university_id, param=None):
+    """Redirect to the same page with the university filter, inside `param` (`_changelist_filters`) if given."""
+    params = request.GET.copy()
+    if param is None:
+        params[UNIVERSITY_FILTER] = university_id
+    else:
+        filters = QueryDict(params.get(param, ''), mutable=True)
+        filters[UNIVERSITY_FILTER] = university_id
+        params[param] = filters.urlencode()
+    return HttpResponseRedirect(f'{request.path}?{params.urlencode()}')
+
+
+def attach_full_paths(spaces):
+    """Set `full_path` (like Space.get_full_name()) on every space, with one query per tree level above them."""
+    known = {space.pk: (space.parent_id, space.name) for space in spaces}
+    missing = {space.parent_id for space in spaces} - known.keys() - {None}
+    while missing:
+        rows = Space.objects.using(spaces[0]._state.db).filter(pk__in=missing).values_list('id', 'parent_id', 'name')
+        for pk, parent_id, name in rows:
+            known[pk] = (parent_id, name)
+        missing = {parent_id for parent_id, _ in known.values()} - known.keys() - {None}
+
+    for space in spaces:
+        names = []
+        pk = space.pk
+        while pk in known:
+            pk, name = known[pk]
+            names.append(name)
+        space.full_path = ' > '.join(reversed(names))
+
+
+class SpaceChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        if self.result_list:
+            attach_full_paths(self.result_list)
+
+
+class SpaceAdminForm(forms.ModelForm):
+    class Meta:
+        model = Space
+        fields = '__all__'
+        # The version the operator saw travels with the form, so saving over a newer write fails
+        widgets = {'version': forms.HiddenInput}
+
+    def clean(self):
+        cleaned_data = super().clean()
+        parent, university = cleaned_data.get('parent'), cleaned_data.get('associated_university')
+        if parent is not None and university is not None and parent.associated_university_id != university.pk:
+            raise forms.ValidationError({'parent': 'The parent must belong to the same university.'})
+
+        version = cleaned_data.get('version')
+        if self.instance.pk and version is not None:
+            current = Space.objects.using(self.instance._state.db).filter(pk=self.instance.pk).values_list(
+                'version', flat=True,
+            ).first()
+            if current is not None and current != version:
+                raise forms.ValidationError(
+                    'This space was changed (for example by an occupancy report) since you opened it. '
+                    'Reload the page to see the current values, then apply your changes again.'
+                )
+        return cleaned_data
+
+
+class AttributesInline(admin.StackedInline):
+    can_delete = False
+    max_num = 1
+    min_num = 1
+
+
+class StudyingAttributesInline(AttributesInline):
+    model = StudyingAttributes
+
+
+class EatingAttributesInline(AttributesInline):
+    model = EatingAttributes
+
+
+class CoffeeAttributesInline(AttributesInline):
+    model = CoffeeAttributes
+
+
+ATTRIBUTE_INLINES = {
+    Space.SPACE_TYPE_STUDYING: StudyingAttributesInline,
+    Space.SPACE_TYPE_EATING: EatingAttributesInline,
+    Space.SPACE_TYPE_COFFEE: CoffeeAttributesInline,
+}
+
+
+@admin.register(Space)
+class SpaceAdmin(admin.ModelAdmin):
+    """
+    Spaces of one university at a time, since every university lives on its own shard.
+
+    Pages without the university filter are redirected to one that has it: the
+    space's university, else the user's own, else the first by name. The parent
+    autocomplete only offers spaces of that university.
+
+    A page costs a fixed number of queries: the university comes in with a join,
+    child counts as a correlated subquery on the parent index and full paths with
+    one query per tree level (SpaceChangeList).
+    """
+    form = SpaceAdminForm
+    list_display = (
+        'full_path', 'space_type', 'associated_university', 'current_occupancy',
+        'aggregate_occupancy', 'child_count', 'last_updated',
+    )
+    list_filter = ('associated_university', 'space_type')
+    list_select_related = ('associated_university',)
+    search_fields = ('name', 'location')
+    autocomplete_fields = ('parent',)
+    readonly_fields = ('aggregate_occupancy', 'change_seq', 'last_updated', 'last_updated_by')
+    # Counting every space again for the "N total" link is skipped on large campuses
+    show_full_result_count = False
+    list_per_page = 50
+
+    def get_changelist(self, request, **kwargs):
+        return SpaceChangeList
+
+    def get_queryset(self, request):
+        child_count = (
+            Space.objects.filter(parent=OuterRef('pk'))
+            .order_by()
+            .values('parent')
+            .annotate(count=Count('pk'))
+            .values('count')
+        )
+        queryset = (
+            super().get_queryset(request)
+            # Staff of a university only see its spaces (users.authorization)
+            .authorized(request, MANAGE)
+            # Space.__str__ reads the university, e.g. for every autocomplete result
+            .select_related('associated_university')
+            .annotate(child_count=Coalesce(Subquery(child_count, output_field=IntegerField()), 0))
+        )
+
+        university_id = get_university_id(request)
+        if university_id is not None:
+            # Also keeps the parent autocomplete within the university
+            queryset = queryset.using(shard_for_university(university_id)).filter(
+                associated_university_id=university_id,
+            )
+        elif 'field_name' in request.GET:
+            # An autocomplete opened from a page without the filter would mix universities
+            queryset = queryset.none()
+        return queryset
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is not None:
+            # Moving a space to another university (and shard) would orphan its tree
+            return (*self.readonly_fields, 'associated_university')
+        return self.readonly_fields
+
+    def get_inlines(self, request, obj):
+        # Only the attributes of the space's type; new spaces get the defaults on save
+        inline = ATTRIBUTE_INLINES.get(obj.space_type) if obj is not None else None
+        return [inline] if inline else []
+
+    def save_formset(self, request, form, formset, change):
+        # After a change of type, the attributes of the old type were dropped by Space.save()
+        if formset.model is form.instance.get_attributes_model():
+            super().save_formset(request, form, formset, change)
+
+    @admin.display(description='Space', ordering='name')
+    def full_path(self, space):
+        return getattr(space, 'full_path', space.name)
+
+    @admin.display(description='Children', ordering='child_count')
+    def child_count(self, space):
+        return space.child_count
+
+    # Requests run against the shard of the filtered university, so inlines and saves land there too
+
+    def redirect_to_university(self, request, object_id=None, param=None):
+        # Only for GET: a redirect would drop a submitted form
+        if request.method != 'GET' or get_university_id(request) is not None:
+            return None
+        university_id = get_default_university_id(request, object_id)
+        return with_university_filter(request, university_id, param) if university_id else None
+
+    def changelist_view(self, request, extra_context=None):
+        redirect = self.redirect_to_university(request)
+        if redirect:
+            return redirect
+        with use_shard(shard_for_university(get_university_id(request))):
+            return super().changelist_view(request, extra_context)
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        redirect = self.redirect_to_university(request, object_id, '_changelist_filters')
+        if redirect:
+            return redirect
+        with use_shard(shard_for_university(get_university_id(request))):
+            try:
+                return super().changeform_view(request, object_id, form_url, extra_context)
+            except SpaceVersionConflict:
+                # Written in between the check of the form and the save
+                self.message_user(
+                    request,
+                    'This space was changed by someone else while saving. Apply your changes again.',
+                    messages.ERROR,
+                )
+                return HttpResponseRedirect(request.get_full_path())
+
+    def delete_view(self, request, object_id, extra_context=None):
+        redirect = self.redirect_to_university(request, object_id, '_changelist_filters')
+        if redirect:
+            return redirect
+        with use_shard(shard_for_university(get_university_id(request))):
+            return super().delete_view(request, object_id, extra_context)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class UniversitiesConfig(AppConfig):
     name = 'universities'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -16,20 +16,38 @@ class UniversityForm(forms.ModelForm):
             'is_approved': forms.CheckboxInput()
         }
 
-class OccupancyUpdateForm(forms.ModelForm):
-    class Meta:
-        model = Space
-        fields = ['current_occupancy']
+class OccupancyUpdateForm(forms.Form):
+    space_id = forms.IntegerField()
+    current_occupancy = Space._meta.get_field('current_occupancy').formfield(required=True)
 
 
 class SpaceCreationForm(forms.ModelForm):
+    # Stored in StudyingAttributes, see Space.attributes
+    has_plugs = forms.BooleanField(required=False)
+    has_wifi = forms.BooleanField(required=False)
+
     class Meta:
         model = Space
-        fields = ['name', 'location', 'space_type', 'parent', 'has_plugs', 'has_wifi']
+        fields = [
+            'name', 'location', 'space_type', 'parent',
+            'latitude', 'longitude', 'floor',
+        ]
 
     def __init__(self, *args, **kwargs):
-        university = kwargs.pop('university', None)
+        parents = kwargs.pop('parents', None)
         super().__init__(*args, **kwargs)
-        if university:
-            # Ensure they can only select parent spaces from their own university
-            self.fields['parent'].queryset = Space.objects.filter(associated_university=university)
+        if parents is not None:
+            # Only spaces the user may manage, e.g. Space.objects.authorized(request, MANAGE)
+            self.fields['parent'].queryset = parents
+        # Space.__str__ reads the university, one query per option; the options share it anyway
+        self.fields['parent'].label_from_instance = lambda space: f'{space.name} ({space.location})'
+
+    def save(self, commit=True):
+        space = super().save(commit=False)
+        if space.space_type == Space.SPACE_TYPE_STUDYING:
+            # Saved together with the space
+            space.attributes.has_plugs = self.cleaned_data['has_plugs']
+            space.attributes.has_wifi = self.cleaned_data['has_wifi']
+        if commit:
+            space.save()
+        return space
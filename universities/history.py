@@ -0,0 +1,162 @@
+import json
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import University, Space, OccupancySnapshot
+from .readmodel import NODE_FIELDS, ORDERING, SpaceNode, get_version
+from .sharding import shard_for_university
+from .sync import get_changes
+
+
+# What the dashboard shows of a space; `last_updated` is stored as epoch seconds
+COLUMNS = ('id', 'parent_id', 'name', 'location', 'space_type', 'current_occupancy', 'last_updated')
+
+
+def pack(data):
+    return zlib.compress(json.dumps(data, separators=(',', ':')).encode())
+
+
+def unpack(blob):
+    return json.loads(zlib.decompress(blob))
+
+
+def to_row(space):
+    # `space` is a dict with at least the COLUMNS, as values() and get_changes() return them
+    row = [space[column] for column in COLUMNS]
+    if row[-1] is not None:
+        row[-1] = int(row[-1].timestamp())
+    return row
+
+
+def take_snapshot(university_id, using, now):
+    # Read before the spaces: changes committed in between are simply applied twice
+    version = get_version(university_id)
+    rows = [
+        to_row(space) for space in
+        Space.objects.using(using).filter(associated_university_id=university_id).values(*COLUMNS).iterator(chunk_size=2000)
+    ]
+    return OccupancySnapshot.objects.using(using).create(
+        university_id=university_id,
+        kind=OccupancySnapshot.KIND_FULL,
+        taken_at=now,
+        change_seq=version,
+        data=pack({'rows': rows}),
+    )
+
+
+def record_history(university_id, now=None):
+    """
+    Record the university's state: a delta with what changed since the last record,
+    or a full snapshot every HISTORY_SNAPSHOT_INTERVAL seconds and every
+    HISTORY_MAX_DELTAS deltas. Nothing is written when nothing changed.
+    """
+    now = now or timezone.now()
+    using = shard_for_university(university_id)
+    records = OccupancySnapshot.objects.using(using).filter(university_id=university_id)
+
+    snapshot = records.filter(kind=OccupancySnapshot.KIND_FULL).order_by('-taken_at').values('taken_at').first()
+    if snapshot is None:
+        return take_snapshot(university_id, using, now)
+
+    interval = timedelta(seconds=getattr(settings, 'HISTORY_SNAPSHOT_INTERVAL', 60 * 60))
+    deltas = records.filter(kind=OccupancySnapshot.KIND_DELTA, taken_at__gt=snapshot['taken_at'])
+    if now - snapshot['taken_at'] >= interval or deltas.count() >= getattr(settings, 'HISTORY_MAX_DELTAS', 60):
+        return take_snapshot(university_id, using, now)
+
+    # Intermediate states of a space between two records collapse into its latest one
+    since = records.order_by('-taken_at').values_list('change_seq', flat=True).first()
+    changed, deleted = {}, set()
+    while True:
+        changes = get_changes(university_id, since=since)
+        if changes['reset']:
+            # Tombstones we needed were pruned
+            return take_snapshot(university_id, using, now)
+        for space in changes['changed']:
+            changed[space['id']] = to_row(space)
+        for space_id in changes['deleted']:
+            changed.pop(space_id, None)
+            deleted.add(space_id)
+        since = changes['token']
+        if not changes['has_more']:
+            break
+
+    if not changed and not deleted:
+        return None
+    return OccupancySnapshot.objects.using(using).create(
+        university_id=university_id,
+        kind=OccupancySnapshot.KIND_DELTA,
+        taken_at=now,
+        change_seq=since,
+        data=pack({'rows': list(changed.values()), 'deleted': sorted(deleted)}),
+    )
+
+
+def record_all_history():
+    recorded = 0
+    # Universities being moved are skipped, their source copy is about to go away
+    university_ids = University.objects.using(DEFAULT_DB_ALIAS).filter(read_only=False).values_list('pk', flat=True)
+    for university_id in university_ids:
+        recorded += record_history(university_id) is not None
+    return recorded
+
+
+def to_node(row):
+    values = dict.fromkeys(NODE_FIELDS)
+    values.update(zip(COLUMNS, row))
+    if values['last_updated'] is not None:
+        values['last_updated'] = datetime.fromtimestamp(values['last_updated'], tz=dt_timezone.utc)
+    return SpaceNode(values)
+
+
+def get_spaces_as_of(records, at):
+    """
+    (time of the last record applied, spaces as SpaceNode in dashboard order) as recorded at `at`.
+
+    `records` are the OccupancySnapshot rows of one university, e.g. scoped with
+    .authorized(request). Loads the latest full snapshot at or before `at` and
+    applies the deltas after it, at most HISTORY_MAX_DELTAS of them.
+    Returns (None, []) when nothing was recorded before `at`.
+    """
+    records = records.filter(taken_at__lte=at)
+    snapshot = records.filter(kind=OccupancySnapshot.KIND_FULL).order_by('-taken_at').first()
+    if snapshot is None:
+        return None, []
+
+    state = {row[0]: row for row in unpack(snapshot.data)['rows']}
+    recorded_at = snapshot.taken_at
+    deltas = records.filter(kind=OccupancySnapshot.KIND_DELTA, taken_at__gt=snapshot.taken_at).order_by('taken_at')
+    for delta in deltas:
+        data = unpack(delta.data)
+        for row in data['rows']:
+            state[row[0]] = row
+        for space_id in data['deleted']:
+            state.pop(space_id, None)
+        recorded_at = delta.taken_at
+
+    return recorded_at, sorted((to_node(row) for row in state.values()), key=ORDERING)
+
+
+def prune_history(older_than):
+    """
+    Delete records older than `older_than`, except the full snapshot later deltas start from.
+
+    Storage per university is then bounded by the retention period times the
+    recording rate (at most one record per run of record_all_history).
+    """
+    cutoff = timezone.now() - older_than
+    pruned = 0
+    for using in settings.DATABASES:
+        records = OccupancySnapshot.objects.using(using)
+        anchors = (
+            records.filter(kind=OccupancySnapshot.KIND_FULL, taken_at__lte=cutoff)
+            .values('university_id')
+            .annotate(anchor=Max('taken_at'))
+        )
+        for row in anchors:
+            pruned += records.filter(university_id=row['university_id'], taken_at__lt=row['anchor']).delete()[0]
+    return pruned
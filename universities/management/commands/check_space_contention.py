@@ -0,0 +1,110 @@
+import random
+import threading
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from universities.models import University, Space, SpaceVersionConflict
+from universities.sync import report_occupancy
+from universities.tasks import delete_university
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer one space with concurrent occupancy reports and metadata edits, "
+        "then check that no write was lost. Works on a throwaway university."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--reports', type=int, default=50, help='Occupancy reports per reporting thread')
+        parser.add_argument('--edits', type=int, default=10, help='Metadata edits per editing thread')
+        parser.add_argument('--editors', type=int, default=4, help='How many of the threads edit metadata')
+        parser.add_argument('--keep', action='store_true', help='Keep the test university afterwards')
+
+    def handle(self, threads, reports, edits, editors, keep, **options):
+        if not 0 <= editors <= threads:
+            raise CommandError('--editors must be between 0 and --threads')
+
+        tag = uuid.uuid4().hex[:8]
+        university = University.objects.create(
+            name=f'Contention test {tag}',
+            email_domain=f'@contention-{tag}.test',
+        )
+        building = Space.objects.create(
+            name='Building', location='Test', space_type=Space.SPACE_TYPE_STUDYING,
+            associated_university=university,
+        )
+        room = Space.objects.create(
+            name='Room', location='Test', space_type=Space.SPACE_TYPE_STUDYING,
+            associated_university=university, parent=building,
+        )
+
+        lock = threading.Lock()
+        results = {'reports': 0, 'edits': 0, 'conflicts': 0, 'errors': [], 'names': set()}
+
+        def reporter():
+            for _ in range(reports):
+                report_occupancy(university.id, room.id, random.randint(1, 5), None)
+                with lock:
+                    results['reports'] += 1
+
+        def editor(number):
+            for attempt in range(edits):
+                name = f'Room {number}.{attempt}'
+                while True:
+                    space = Space.objects.get(pk=room.pk)
+                    space.name = name
+                    try:
+                        space.save()
+                    except SpaceVersionConflict:
+                        # Somebody wrote in between: reload and apply the edit again
+                        with lock:
+                            results['conflicts'] += 1
+                        continue
+                    break
+                with lock:
+                    results['edits'] += 1
+                    results['names'].add(name)
+
+        def run(target, *args):
+            try:
+                target(*args)
+            except Exception as error:
+                with lock:
+                    results['errors'].append(repr(error))
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=run, args=(editor, number)) for number in range(editors)]
+        workers += [threading.Thread(target=run, args=(reporter,)) for _ in range(threads - editors)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        room.refresh_from_db()
+        building.refresh_from_db()
+        expected_version = 1 + results['reports'] + results['edits']
+
+        self.stdout.write(
+            f"{results['reports']} reports, {results['edits']} edits, "
+            f"{results['conflicts']} conflicts detected and retried"
+        )
+        failures = list(results['errors'])
+        if room.version != expected_version:
+            failures.append(f'version is {room.version}, expected {expected_version}: writes were lost')
+        if editors and edits and room.name not in results['names']:
+            failures.append(f'name {room.name!r} was not written by any edit')
+        if building.aggregate_occupancy != room.aggregate_occupancy:
+            failures.append(
+                f'building aggregate {building.aggregate_occupancy} does not match room {room.aggregate_occupancy}'
+            )
+
+        if not keep:
+            delete_university(university.id)
+
+        if failures:
+            raise CommandError('; '.join(failures))
+        self.stdout.write(self.style.SUCCESS('No lost writes'))
@@ -0,0 +1,87 @@
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+
+from universities.outbox import (
+    dispatch_batch, get_consumers, purge_delivered_messages, purge_failed_messages, requeue_stale_messages,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver occupancy change events to the consumers in OUTBOX_CONSUMERS, "
+        "each from its own thread so a slow consumer does not hold up the others."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the outbox is empty')
+        parser.add_argument('--batch-size', type=int, default=getattr(settings, 'OUTBOX_BATCH_SIZE', 100))
+        parser.add_argument(
+            '--keep-delivered-hours', type=int, default=24,
+            help='Delete delivered events older than this many hours',
+        )
+        parser.add_argument(
+            '--keep-failed-days', type=int, default=7,
+            help='Delete events given up on that are older than this many days',
+        )
+
+    def handle(self, once, sleep, batch_size, keep_delivered_hours, keep_failed_days, **options):
+        consumers = get_consumers()
+        if not consumers:
+            self.stdout.write('No OUTBOX_CONSUMERS configured')
+            return
+
+        stop = threading.Event()
+        threads = [
+            threading.Thread(
+                target=self.run_consumer,
+                args=(consumer, stop, once, sleep, batch_size,
+                      timedelta(hours=keep_delivered_hours), timedelta(days=keep_failed_days)),
+                name=f'outbox-{consumer.name}',
+                daemon=True,
+            )
+            for consumer in consumers.values()
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                # A timeout keeps the main thread responsive to Ctrl+C
+                while thread.is_alive():
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write('Stopping outbox dispatcher')
+            stop.set()
+            for thread in threads:
+                thread.join()
+
+    @staticmethod
+    def run_consumer(consumer, stop, once, sleep, batch_size, keep_delivered, keep_failed):
+        # Events live on the shard of their university
+        try:
+            for using in settings.DATABASES:
+                requeue_stale_messages(consumer.name, using)
+
+            while not stop.is_set():
+                processed = 0
+                for using in settings.DATABASES:
+                    processed += dispatch_batch(consumer, using, batch_size)
+                if once and not processed:
+                    break
+
+                if not processed:
+                    # Idle: housekeeping, then wait for new events
+                    for using in settings.DATABASES:
+                        requeue_stale_messages(consumer.name, using)
+                        purge_delivered_messages(consumer.name, using, keep_delivered)
+                        purge_failed_messages(consumer.name, using, keep_failed)
+                    close_old_connections()
+                    stop.wait(sleep)
+        finally:
+            # Connections are per thread
+            connections.close_all()
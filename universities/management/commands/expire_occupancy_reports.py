@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from universities.tasks import expire_stale_reports
+
+
+class Command(BaseCommand):
+    help = (
+        "Clear occupancy reports older than their OCCUPANCY_REPORT_TTL. "
+        "`run_tasks` workers already do this periodically (TASKS_PERIODIC)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, batch_size, **options):
+        counts = expire_stale_reports(batch_size=batch_size)
+        for space_type, count in counts.items():
+            self.stdout.write(f'{space_type}: {count} reports expired')
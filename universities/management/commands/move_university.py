@@ -0,0 +1,200 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.fields import AutoFieldMixin
+
+from universities.models import ATTRIBUTE_MODELS, University, OccupancySnapshot, Sensor, Space, SpaceTombstone
+from universities.sharding import forget_university, get_id_block, get_shard_map_ttl, raise_id_sequence
+
+
+class Command(BaseCommand):
+    help = (
+        "Move a university's spaces and users to another database shard. "
+        "The university is read-only while it is copied and until every worker has picked up the "
+        "new shard, and its users have to sign in again afterwards. Rows keep their ids: every database "
+        "hands out ids from its own SHARD_ID_BLOCK, so they are free on the target. Rows created before "
+        "the blocks were reserved can still collide, and the move is then refused."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('university_id', type=int)
+        parser.add_argument('target', help='Database alias from settings.DATABASES')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--wait', type=float, default=None,
+            help='Seconds to keep the source before deleting it (default: UNIVERSITY_SHARD_MAP_TTL)',
+        )
+
+    def handle(self, university_id, target, batch_size, wait, **options):
+        if target not in settings.DATABASES:
+            raise CommandError(f'Unknown database alias: {target}')
+
+        try:
+            university = University.objects.using(DEFAULT_DB_ALIAS).get(pk=university_id)
+        except University.DoesNotExist:
+            raise CommandError(f'University {university_id} does not exist')
+
+        source = university.shard
+        if source == target:
+            self.stdout.write(f'{university} already lives on "{target}"')
+            return
+
+        # 1. FREEZE: WRITES FAIL WITH UniversityReadOnly INSTEAD OF LANDING ON A COPY THAT IS ABOUT TO GO
+        # The UPDATE waits for writes holding the change counter, so none is still in flight afterwards
+        self.set_read_only(university_id, {DEFAULT_DB_ALIAS, source}, True)
+        try:
+            users, spaces = self.copy_university(university, source, target, batch_size)
+        except BaseException:
+            self.set_read_only(university_id, {DEFAULT_DB_ALIAS, source}, False)
+            raise
+
+        try:
+            # 3. SWITCH THE DIRECTORY ENTRY
+            University.objects.using(DEFAULT_DB_ALIAS).filter(pk=university_id).update(shard=target)
+            forget_university(university_id)
+
+            # 4. WAIT UNTIL NO WORKER ROUTES TO THE SOURCE ANY MORE, THEN REMOVE IT
+            # Workers with a cached shard map still write to the source until it expires; it is read-only
+            wait = get_shard_map_ttl() if wait is None else wait
+            self.stdout.write(f'Waiting {wait:g}s for cached shard maps to expire')
+            time.sleep(wait)
+            with transaction.atomic(using=source):
+                self.delete_university_rows(university_id, source)
+                if source != DEFAULT_DB_ALIAS:
+                    University.objects.using(source).filter(pk=university_id).delete()
+        finally:
+            self.set_read_only(university_id, {DEFAULT_DB_ALIAS, source, target}, False)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {university} from "{source}" to "{target}": '
+            f'{len(spaces)} spaces, {len(users)} users'
+        ))
+
+    def copy_university(self, university, source, target, batch_size):
+        """Copy the university's rows to `target` in one transaction; returns (users, spaces)."""
+        university_id = university.pk
+        User = get_user_model()
+        users = list(User.objects.using(source).filter(associated_university_id=university_id))
+        spaces = list(Space.objects.using(source).filter(associated_university_id=university_id))
+        tombstones = list(SpaceTombstone.objects.using(source).filter(university_id=university_id))
+        sensors = list(Sensor.objects.using(source).filter(university_id=university_id))
+        sensor_spaces = list(Sensor.spaces.through.objects.using(source).filter(sensor__university_id=university_id))
+        history = list(OccupancySnapshot.objects.using(source).filter(university_id=university_id))
+        attributes = [
+            list(model.objects.using(source).filter(space__associated_university_id=university_id))
+            for model in ATTRIBUTE_MODELS.values()
+        ]
+        # Sync tokens stay valid on the new shard, the counters move along
+        change_seq, sync_horizon = (
+            University.objects.using(source)
+            .filter(pk=university_id)
+            .values_list('change_seq', 'sync_horizon')
+            .get()
+        )
+        user_ids = {user.pk for user in users}
+        groups = list(User.groups.through.objects.using(source).filter(user_id__in=user_ids))
+        permissions = list(User.user_permissions.through.objects.using(source).filter(user_id__in=user_ids))
+
+        # 2. COPY EVERYTHING TO THE TARGET (FK CHECKS ARE DEFERRED UNTIL COMMIT)
+        with transaction.atomic(using=target):
+            # Clear leftovers of an interrupted earlier run so the command can be re-run
+            self.delete_university_rows(university_id, target)
+
+            if target != DEFAULT_DB_ALIAS:
+                University.objects.using(target).update_or_create(
+                    pk=university_id,
+                    defaults={
+                        'name': university.name,
+                        'email_domain': university.email_domain,
+                        'is_approved': university.is_approved,
+                        'shard': target,
+                        'read_only': True,
+                    },
+                )
+            University.objects.using(target).filter(pk=university_id).update(
+                change_seq=change_seq,
+                sync_horizon=sync_horizon,
+            )
+
+            # Ids are public (sync feeds, sensor keys, history), so they are kept rather than remapped.
+            # Ids born on another database come from its own block; this only catches older rows
+            copies = [
+                (User, users),
+                (User.groups.through, groups),
+                (User.user_permissions.through, permissions),
+                (Space, spaces),
+                *zip(ATTRIBUTE_MODELS.values(), attributes),
+                (SpaceTombstone, tombstones),
+                (Sensor, sensors),
+                (Sensor.spaces.through, sensor_spaces),
+                (OccupancySnapshot, history),
+            ]
+            for model, rows in copies:
+                self.check_free_ids(model, rows, target, batch_size)
+
+            User.objects.using(target).bulk_create(users, batch_size=batch_size)
+            User.groups.through.objects.using(target).bulk_create(groups, batch_size=batch_size)
+            User.user_permissions.through.objects.using(target).bulk_create(permissions, batch_size=batch_size)
+
+            for space in spaces:
+                # Reports by users of other universities cannot follow the space
+                if space.last_updated_by_id not in user_ids:
+                    space.last_updated_by_id = None
+            Space.objects.using(target).bulk_create(spaces, batch_size=batch_size)
+            for model, rows in zip(ATTRIBUTE_MODELS.values(), attributes):
+                model.objects.using(target).bulk_create(rows, batch_size=batch_size)
+            SpaceTombstone.objects.using(target).bulk_create(tombstones, batch_size=batch_size)
+            Sensor.objects.using(target).bulk_create(sensors, batch_size=batch_size)
+            Sensor.spaces.through.objects.using(target).bulk_create(sensor_spaces, batch_size=batch_size)
+            OccupancySnapshot.objects.using(target).bulk_create(history, batch_size=batch_size)
+
+            # Rows returning to the database they were created on: its sequence must stay past them.
+            # Ids of other blocks leave the target's sequence alone on PostgreSQL; SQLite always
+            # continues after the largest id, so there a move to a lower block carries the ids along
+            start, end = get_id_block(target)
+            for model, rows in copies:
+                own_ids = [row.pk for row in rows if start <= row.pk < end]
+                if own_ids and isinstance(model._meta.pk, AutoFieldMixin):
+                    raise_id_sequence(model, target, max(own_ids) + 1)
+        return users, spaces
+
+    @staticmethod
+    def set_read_only(university_id, aliases, read_only):
+        for using in aliases:
+            University.objects.using(using).filter(pk=university_id).update(read_only=read_only)
+
+    @staticmethod
+    def check_free_ids(model, rows, target, batch_size):
+        # Runs after the leftovers of this university were cleared, so any hit belongs to someone else
+        ids = [row.pk for row in rows]
+        taken = []
+        for start in range(0, len(ids), batch_size):
+            batch = ids[start:start + batch_size]
+            taken += model.objects.using(target).filter(pk__in=batch).values_list('pk', flat=True)
+        if taken:
+            raise CommandError(
+                f'{len(taken)} {model._meta.verbose_name} ids are already used on the target, '
+                f'e.g. {sorted(taken)[:10]}; nothing was moved'
+            )
+
+    @staticmethod
+    def delete_university_rows(university_id, using):
+        """
+        Delete a university's rows from one database without the per-space signals.
+
+        The rows are moved, not deleted: tombstones, sequence numbers, ancestor
+        refreshes and outbox events would only be churn, one round of queries per
+        space. Tables are emptied child first, each with a single DELETE.
+        """
+        for model in ATTRIBUTE_MODELS.values():
+            model.objects.using(using).filter(space__associated_university_id=university_id)._raw_delete(using)
+        Sensor.spaces.through.objects.using(using).filter(sensor__university_id=university_id)._raw_delete(using)
+        Sensor.objects.using(using).filter(university_id=university_id)._raw_delete(using)
+        Space.objects.using(using).filter(associated_university_id=university_id)._raw_delete(using)
+        SpaceTombstone.objects.using(using).filter(university_id=university_id)._raw_delete(using)
+        OccupancySnapshot.objects.using(using).filter(university_id=university_id)._raw_delete(using)
+        # Users have no sync signals; the ORM delete also clears their reports on other universities' spaces
+        get_user_model().objects.using(using).filter(associated_university_id=university_id).delete()
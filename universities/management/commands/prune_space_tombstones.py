@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from universities.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete tombstones of deleted spaces older than --days. "
+        "Clients whose sync token predates them receive a full snapshot on their next sync."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30)
+
+    def handle(self, days, **options):
+        pruned = prune_tombstones(timedelta(days=days))
+        self.stdout.write(self.style.SUCCESS(f'Deleted {pruned} tombstones'))
@@ -0,0 +1,73 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from universities.models import Sensor, Space
+from universities.sensors import forget_sensor, issue_key
+from universities.sharding import shard_for_university
+
+
+class Command(BaseCommand):
+    help = "Register occupancy sensors of a university and manage their API keys."
+
+    def add_arguments(self, parser):
+        actions = parser.add_subparsers(dest='action', required=True)
+
+        add = actions.add_parser('add', help='Register a sensor and print its key')
+        add.add_argument('university_id', type=int)
+        add.add_argument('name')
+        add.add_argument('--space', type=int, action='append', required=True, dest='spaces',
+                         help='Id of a space the sensor reports for (repeatable)')
+
+        for action, help_text in (('rotate', 'Replace the key of a sensor and print it'),
+                                  ('revoke', 'Stop accepting readings from a sensor')):
+            sub = actions.add_parser(action, help=help_text)
+            sub.add_argument('university_id', type=int)
+            sub.add_argument('sensor_id', type=int)
+
+        listing = actions.add_parser('list', help="List a university's sensors")
+        listing.add_argument('university_id', type=int)
+
+    def handle(self, action, university_id, **options):
+        using = shard_for_university(university_id)
+        getattr(self, action)(university_id, using, **options)
+
+    def add(self, university_id, using, name, spaces, **options):
+        space_ids = set(
+            Space.objects.using(using).filter(associated_university_id=university_id, pk__in=spaces)
+            .values_list('pk', flat=True)
+        )
+        if space_ids != set(spaces):
+            raise CommandError(f'No such spaces in university {university_id}: {sorted(set(spaces) - space_ids)}')
+
+        with transaction.atomic(using=using):
+            sensor = Sensor.objects.using(using).create(university_id=university_id, name=name)
+            sensor.spaces.set(space_ids)
+            key = issue_key(sensor)
+        self.stdout.write(f'Sensor {sensor.pk} reports for {len(space_ids)} spaces. Its key (shown only once):')
+        self.stdout.write(key)
+
+    def get_sensor(self, university_id, using, sensor_id):
+        try:
+            return Sensor.objects.using(using).get(pk=sensor_id, university_id=university_id)
+        except Sensor.DoesNotExist:
+            raise CommandError(f'University {university_id} has no sensor {sensor_id}')
+
+    def rotate(self, university_id, using, sensor_id, **options):
+        key = issue_key(self.get_sensor(university_id, using, sensor_id))
+        self.stdout.write('New key (shown only once; the old one stops working within SENSOR_CACHE_TTL):')
+        self.stdout.write(key)
+
+    def revoke(self, university_id, using, sensor_id, **options):
+        sensor = self.get_sensor(university_id, using, sensor_id)
+        sensor.is_active = False
+        sensor.save(update_fields=['is_active'])
+        forget_sensor(university_id, sensor_id)
+        self.stdout.write(f'Revoked {sensor}; running workers drop it within SENSOR_CACHE_TTL')
+
+    def list(self, university_id, using, **options):
+        sensors = Sensor.objects.using(using).filter(university_id=university_id).order_by('name').prefetch_related('spaces')
+        for sensor in sensors:
+            state = 'active' if sensor.is_active else 'revoked'
+            last_seen = sensor.last_seen.isoformat() if sensor.last_seen else 'never'
+            space_ids = ', '.join(str(pk) for pk in sorted(space.pk for space in sensor.spaces.all()))
+            self.stdout.write(f'{sensor.pk:>6}  {sensor.name}  [{state}, last seen {last_seen}]  spaces: {space_ids}')
@@ -0,0 +1,25 @@
+from django.http import HttpResponse
+
+from .models import UniversityReadOnly
+from .sharding import SHARD_SESSION_KEY, get_shard_map_ttl, use_shard
+
+
+class ShardMiddleware:
+    """Binds the signed-in user's university shard for the rest of the request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with use_shard(request.session.get(SHARD_SESSION_KEY)):
+            return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        # A write hit a university in the middle of `manage.py move_university`
+        if isinstance(exception, UniversityReadOnly):
+            response = HttpResponse(
+                'This university is being moved, please try again shortly.', status=503, content_type='text/plain',
+            )
+            response['Retry-After'] = str(get_shard_map_ttl())
+            return response
+        return None
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('universities', '0003_remove_space_updated_by_space_last_updated_by'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='university',
+            name='shard',
+            field=models.CharField(default='default', max_length=64),
+        ),
+    ]
@@ -0,0 +1,85 @@
+from django.db import migrations, models
+
+
+def backfill_sync_state(apps, schema_editor):
+    """Give every existing space a distinct sequence number and its aggregate occupancy."""
+    University = apps.get_model('universities', 'University')
+    Space = apps.get_model('universities', 'Space')
+    using = schema_editor.connection.alias
+
+    for university in University.objects.using(using).all():
+        spaces = list(Space.objects.using(using).filter(associated_university=university).order_by('id'))
+        children = {}
+        for space in spaces:
+            children.setdefault(space.parent_id, []).append(space)
+
+        # Post-order walk with an explicit stack, parents after their children
+        aggregates = {}
+        stack = [(space, False) for space in children.get(None, [])]
+        while stack:
+            space, expanded = stack.pop()
+            kids = children.get(space.id, [])
+            if not expanded and kids:
+                stack.append((space, True))
+                stack.extend((kid, False) for kid in kids)
+                continue
+            if kids:
+                values = [aggregates[kid.id] for kid in kids if aggregates.get(kid.id) is not None]
+                aggregates[space.id] = sum(values) / len(values) if values else None
+            else:
+                aggregates[space.id] = space.current_occupancy
+
+        for seq, space in enumerate(spaces, start=1):
+            space.aggregate_occupancy = aggregates.get(space.id, space.current_occupancy)
+            space.change_seq = seq
+        Space.objects.using(using).bulk_update(spaces, ['aggregate_occupancy', 'change_seq'], batch_size=500)
+        University.objects.using(using).filter(pk=university.pk).update(change_seq=len(spaces))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('universities', '0005_space_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpaceTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('university_id', models.BigIntegerField()),
+                ('space_id', models.BigIntegerField()),
+                ('change_seq', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='space',
+            name='aggregate_occupancy',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='space',
+            name='change_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='university',
+            name='change_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='university',
+            name='sync_horizon',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='space',
+            index=models.Index(fields=['associated_university', 'change_seq'], name='universitie_associa_ef4f01_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='spacetombstone',
+            index=models.Index(fields=['university_id', 'change_seq'], name='universitie_univers_cf812a_idx'),
+        ),
+        migrations.RunPython(backfill_sync_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('universities', '0006_space_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='space',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,15 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('universities', '0008_outbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='space',
+            index=models.Index(condition=models.Q(('current_occupancy__isnull', False)), fields=['space_type', 'last_updated'], name='space_report_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,121 @@
+import django.core.validators
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+BATCH_SIZE = 1000
+
+
+def move_attributes_to_side_tables(apps, schema_editor):
+    Space = apps.get_model('universities', 'Space')
+    using = schema_editor.connection.alias
+
+    # The defaults Space.clean() used to fill in for missing values
+    targets = {
+        'studying': (apps.get_model('universities', 'StudyingAttributes'), lambda space: {
+            'has_plugs': bool(space.has_plugs),
+            'has_wifi': bool(space.has_wifi),
+        }),
+        'eating': (apps.get_model('universities', 'EatingAttributes'), lambda space: {
+            'has_student_discounts': bool(space.has_student_discounts),
+            'price_range': space.eating_price_range or 2,
+        }),
+        'coffee': (apps.get_model('universities', 'CoffeeAttributes'), lambda space: {
+            'quality': space.coffee_quality or 3,
+            'price_range': space.coffee_price_range or 2,
+        }),
+    }
+
+    for space_type, (model, get_values) in targets.items():
+        batch = []
+        for space in Space.objects.using(using).filter(space_type=space_type).order_by().iterator(chunk_size=BATCH_SIZE):
+            batch.append(model(space_id=space.pk, **get_values(space)))
+            if len(batch) == BATCH_SIZE:
+                model.objects.using(using).bulk_create(batch)
+                batch = []
+        model.objects.using(using).bulk_create(batch)
+
+
+def move_attributes_back(apps, schema_editor):
+    Space = apps.get_model('universities', 'Space')
+    using = schema_editor.connection.alias
+
+    sources = {
+        'StudyingAttributes': {'has_plugs': 'has_plugs', 'has_wifi': 'has_wifi'},
+        'EatingAttributes': {'has_student_discounts': 'has_student_discounts', 'price_range': 'eating_price_range'},
+        'CoffeeAttributes': {'quality': 'coffee_quality', 'price_range': 'coffee_price_range'},
+    }
+    for model_name, columns in sources.items():
+        model = apps.get_model('universities', model_name)
+        for attributes in model.objects.using(using).iterator(chunk_size=BATCH_SIZE):
+            Space.objects.using(using).filter(pk=attributes.space_id).update(
+                **{column: getattr(attributes, field) for field, column in columns.items()}
+            )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('universities', '0009_space_report_expiry_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoffeeAttributes',
+            fields=[
+                ('space', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='coffee_attributes', serialize=False, to='universities.space')),
+                ('quality', models.IntegerField(default=3, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(5)])),
+                ('price_range', models.IntegerField(choices=[(1, '$'), (2, '$$'), (3, '$$$')], default=2)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['quality', 'price_range'], name='universitie_quality_60cbc4_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EatingAttributes',
+            fields=[
+                ('space', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='eating_attributes', serialize=False, to='universities.space')),
+                ('has_student_discounts', models.BooleanField(default=False)),
+                ('price_range', models.IntegerField(choices=[(1, '$'), (2, '$$'), (3, '$$$')], default=2)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['price_range', 'has_student_discounts'], name='universitie_price_r_fbe83b_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StudyingAttributes',
+            fields=[
+                ('space', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='studying_attributes', serialize=False, to='universities.space')),
+                ('has_plugs', models.BooleanField(default=False)),
+                ('has_wifi', models.BooleanField(default=False)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['has_wifi', 'has_plugs'], name='universitie_has_wif_336340_idx')],
+            },
+        ),
+        migrations.RunPython(move_attributes_to_side_tables, move_attributes_back),
+        migrations.RemoveField(
+            model_name='space',
+            name='coffee_price_range',
+        ),
+        migrations.RemoveField(
+            model_name='space',
+            name='coffee_quality',
+        ),
+        migrations.RemoveField(
+            model_name='space',
+            name='eating_price_range',
+        ),
+        migrations.RemoveField(
+            model_name='space',
+            name='has_plugs',
+        ),
+        migrations.RemoveField(
+            model_name='space',
+            name='has_student_discounts',
+        ),
+        migrations.RemoveField(
+            model_name='space',
+            name='has_wifi',
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('universities', '0010_space_attribute_tables'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='outboxmessage',
+            index=models.Index(condition=models.Q(('status', 'pending')), fields=['consumer', 'id'], name='outbox_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='space',
+            index=models.Index(condition=models.Q(('parent__isnull', True)), fields=['associated_university', 'space_type', 'name'], name='space_roots_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('universities', '0011_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Sensor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('key_hash', models.CharField(max_length=64)),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('last_seen', models.DateTimeField(blank=True, null=True)),
+                ('spaces', models.ManyToManyField(related_name='sensors', to='universities.space')),
+                ('university', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='universities.university')),
+            ],
+            options={
+                'unique_together': {('university', 'name')},
+            },
+        ),
+    ]
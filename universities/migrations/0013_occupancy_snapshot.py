@@ -0,0 +1,26 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('universities', '0012_sensor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccupancySnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('full', 'Full snapshot'), ('delta', 'Delta')], max_length=5)),
+                ('taken_at', models.DateTimeField()),
+                ('change_seq', models.BigIntegerField()),
+                ('data', models.BinaryField()),
+                ('university', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='universities.university')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['university', 'kind', 'taken_at'], name='universitie_univers_27850f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('universities', '0013_occupancy_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='university',
+            name='read_only',
+            field=models.BooleanField(default=False),
+        ),
+    ]
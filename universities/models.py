@@ -1,6 +1,10 @@
-from django.db import models
+from django.conf import settings
+from django.db import models, DatabaseError, DEFAULT_DB_ALIAS
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from users.authorization import AuthorizedQuerySet
 
 
 class University(models.Model):
@@ -12,6 +16,23 @@ class University(models.Model):
     # TODO: enable associated_university validation by admin
     is_approved = models.BooleanField(default=True)
 
+    # Database alias holding this university's spaces and users (see universities.sharding)
+    shard = models.CharField(max_length=64, default=DEFAULT_DB_ALIAS)
+
+    # Last change sequence number handed out to the university's spaces, and the
+    # oldest sync token still answerable after old tombstones were pruned (see universities.sync).
+    # Both live on the university's shard and are only changed with atomic UPDATEs.
+    change_seq = models.BigIntegerField(default=0)
+    sync_horizon = models.BigIntegerField(default=0)
+
+    # Set on the university's rows while `manage.py move_university` copies it to another shard:
+    # writes stamped with next_change_seq() fail with UniversityReadOnly and signups are refused
+    read_only = models.BooleanField(default=False)
+
+    COUNTER_FIELDS = ('change_seq', 'sync_horizon')
+    # Only changed with UPDATEs, never written back by save()
+    UPDATE_ONLY_FIELDS = COUNTER_FIELDS + ('read_only',)
+
     def __str__(self):
         return self.name
 
@@ -22,11 +43,28 @@ class University(models.Model):
         if self.email_domain and self.email_domain.count('@') != 1:
             raise ValidationError({'email_domain': 'Invalid email domain format'})
 
+        if self.shard not in settings.DATABASES:
+            raise ValidationError({'shard': f'Unknown database alias: {self.shard}'})
+
     def save(self, *args, **kwargs):
         self.clean()
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # Never write back counters or flags that may have moved since this instance was loaded
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.UPDATE_ONLY_FIELDS
+            ]
         super().save(*args, **kwargs)
 
 
+class UniversityReadOnly(DatabaseError):
+    """The university is being moved to another shard and does not take writes for now."""
+
+
+class SpaceVersionConflict(DatabaseError):
+    """The space was changed by someone else since this copy was loaded."""
+
+
 class Space(models.Model):
     SPACE_TYPE_STUDYING = 'studying'
     SPACE_TYPE_EATING = 'eating'
@@ -86,32 +124,33 @@ class Space(models.Model):
 
     last_updated = models.DateTimeField(null=True, blank=True)
 
-    # TYPE-SPECIFIC FIELDS (NULLABLE FOR OTHER TYPES)
+    # Occupancy shown for the space: its own report for leaves, the average of
+    # the children for composites. Kept up to date on every write (see universities.sync)
+    aggregate_occupancy = models.FloatField(null=True, blank=True)
 
-    # Studying spaces
-    has_plugs = models.BooleanField(null=True, blank=True)
-    has_wifi = models.BooleanField(null=True, blank=True)
+    # Per-university sequence number of the last change (see universities.sync)
+    change_seq = models.BigIntegerField(default=0)
 
-    # Eating spaces
-    has_student_discounts = models.BooleanField(null=True, blank=True)
-    eating_price_range = models.IntegerField(
-        null=True,
-        blank=True,
-        choices=PRICE_RANGE_CHOICES
-    )
+    # Row version: bumped by every occupancy report and every save, checked by save()
+    version = models.PositiveIntegerField(default=1)
 
-    # Coffee spaces
-    coffee_quality = models.IntegerField(
+    # Optional position, used by the nearest-space search (see universities.spatial)
+    latitude = models.FloatField(
         null=True,
         blank=True,
-        validators=[MinValueValidator(1), MaxValueValidator(5)]
+        validators=[MinValueValidator(-90), MaxValueValidator(90)],
     )
-    coffee_price_range = models.IntegerField(
+    longitude = models.FloatField(
         null=True,
         blank=True,
-        choices=PRICE_RANGE_CHOICES
+        validators=[MinValueValidator(-180), MaxValueValidator(180)],
     )
+    floor = models.SmallIntegerField(null=True, blank=True)
+
+    objects = AuthorizedQuerySet.as_manager()
 
+    # TYPE-SPECIFIC FIELDS live in one side table per type (StudyingAttributes,
+    # EatingAttributes, CoffeeAttributes), so rows read for the dashboard stay narrow
 
     class Meta:
         ordering = ['associated_university', 'space_type', 'name']
@@ -119,6 +158,19 @@ class Space(models.Model):
         indexes = [
             models.Index(fields=['associated_university', 'space_type']),
             models.Index(fields=['parent']),
+            models.Index(fields=['associated_university', 'change_seq']),
+            # Top-level spaces of a university, already in the default ordering
+            models.Index(
+                fields=['associated_university', 'space_type', 'name'],
+                condition=models.Q(parent__isnull=True),
+                name='space_roots_idx',
+            ),
+            # Drives the expiry of old reports (universities.sync.expire_reports)
+            models.Index(
+                fields=['space_type', 'last_updated'],
+                condition=models.Q(current_occupancy__isnull=False),
+                name='space_report_expiry_idx',
+            ),
         ]
 
     def __str__(self):
@@ -169,25 +221,239 @@ class Space(models.Model):
                     raise ValidationError("Circular parent relationship detected")
                 current = current.parent
 
-        # Validate type-specific fields
-        if self.space_type == self.SPACE_TYPE_STUDYING:
-            if self.has_plugs is None:
-                self.has_plugs = False
-            if self.has_wifi is None:
-                self.has_wifi = False
-
-        elif self.space_type == self.SPACE_TYPE_EATING:
-            if self.has_student_discounts is None:
-                self.student_discounts = False
-            if self.eating_price_range is None:
-                self.eating_price_range = 2
-
-        elif self.space_type == self.SPACE_TYPE_COFFEE:
-            if self.coffee_quality is None:
-                self.coffee_quality = 3
-            if self.coffee_price_range is None:
-                self.coffee_price_range = 2
+    def get_attributes_model(self):
+        return ATTRIBUTE_MODELS.get(self.space_type)
+
+    @property
+    def attributes(self):
+        """
+        The row of type-specific attributes, or None for a type without any.
+
+        Loaded on first access (use select_related('<type>_attributes') for many
+        spaces); a new row with the defaults is made when there is none yet.
+        Changes to it are saved together with the space.
+        """
+        model = self.get_attributes_model()
+        if model is None:
+            return None
+        try:
+            return getattr(self, model.related_name)
+        except model.DoesNotExist:
+            # Setting the forward side also caches the row on this space
+            return model(space=self)
+
+    def save_attributes(self, using):
+        model = self.get_attributes_model()
+        loaded_type = getattr(self, '_loaded_space_type', None)
+        type_changed = loaded_type not in (None, self.space_type)
+        if type_changed:
+            for other in ATTRIBUTE_MODELS.values():
+                if other is not model:
+                    other.objects.using(using).filter(space_id=self.pk).delete()
+
+        # Only written when new, retyped, or loaded through `attributes` (and maybe changed)
+        if model is not None and (
+            loaded_type is None or type_changed or model.related_name in self._state.fields_cache
+        ):
+            attributes = self.attributes
+            attributes.space = self
+            attributes.save(using=using)
+
+    def remember_stored_state(self):
+        # Remembered so that moving a space also refreshes its former parent,
+        # and so that saves publish an occupancy event only when occupancy changed
+        self._loaded_parent_id = self.__dict__.get('parent_id')
+        self._loaded_space_type = self.__dict__.get('space_type')
+        self._loaded_occupancy = (
+            self.__dict__.get('current_occupancy'),
+            self.__dict__.get('aggregate_occupancy'),
+        )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_stored_state()
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.remember_stored_state()
 
     def save(self, *args, **kwargs):
+        from .sync import save_space
+
         self.clean()
-        super().save(*args, **kwargs)
+        save_space(self, super().save, *args, **kwargs)
+
+
+class StudyingAttributes(models.Model):
+    related_name = 'studying_attributes'
+
+    space = models.OneToOneField(Space, on_delete=models.CASCADE, primary_key=True, related_name=related_name)
+    has_plugs = models.BooleanField(default=False)
+    has_wifi = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['has_wifi', 'has_plugs']),
+        ]
+
+
+class EatingAttributes(models.Model):
+    related_name = 'eating_attributes'
+
+    space = models.OneToOneField(Space, on_delete=models.CASCADE, primary_key=True, related_name=related_name)
+    has_student_discounts = models.BooleanField(default=False)
+    price_range = models.IntegerField(choices=Space.PRICE_RANGE_CHOICES, default=2)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['price_range', 'has_student_discounts']),
+        ]
+
+
+class CoffeeAttributes(models.Model):
+    related_name = 'coffee_attributes'
+
+    space = models.OneToOneField(Space, on_delete=models.CASCADE, primary_key=True, related_name=related_name)
+    quality = models.IntegerField(default=3, validators=[MinValueValidator(1), MaxValueValidator(5)])
+    price_range = models.IntegerField(choices=Space.PRICE_RANGE_CHOICES, default=2)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['quality', 'price_range']),
+        ]
+
+
+# space_type -> model of its type-specific attributes
+ATTRIBUTE_MODELS = {
+    Space.SPACE_TYPE_STUDYING: StudyingAttributes,
+    Space.SPACE_TYPE_EATING: EatingAttributes,
+    Space.SPACE_TYPE_COFFEE: CoffeeAttributes,
+}
+
+
+class Sensor(models.Model):
+    """A device (door counter, Wi-Fi occupancy sensor) reporting the occupancy of some spaces (see universities.sensors)."""
+
+    university = models.ForeignKey(University, on_delete=models.CASCADE)
+    name = models.CharField(max_length=200)
+    spaces = models.ManyToManyField(Space, related_name='sensors')
+
+    # SHA-256 of the secret part of the key, which is only shown once when issued
+    key_hash = models.CharField(max_length=64)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Refreshed at most once per SENSOR_CACHE_TTL
+    last_seen = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = [['university', 'name']]
+
+    def __str__(self):
+        return f"{self.name} ({self.university_id})"
+
+
+class SpaceTombstone(models.Model):
+    """Marks a deleted space, so delta-sync clients learn about the deletion."""
+
+    # Plain ids: the rows must outlive the space, and survive a cascading university deletion
+    university_id = models.BigIntegerField()
+    space_id = models.BigIntegerField()
+    change_seq = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    objects = AuthorizedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['university_id', 'change_seq']),
+        ]
+
+    def __str__(self):
+        return f"Space {self.space_id} deleted at #{self.change_seq}"
+
+
+class OccupancySnapshot(models.Model):
+    """
+    Recorded state of a university's spaces (see universities.history).
+
+    Either a full snapshot, or a delta with the spaces changed and deleted
+    since the previous record; the data is zlib-compressed JSON.
+    """
+
+    KIND_FULL = 'full'
+    KIND_DELTA = 'delta'
+
+    KINDS = [
+        (KIND_FULL, 'Full snapshot'),
+        (KIND_DELTA, 'Delta'),
+    ]
+
+    university = models.ForeignKey(University, on_delete=models.CASCADE, related_name='+')
+    kind = models.CharField(max_length=5, choices=KINDS)
+    taken_at = models.DateTimeField()
+    # Sync token (universities.sync) the record is current with
+    change_seq = models.BigIntegerField()
+    data = models.BinaryField()
+
+    objects = AuthorizedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Latest snapshot before a time, then the deltas up to it
+            models.Index(fields=['university', 'kind', 'taken_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} of {self.university_id} at {self.taken_at}"
+
+
+class OutboxMessage(models.Model):
+    """
+    An occupancy change waiting to be delivered to one consumer (see universities.outbox).
+
+    Written in the same transaction as the change itself, on the same shard,
+    so a change is never published without being committed, nor lost after it was.
+    """
+
+    STATUS_PENDING = 'pending'
+    STATUS_SENDING = 'sending'
+    STATUS_DELIVERED = 'delivered'
+    STATUS_FAILED = 'failed'
+
+    STATUSES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENDING, 'Sending'),
+        (STATUS_DELIVERED, 'Delivered'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    # Name of the consumer in settings.OUTBOX_CONSUMERS
+    consumer = models.CharField(max_length=100)
+    payload = models.JSONField()
+
+    status = models.CharField(max_length=20, choices=STATUSES, default=STATUS_PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+
+    # Earliest time of the next delivery attempt; pushed back after every failure
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    delivered_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['consumer', 'status', 'run_at']),
+            # Claimed in id order (universities.outbox.claim_batch); stays small as messages get delivered
+            models.Index(
+                fields=['consumer', 'id'],
+                condition=models.Q(status='pending'),
+                name='outbox_pending_idx',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.consumer} #{self.pk} [{self.status}]"
@@ -0,0 +1,188 @@
+import hashlib
+import hmac
+import json
+import logging
+import traceback
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from core.tasks import get_retry_delay
+from .models import OutboxMessage
+
+
+logger = logging.getLogger(__name__)
+
+
+# CONSUMERS (configured in settings.OUTBOX_CONSUMERS)
+
+class Consumer:
+    """Receives batches of occupancy events; raising means the whole batch is retried."""
+
+    def __init__(self, name, options):
+        self.name = name
+        self.options = options
+
+    def deliver(self, events):
+        raise NotImplementedError
+
+
+class WebhookConsumer(Consumer):
+    """POSTs {"events": [...]} as JSON, signed with HMAC-SHA256 when a SECRET is set."""
+
+    def __init__(self, name, options):
+        super().__init__(name, options)
+        import httpx  # Only loaded by processes that actually deliver to a webhook
+
+        # One client per consumer keeps connections to the endpoint alive between batches
+        self.client = httpx.Client(timeout=options.get('TIMEOUT', 5))
+
+    def deliver(self, events):
+        body = json.dumps({'events': events}, cls=DjangoJSONEncoder).encode()
+        headers = {'Content-Type': 'application/json'}
+        if self.options.get('SECRET'):
+            signature = hmac.new(self.options['SECRET'].encode(), body, hashlib.sha256).hexdigest()
+            headers['X-Signature-SHA256'] = signature
+
+        response = self.client.post(self.options['URL'], content=body, headers=headers)
+        response.raise_for_status()
+
+
+class LogConsumer(Consumer):
+    """Local sink that writes events to the log, handy during development."""
+
+    def deliver(self, events):
+        for event in events:
+            logger.info('Occupancy event for %s: %s', self.name, event)
+
+
+@lru_cache(maxsize=None)
+def get_consumers():
+    return {
+        name: import_string(options['BACKEND'])(name, options)
+        for name, options in getattr(settings, 'OUTBOX_CONSUMERS', {}).items()
+    }
+
+
+# PUBLISHING (called inside the transaction of the change)
+
+def publish_occupancy_change(space_id, university_id, current_occupancy, aggregate_occupancy, change_seq, using):
+    publish_occupancy_changes(university_id, [(space_id, current_occupancy, aggregate_occupancy, change_seq)], using)
+
+
+def publish_occupancy_changes(university_id, changes, using):
+    """Publish (space_id, current_occupancy, aggregate_occupancy, change_seq) changes with one INSERT."""
+    consumers = getattr(settings, 'OUTBOX_CONSUMERS', {})
+    if not consumers or not changes:
+        return
+
+    occurred_at = timezone.now().isoformat()
+    messages = []
+    for space_id, current_occupancy, aggregate_occupancy, change_seq in changes:
+        # (university_id, change_seq) is unique, consumers use `id` to drop redeliveries
+        payload = {
+            'id': f'{university_id}:{change_seq}',
+            'type': 'occupancy.changed',
+            'university_id': university_id,
+            'space_id': space_id,
+            'current_occupancy': current_occupancy,
+            'aggregate_occupancy': aggregate_occupancy,
+            'change_seq': change_seq,
+            'occurred_at': occurred_at,
+        }
+        messages.extend(OutboxMessage(consumer=name, payload=payload) for name in consumers)
+    OutboxMessage.objects.using(using).bulk_create(messages, batch_size=500)
+
+
+# DISPATCHING (consumed by `manage.py dispatch_outbox`)
+
+def requeue_stale_messages(consumer_name, using):
+    # Batches whose dispatcher died while delivering them
+    lock_timeout = getattr(settings, 'OUTBOX_LOCK_TIMEOUT', 5 * 60)
+    return OutboxMessage.objects.using(using).filter(
+        consumer=consumer_name,
+        status=OutboxMessage.STATUS_SENDING,
+        locked_at__lt=timezone.now() - timedelta(seconds=lock_timeout),
+    ).update(status=OutboxMessage.STATUS_PENDING, locked_at=None)
+
+
+def claim_batch(consumer_name, using, batch_size):
+    with transaction.atomic(using=using):
+        messages = list(
+            OutboxMessage.objects.using(using)
+            .select_for_update(skip_locked=True)
+            .filter(consumer=consumer_name, status=OutboxMessage.STATUS_PENDING, run_at__lte=timezone.now())
+            .order_by('id')[:batch_size]
+        )
+        OutboxMessage.objects.using(using).filter(pk__in=[message.pk for message in messages]).update(
+            status=OutboxMessage.STATUS_SENDING,
+            locked_at=timezone.now(),
+        )
+    return messages
+
+
+def dispatch_batch(consumer, using, batch_size):
+    """
+    Deliver one batch of a consumer's messages; returns how many were attempted.
+
+    Nothing is locked while the consumer runs. `manage.py dispatch_outbox` gives
+    every consumer its own thread, so a slow endpoint only delays its own events.
+    A message is marked delivered after the consumer returned: delivery is at
+    least once.
+    """
+    messages = claim_batch(consumer.name, using, batch_size)
+    if not messages:
+        return 0
+
+    pks = [message.pk for message in messages]
+    try:
+        consumer.deliver([message.payload for message in messages])
+    except Exception:
+        error = traceback.format_exc()
+        attempts = max(message.attempts for message in messages) + 1
+        max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 10)
+        if attempts >= max_attempts:
+            logger.error('Giving up on %s events for %s: %s', len(pks), consumer.name, error)
+            status = OutboxMessage.STATUS_FAILED
+        else:
+            logger.warning('Delivery to %s failed (attempt %s)', consumer.name, attempts, exc_info=True)
+            status = OutboxMessage.STATUS_PENDING
+
+        OutboxMessage.objects.using(using).filter(pk__in=pks).update(
+            status=status,
+            attempts=attempts,
+            run_at=timezone.now() + timedelta(seconds=get_retry_delay(attempts)),
+            locked_at=None,
+            last_error=error,
+        )
+    else:
+        OutboxMessage.objects.using(using).filter(pk__in=pks).update(
+            status=OutboxMessage.STATUS_DELIVERED,
+            attempts=max(message.attempts for message in messages) + 1,
+            delivered_at=timezone.now(),
+            locked_at=None,
+            last_error='',
+        )
+    return len(messages)
+
+
+def purge_delivered_messages(consumer_name, using, older_than):
+    return OutboxMessage.objects.using(using).filter(
+        consumer=consumer_name,
+        status=OutboxMessage.STATUS_DELIVERED,
+        delivered_at__lt=timezone.now() - older_than,
+    ).delete()[0]
+
+
+def purge_failed_messages(consumer_name, using, older_than):
+    # Given up on after OUTBOX_MAX_ATTEMPTS; kept a while so last_error can be looked into
+    return OutboxMessage.objects.using(using).filter(
+        consumer=consumer_name,
+        status=OutboxMessage.STATUS_FAILED,
+        created_at__lt=timezone.now() - older_than,
+    ).delete()[0]
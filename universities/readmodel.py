@@ -0,0 +1,209 @@
+import sys
+import threading
+import time
+from operator import attrgetter
+
+from django.conf import settings
+
+from .models import University, Space, StudyingAttributes
+from .sharding import shard_for_university
+from .spatial import SpatialIndex
+from .sync import ATTRIBUTE_VALUES, SYNC_FIELDS, get_changes
+
+
+# The delta-sync columns without the sequence number, plus the attributes the search filters on
+COLUMNS = tuple(field for field in SYNC_FIELDS if field != 'change_seq')
+NODE_FIELDS = (*COLUMNS, *ATTRIBUTE_VALUES)
+
+# Space.Meta.ordering within a university
+ORDERING = attrgetter('space_type', 'name')
+
+
+class SpaceNode:
+    """
+    One space as the dashboard and the nearest-space search read it.
+
+    Slots instead of a model instance: no __dict__, no _state, and the few
+    distinct locations and types are shared between nodes (`manage.py
+    measure_read_model` compares the memory of both).
+    """
+    __slots__ = NODE_FIELDS
+
+    def __init__(self, row):
+        self.update(row)
+
+    def update(self, row):
+        # `row` is a dict with the COLUMNS and the sync.ATTRIBUTE_VALUES, as get_changes() returns them
+        self.id = row['id']
+        self.parent_id = row['parent_id']
+        self.name = row['name']
+        self.location = sys.intern(row['location'])
+        self.space_type = sys.intern(row['space_type'])
+        self.current_occupancy = row['current_occupancy']
+        self.aggregate_occupancy = row['aggregate_occupancy']
+        self.last_updated = row['last_updated']
+        self.latitude = row['latitude']
+        self.longitude = row['longitude']
+        self.floor = row['floor']
+        self.has_wifi = row['has_wifi']
+        self.has_plugs = row['has_plugs']
+
+
+class CampusModel:
+    """
+    Every space of one university, kept in the worker process.
+
+    Holds the nodes by id, the nodes in the dashboard order (rebuilt only
+    when a space is added, removed or renamed) and the spatial index of the
+    located ones, which points at the same nodes.
+    """
+
+    def __init__(self, university_id):
+        self.university_id = university_id
+        self.nodes = {}
+        self.spatial = SpatialIndex(getattr(settings, 'SPATIAL_INDEX_CELL_SIZE', 50))
+        self.ordered = None
+        self.built_at = time.monotonic()
+        # Sync token (universities.sync) the model is current with
+        self.version = None
+        self.lock = threading.Lock()
+
+    # Callers hold the lock
+
+    def apply(self, row):
+        node = self.nodes.get(row['id'])
+        if node is None:
+            node = self.nodes[row['id']] = SpaceNode(row)
+            self.ordered = None
+        else:
+            previous = ORDERING(node)
+            node.update(row)
+            if ORDERING(node) != previous:
+                self.ordered = None
+        self.spatial.add(node)
+
+    def remove(self, space_id):
+        if self.nodes.pop(space_id, None) is not None:
+            self.spatial.remove(space_id)
+            self.ordered = None
+
+    def spaces(self):
+        """All nodes in Space.Meta.ordering; the list is shared, so it must not be modified."""
+        with self.lock:
+            if self.ordered is None:
+                self.ordered = sorted(self.nodes.values(), key=ORDERING)
+            return self.ordered
+
+
+_campuses = {}
+_campuses_lock = threading.Lock()
+
+
+def get_version(university_id):
+    using = shard_for_university(university_id)
+    return University.objects.using(using).values_list('change_seq', flat=True).get(pk=university_id)
+
+
+def load_campus(university_id):
+    campus = CampusModel(university_id)
+    using = shard_for_university(university_id)
+    # Read before the spaces: changes committed in between are simply applied twice
+    campus.version = get_version(university_id)
+    rows = (
+        Space.objects.db_manager(using)
+        .filter(associated_university_id=university_id)
+        .values(*COLUMNS, **ATTRIBUTE_VALUES)
+    )
+    # Streamed, so the rows of a large campus are never all in memory at once
+    for row in rows.iterator(chunk_size=2000):
+        campus.apply(row)
+    return campus
+
+
+def catch_up(campus):
+    """Apply the changes since the model's version; False when only a full reload will do."""
+    while True:
+        changes = get_changes(campus.university_id, since=campus.version)
+        if changes['reset']:
+            return False
+
+        with campus.lock:
+            for row in changes['changed']:
+                campus.apply(row)
+            for space_id in changes['deleted']:
+                campus.remove(space_id)
+            campus.version = changes['token']
+            campus.built_at = time.monotonic()
+
+        if not changes['has_more']:
+            return True
+
+
+def get_campus(university_id, consistent=False):
+    """
+    The university's read model, loaded on first use.
+
+    Writes made in this process are applied as they commit (see universities.signals);
+    other workers' writes are picked up from the change feed every READ_MODEL_MAX_AGE
+    seconds. With `consistent`, the university's change sequence is checked first
+    (one primary-key lookup) and any newer change is applied before returning, so
+    a user sees their own report right after the redirect, whichever worker took it.
+    """
+    campus = _campuses.get(university_id)
+    if campus is not None:
+        if consistent:
+            stale = get_version(university_id) > campus.version
+        else:
+            stale = time.monotonic() - campus.built_at > getattr(settings, 'READ_MODEL_MAX_AGE', 5)
+        if not stale:
+            return campus
+
+    with _campuses_lock:
+        campus = _campuses.get(university_id)
+        if campus is None or not catch_up(campus):
+            campus = _campuses[university_id] = load_campus(university_id)
+    return campus
+
+
+def update_space(space):
+    campus = _campuses.get(space.associated_university_id)
+    if campus is None:
+        # Not loaded in this process yet; the first read loads the current state
+        return
+    if space.get_deferred_fields() & set(COLUMNS):
+        # Saved from a partial instance: the next catch-up brings the whole row
+        return
+
+    row = {field: getattr(space, field) for field in COLUMNS}
+    row['has_wifi'] = row['has_plugs'] = None
+    if space.space_type == Space.SPACE_TYPE_STUDYING:
+        previous = campus.nodes.get(space.id)
+        if StudyingAttributes.related_name in space._state.fields_cache or previous is None:
+            row['has_wifi'] = space.attributes.has_wifi
+            row['has_plugs'] = space.attributes.has_plugs
+        else:
+            # Attributes not loaded, so not changed by this save: no need to fetch them
+            row['has_wifi'] = previous.has_wifi
+            row['has_plugs'] = previous.has_plugs
+    with campus.lock:
+        campus.apply(row)
+
+
+def update_occupancy(university_id, space_id, occupancy, last_updated):
+    campus = _campuses.get(university_id)
+    if campus is None:
+        return
+    with campus.lock:
+        node = campus.nodes.get(space_id)
+        if node is not None:
+            # Aggregates of the composites above follow with the next catch-up
+            node.current_occupancy = occupancy
+            node.last_updated = last_updated
+
+
+def remove_space(space):
+    campus = _campuses.get(space.associated_university_id)
+    if campus is not None:
+        with campus.lock:
+            campus.remove(space.id)
+
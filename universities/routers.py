@@ -0,0 +1,52 @@
+from django.db import DEFAULT_DB_ALIAS
+
+from .sharding import SHARDED_MODELS, get_current_shard, shard_for_university
+
+
+UNIVERSITY_LABEL = 'universities.university'
+
+
+class UniversityShardRouter:
+    """
+    Routes spaces and users to the database of their university.
+
+    Resolution order: the University a query hangs off, the database an
+    instance was loaded from, the university of an unsaved instance, and
+    finally the shard bound to the current request by ShardMiddleware.
+    """
+
+    def _route(self, model, **hints):
+        label = model._meta.label_lower
+        if label == UNIVERSITY_LABEL:
+            return DEFAULT_DB_ALIAS
+        if label not in SHARDED_MODELS:
+            return None
+
+        instance = hints.get('instance')
+        if instance is not None:
+            if instance._meta.label_lower == UNIVERSITY_LABEL:
+                return shard_for_university(instance.pk)
+            if instance._meta.label_lower in SHARDED_MODELS and instance._state.db:
+                return instance._state.db
+            university_id = getattr(instance, 'associated_university_id', None) or getattr(instance, 'university_id', None)
+            if university_id is not None:
+                return shard_for_university(university_id)
+
+        return get_current_shard()
+
+    db_for_read = _route
+    db_for_write = _route
+
+    def allow_relation(self, obj1, obj2, **hints):
+        labels = {obj1._meta.label_lower, obj2._meta.label_lower}
+
+        # Every shard keeps a mirror of its universities, so FKs to University are always allowed
+        if UNIVERSITY_LABEL in labels:
+            return True
+        if labels <= SHARDED_MODELS:
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # All shards carry the full schema
+        return None
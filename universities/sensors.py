@@ -0,0 +1,120 @@
+import hashlib
+import hmac
+import json
+import secrets
+import time
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Sensor
+from .sharding import shard_for_university
+
+
+class InvalidReadings(ValueError):
+    pass
+
+
+# (university_id, sensor_id) -> (key_hash, ids of the spaces it reports for, expires_at); only valid keys get in
+_sensors = {}
+
+
+def get_sensor_cache_ttl():
+    return getattr(settings, 'SENSOR_CACHE_TTL', 60)
+
+
+def hash_secret(secret):
+    # Keys are random, so a fast hash is enough to keep them out of the database
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+
+def issue_key(sensor):
+    """Give the sensor a new key, replacing its previous one. The key is returned and not stored anywhere."""
+    secret = secrets.token_urlsafe(32)
+    sensor.key_hash = hash_secret(secret)
+    sensor.save(update_fields=['key_hash'])
+    forget_sensor(sensor.university_id, sensor.pk)
+    # The university tells which shard the sensor lives on
+    return f'{sensor.university_id}.{sensor.pk}.{secret}'
+
+
+def forget_sensor(university_id, sensor_id):
+    # Other workers still accept the old key (or mapping) for up to SENSOR_CACHE_TTL seconds
+    _sensors.pop((university_id, sensor_id), None)
+
+
+def authenticate(key):
+    """
+    (university_id, ids of the spaces the sensor reports for) for a valid key, else None.
+
+    Sensors are cached per process for SENSOR_CACHE_TTL seconds, so a device
+    reporting every minute costs about one lookup (and one `last_seen` update) per TTL.
+    """
+    try:
+        university_id, sensor_id, secret = key.split('.', 2)
+        university_id, sensor_id = int(university_id), int(sensor_id)
+    except ValueError:
+        return None
+
+    cached = _sensors.get((university_id, sensor_id))
+    if cached is not None and cached[2] > time.monotonic():
+        key_hash, space_ids, _ = cached
+        return (university_id, space_ids) if hmac.compare_digest(key_hash, hash_secret(secret)) else None
+
+    using = shard_for_university(university_id)
+    sensors = Sensor.objects.using(using).filter(pk=sensor_id, university_id=university_id, is_active=True)
+    key_hash = sensors.values_list('key_hash', flat=True).first()
+    if key_hash is None or not hmac.compare_digest(key_hash, hash_secret(secret)):
+        return None
+
+    space_ids = frozenset(
+        Sensor.spaces.through.objects.using(using).filter(sensor_id=sensor_id).values_list('space_id', flat=True)
+    )
+    sensors.update(last_seen=timezone.now())
+    _sensors[(university_id, sensor_id)] = (key_hash, space_ids, time.monotonic() + get_sensor_cache_ttl())
+    return university_id, space_ids
+
+
+def parse_occupancy(value):
+    if type(value) is not int or not 1 <= value <= 5:
+        raise InvalidReadings(f'Occupancy must be an integer from 1 to 5, got {value!r}')
+    return value
+
+
+def parse_readings(body, content_type):
+    """
+    {space_id: occupancy} from a batch; a later reading of a space replaces an earlier one.
+
+    JSON batches look like {"readings": [{"space": 12, "occupancy": 3}, ...]};
+    anything else is read as lines of "<space id> <occupancy>", where empty
+    lines and lines starting with # are skipped.
+    """
+    readings = {}
+    if content_type == 'application/json':
+        try:
+            items = json.loads(body)['readings']
+            pairs = [(item['space'], item['occupancy']) for item in items]
+        except (ValueError, KeyError, TypeError):
+            raise InvalidReadings('Expected {"readings": [{"space": <id>, "occupancy": <1-5>}, ...]}')
+        for space_id, occupancy in pairs:
+            if type(space_id) is not int:
+                raise InvalidReadings(f'Space ids must be integers, got {space_id!r}')
+            readings[space_id] = parse_occupancy(occupancy)
+    else:
+        try:
+            text = body.decode()
+        except UnicodeDecodeError:
+            raise InvalidReadings('Line batches must be UTF-8')
+        for number, line in enumerate(text.splitlines(), start=1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            fields = line.split()
+            if len(fields) != 2 or not fields[0].isdecimal() or not fields[1].isdecimal():
+                raise InvalidReadings(f'Line {number}: expected "<space id> <occupancy>"')
+            readings[int(fields[0])] = parse_occupancy(int(fields[1]))
+
+    limit = getattr(settings, 'SENSOR_BATCH_MAX_READINGS', 1000)
+    if len(readings) > limit:
+        raise InvalidReadings(f'At most {limit} spaces per batch')
+    return readings
@@ -0,0 +1,138 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models.fields import AutoFieldMixin
+
+
+# Models whose rows live on the shard of their university.
+# University itself is the shard directory and always lives on the default database.
+SHARDED_MODELS = {
+    'universities.space',
+    'universities.studyingattributes',
+    'universities.eatingattributes',
+    'universities.coffeeattributes',
+    'universities.spacetombstone',
+    'universities.outboxmessage',
+    'universities.sensor',
+    'universities.sensor_spaces',
+    'universities.occupancysnapshot',
+    'users.user',
+}
+
+# Session key holding the shard of the signed-in user
+SHARD_SESSION_KEY = '_university_shard'
+
+_current_shard = ContextVar('current_shard', default=None)
+
+# university_id -> (alias, expires_at)
+_shard_map = {}
+
+
+def get_shard_map_ttl():
+    return getattr(settings, 'UNIVERSITY_SHARD_MAP_TTL', 60)
+
+
+def shard_for_university(university_id):
+    if university_id is None:
+        return DEFAULT_DB_ALIAS
+
+    cached = _shard_map.get(university_id)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+
+    from .models import University
+
+    alias = (
+        University.objects.using(DEFAULT_DB_ALIAS)
+        .filter(pk=university_id)
+        .values_list('shard', flat=True)
+        .first()
+    ) or DEFAULT_DB_ALIAS
+    _shard_map[university_id] = (alias, time.monotonic() + get_shard_map_ttl())
+    return alias
+
+
+def shard_for_email(email):
+    if not email or '@' not in email:
+        return DEFAULT_DB_ALIAS
+
+    from .models import University
+
+    email_domain = '@' + email.split('@')[1].lower()
+    row = (
+        University.objects.using(DEFAULT_DB_ALIAS)
+        .filter(email_domain=email_domain)
+        .values_list('id', 'shard')
+        .first()
+    )
+    if row is None:
+        return DEFAULT_DB_ALIAS
+
+    university_id, alias = row
+    _shard_map[university_id] = (alias, time.monotonic() + get_shard_map_ttl())
+    return alias
+
+
+def forget_university(university_id):
+    _shard_map.pop(university_id, None)
+
+
+def get_current_shard():
+    return _current_shard.get()
+
+
+@contextmanager
+def use_shard(alias):
+    token = _current_shard.set(alias)
+    try:
+        yield alias
+    finally:
+        _current_shard.reset(token)
+
+
+# Disjoint id blocks: the n-th database in settings.DATABASES hands out ids from
+# n * SHARD_ID_BLOCK on, so rows keep their ids when their university moves.
+
+def get_id_block(using):
+    block = getattr(settings, 'SHARD_ID_BLOCK', 10 ** 12)
+    start = list(settings.DATABASES).index(using) * block
+    return start, start + block
+
+
+def get_id_sequence_models():
+    # Sharded models with a database-generated id, including the many-to-many tables of sharded models
+    for model in apps.get_models(include_auto_created=True):
+        owner = model._meta.auto_created or model
+        if owner._meta.label_lower in SHARDED_MODELS and isinstance(model._meta.pk, AutoFieldMixin):
+            yield model
+
+
+def raise_id_sequence(model, using, next_id):
+    """Make the database hand out ids of at least `next_id` for `model`; never lowers the sequence."""
+    connection = connections[using]
+    table, column = model._meta.db_table, model._meta.pk.column
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            # AUTOINCREMENT tables continue after max(sqlite_sequence.seq, largest id)
+            cursor.execute('UPDATE sqlite_sequence SET seq = MAX(seq, %s) WHERE name = %s', [next_id - 1, table])
+            if not cursor.rowcount:
+                cursor.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)', [table, next_id - 1])
+        elif connection.vendor == 'postgresql':
+            cursor.execute('SELECT pg_get_serial_sequence(%s, %s)', [connection.ops.quote_name(table), column])
+            sequence = cursor.fetchone()[0]
+            cursor.execute(
+                'SELECT setval(%s::regclass, GREATEST(%s, '
+                f'CASE WHEN is_called THEN last_value + 1 ELSE last_value END), false) FROM {sequence}',
+                [sequence, next_id],
+            )
+
+
+def reserve_id_block(using):
+    start, _ = get_id_block(using)
+    if start:
+        for model in get_id_sequence_models():
+            raise_id_sequence(model, using, start)
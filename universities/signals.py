@@ -0,0 +1,82 @@
+from functools import partial
+
+from django.contrib.auth.signals import user_logged_in
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_delete
+from django.dispatch import receiver
+
+from core.pagecache import invalidate_public_pages
+from . import readmodel, sync
+from .models import University, Space
+from .sharding import SHARD_SESSION_KEY, forget_university, reserve_id_block
+
+
+@receiver(post_save, sender=University)
+def mirror_university_to_shard(sender, instance, using, raw=False, **kwargs):
+    # Only the directory copy on the default database drives the mirrors
+    forget_university(instance.pk)
+    if raw or using != DEFAULT_DB_ALIAS or instance.shard == DEFAULT_DB_ALIAS:
+        return
+
+    University.objects.using(instance.shard).update_or_create(
+        pk=instance.pk,
+        defaults={
+            'name': instance.name,
+            'email_domain': instance.email_domain,
+            'is_approved': instance.is_approved,
+            'shard': instance.shard,
+        },
+    )
+
+
+@receiver(post_save, sender=University)
+@receiver(post_delete, sender=University)
+def invalidate_university_pages(sender, using, **kwargs):
+    # The landing page and the university list are cached for anonymous visitors
+    if using == DEFAULT_DB_ALIAS:
+        invalidate_public_pages()
+
+
+@receiver(pre_delete, sender=University)
+def purge_university_shard(sender, instance, using, **kwargs):
+    forget_university(instance.pk)
+    if using != DEFAULT_DB_ALIAS or instance.shard == DEFAULT_DB_ALIAS:
+        return
+
+    # Cascades to the spaces and users stored on the shard
+    University.objects.using(instance.shard).filter(pk=instance.pk).delete()
+
+
+@receiver(post_migrate)
+def reserve_shard_id_block(sender, using, **kwargs):
+    # Sent once per app after all migrations ran; one pass covers the users tables too
+    if sender.name == 'universities':
+        reserve_id_block(using)
+
+
+@receiver(user_logged_in)
+def remember_user_shard(sender, request, user, **kwargs):
+    request.session[SHARD_SESSION_KEY] = user._state.db
+
+
+# The read model of this process follows its own writes once they commit; a rolled back write never shows
+
+@receiver(post_save, sender=Space)
+def update_read_model(sender, instance, using, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(partial(readmodel.update_space, instance), using=using)
+
+
+@receiver(post_delete, sender=Space)
+def remove_from_read_model(sender, instance, using, **kwargs):
+    transaction.on_commit(partial(readmodel.remove_space, instance), using=using)
+
+
+@receiver(pre_delete, sender=Space)
+def reserve_space_deletion_seq(sender, instance, using, **kwargs):
+    sync.reserve_deletion_seq(instance, using)
+
+
+@receiver(post_delete, sender=Space)
+def record_space_deletion(sender, instance, using, **kwargs):
+    sync.record_deletion(instance, using)
@@ -0,0 +1,176 @@
+import heapq
+import math
+from operator import itemgetter
+
+from django.conf import settings
+
+
+METERS_PER_DEGREE_LAT = 110_540
+METERS_PER_DEGREE_LON_AT_EQUATOR = 111_320
+
+
+class SpatialIndex:
+    """
+    Uniform grid over one university's located spaces.
+
+    Coordinates are projected onto a local plane in metres (accurate enough
+    at campus scale). A k-nearest query scans rings of cells around the
+    query point and stops once no unscanned cell can hold a closer space.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = cell_size
+        self.origin_lat = None
+        self.lon_scale = METERS_PER_DEGREE_LON_AT_EQUATOR
+        self.entries = {}
+        self.cells = {}
+        # Copy handed to searches by frozen(); dropped whenever a space moves, appears or goes
+        self.snapshot = None
+
+    def project(self, latitude, longitude):
+        return latitude * METERS_PER_DEGREE_LAT, longitude * self.lon_scale
+
+    def cell_of(self, y, x):
+        return int(y // self.cell_size), int(x // self.cell_size)
+
+    def add(self, space):
+        # `space` is a node of the read model (universities.readmodel), shared with the dashboard
+        entry = self.entries.get(space.id)
+        if (entry is not None and entry[3] is space and space.latitude is not None and space.longitude is not None
+                and self.project(space.latitude, space.longitude) == entry[:2]):
+            # Re-applied without moving, e.g. after an occupancy report
+            return
+
+        self.remove(space.id)
+        if space.latitude is None or space.longitude is None:
+            return
+
+        if self.origin_lat is None:
+            # The longitude scale of the first point is used for the whole campus
+            self.origin_lat = space.latitude
+            self.lon_scale = METERS_PER_DEGREE_LON_AT_EQUATOR * math.cos(math.radians(self.origin_lat))
+
+        y, x = self.project(space.latitude, space.longitude)
+        cell = self.cell_of(y, x)
+        self.entries[space.id] = (y, x, cell, space)
+        self.cells.setdefault(cell, set()).add(space.id)
+        self.snapshot = None
+
+    def remove(self, space_id):
+        entry = self.entries.pop(space_id, None)
+        if entry is None:
+            return
+        self.snapshot = None
+        cell_ids = self.cells[entry[2]]
+        cell_ids.discard(space_id)
+        if not cell_ids:
+            del self.cells[entry[2]]
+
+    def frozen(self):
+        """
+        A copy of the index to search without the campus lock. Cached until a space
+        moves, appears or goes; the nodes themselves are shared, not copied.
+        """
+        if self.snapshot is None:
+            snapshot = SpatialIndex(self.cell_size)
+            snapshot.origin_lat = self.origin_lat
+            snapshot.lon_scale = self.lon_scale
+            snapshot.entries = dict(self.entries)
+            snapshot.cells = {cell: frozenset(ids) for cell, ids in self.cells.items()}
+            self.snapshot = snapshot
+        return self.snapshot
+
+    def nearest(self, latitude, longitude, k=5, floor=None, predicate=None):
+        if not self.cells or k < 1:
+            return []
+
+        y, x = self.project(latitude, longitude)
+        center_row, center_col = self.cell_of(y, x)
+        floor_height = getattr(settings, 'SPATIAL_INDEX_FLOOR_HEIGHT', 4)
+
+        def distance_to(space_y, space_x, space):
+            distance_sq = (space_y - y) ** 2 + (space_x - x) ** 2
+            if floor is not None and space.floor is not None:
+                distance_sq += ((space.floor - floor) * floor_height) ** 2
+            return math.sqrt(distance_sq)
+
+        # Rings between the query point and the grid's bounding box hold no cells, so are skipped
+        rows = [row for row, _ in self.cells]
+        cols = [col for _, col in self.cells]
+        min_row, max_row, min_col, max_col = min(rows), max(rows), min(cols), max(cols)
+        first_ring = max(min_row - center_row, center_row - max_row, min_col - center_col, center_col - max_col, 0)
+        last_ring = max(
+            abs(center_row - min_row), abs(center_row - max_row),
+            abs(center_col - min_col), abs(center_col - max_col),
+        )
+
+        # Far from the campus the rings are long and nearly empty; checking every space is cheaper
+        ring_cells = (2 * last_ring + 1) ** 2 - (2 * first_ring - 1) ** 2 if first_ring else (2 * last_ring + 1) ** 2
+        if ring_cells > len(self.entries):
+            candidates = (
+                (distance_to(space_y, space_x, space), space_id, space)
+                for space_id, (space_y, space_x, _, space) in self.entries.items()
+                if predicate is None or predicate(space)
+            )
+            return [(space, distance) for distance, _, space in heapq.nsmallest(k, candidates, key=itemgetter(0, 1))]
+
+        # Max-heap of the best k: (-distance, id, space)
+        best = []
+        for ring in range(first_ring, last_ring + 1):
+            # Everything outside this ring is at least `(ring) * cell_size` away
+            if len(best) == k and (ring - 1) * self.cell_size > -best[0][0]:
+                break
+
+            for cell in self.ring_cells(center_row, center_col, ring):
+                for space_id in self.cells.get(cell, ()):
+                    space_y, space_x, _, space = self.entries[space_id]
+                    if predicate is not None and not predicate(space):
+                        continue
+
+                    distance = distance_to(space_y, space_x, space)
+                    if len(best) < k:
+                        heapq.heappush(best, (-distance, space_id, space))
+                    elif distance < -best[0][0]:
+                        heapq.heapreplace(best, (-distance, space_id, space))
+
+        # Nearest first, ties by id like the scan above
+        return [(space, -negative) for negative, _, space in sorted(best, key=lambda entry: (-entry[0], entry[1]))]
+
+    @staticmethod
+    def ring_cells(center_row, center_col, ring):
+        if ring == 0:
+            yield center_row, center_col
+            return
+        for col in range(center_col - ring, center_col + ring + 1):
+            yield center_row - ring, col
+            yield center_row + ring, col
+        for row in range(center_row - ring + 1, center_row + ring):
+            yield row, center_col - ring
+            yield row, center_col + ring
+
+
+def find_nearest(university_id, latitude, longitude, k=5, floor=None, space_type=None,
+                 has_wifi=None, has_plugs=None, max_occupancy=None, include_unknown=False):
+    """The k nearest spaces matching the filters, as (SpaceNode, distance in metres) pairs."""
+    # The index lives in the university's read model, which imports this module
+    from .readmodel import get_campus
+
+    def predicate(space):
+        if space_type is not None and space.space_type != space_type:
+            return False
+        if has_wifi and not space.has_wifi:
+            return False
+        if has_plugs and not space.has_plugs:
+            return False
+        if max_occupancy is not None:
+            occupancy = space.current_occupancy
+            if occupancy is None:
+                return include_unknown
+            return occupancy <= max_occupancy
+        return True
+
+    campus = get_campus(university_id)
+    # Only the copy is taken under the lock, so a slow search does not hold up the dashboard
+    with campus.lock:
+        index = campus.spatial.frozen()
+    return index.nearest(latitude, longitude, k=k, floor=floor, predicate=predicate)
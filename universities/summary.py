@@ -0,0 +1,111 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.utils import timezone
+
+from .models import University, Space
+from .sharding import shard_for_university
+
+
+# Lowest occupancy shown as FULL on the dashboard (core.templatetags.space_tree)
+FULL_OCCUPANCY = 5
+
+# Every leaf with the top-level space it belongs to, grouped per (building, space type).
+# Leaves are spaces without children; AVG() and COUNT(column) skip leaves without a report.
+LEAF_GROUPS_SQL = """
+WITH RECURSIVE tree (id, root_id) AS (
+    SELECT id, id FROM {space} WHERE associated_university_id = %s AND parent_id IS NULL
+    UNION ALL
+    SELECT child.id, tree.root_id FROM {space} child JOIN tree ON child.parent_id = tree.id
+)
+SELECT
+    tree.root_id,
+    leaf.space_type,
+    COUNT(*),
+    COUNT(leaf.current_occupancy),
+    SUM(leaf.current_occupancy),
+    SUM(CASE WHEN leaf.current_occupancy >= %s THEN 1 ELSE 0 END)
+FROM tree
+JOIN {space} leaf ON leaf.id = tree.id
+WHERE NOT EXISTS (SELECT 1 FROM {space} below WHERE below.parent_id = leaf.id)
+GROUP BY tree.root_id, leaf.space_type
+"""
+
+
+class Totals:
+    def __init__(self):
+        self.leaves = 0
+        self.reported = 0
+        self.occupancy_sum = 0
+        self.full = 0
+
+    def add(self, leaves, reported, occupancy_sum, full):
+        self.leaves += leaves
+        self.reported += reported
+        self.occupancy_sum += occupancy_sum or 0
+        self.full += full or 0
+
+    def as_dict(self):
+        return {
+            'leaves': self.leaves,
+            'reported': self.reported,
+            'average': round(self.occupancy_sum / self.reported, 2) if self.reported else None,
+            'full': self.full,
+        }
+
+
+def compute_campus_summary(university_id, using):
+    """Occupancy of a university's leaves per space type, per top-level building and per building and type."""
+    with connections[using].cursor() as cursor:
+        cursor.execute(LEAF_GROUPS_SQL.format(space=Space._meta.db_table), [university_id, FULL_OCCUPANCY])
+        groups = cursor.fetchall()
+
+    campus = Totals()
+    by_type = {space_type: Totals() for space_type, _ in Space.SPACE_TYPES}
+    by_building = {}
+    heatmap = {}
+    for root_id, space_type, *counts in groups:
+        campus.add(*counts)
+        by_type.setdefault(space_type, Totals()).add(*counts)
+        by_building.setdefault(root_id, Totals()).add(*counts)
+        heatmap.setdefault(root_id, {}).setdefault(space_type, Totals()).add(*counts)
+
+    buildings = []
+    for root in (
+        Space.objects.using(using)
+        .filter(associated_university_id=university_id, parent=None)
+        .order_by('name', 'location')
+        .values('id', 'name', 'location', 'aggregate_occupancy')
+    ):
+        totals = by_building.get(root['id'], Totals())
+        buildings.append({
+            **root,
+            **totals.as_dict(),
+            'by_type': {space_type: cell.as_dict() for space_type, cell in heatmap.get(root['id'], {}).items()},
+        })
+
+    return {
+        **campus.as_dict(),
+        'by_type': {space_type: totals.as_dict() for space_type, totals in by_type.items()},
+        'buildings': buildings,
+        'generated_at': timezone.now(),
+    }
+
+
+def get_campus_summary(university_id):
+    """
+    Campus summary of a university, cached per university version.
+
+    The version is the university's change sequence (universities.sync), which
+    moves with every write to its spaces, so a cached summary is never stale and
+    superseded entries just expire.
+    """
+    using = shard_for_university(university_id)
+    version = University.objects.using(using).filter(pk=university_id).values_list('change_seq', flat=True).get()
+
+    key = f'campus-summary:{university_id}:{version}'
+    summary = cache.get(key)
+    if summary is None:
+        summary = {'version': version, **compute_campus_summary(university_id, using)}
+        cache.set(key, summary, getattr(settings, 'CAMPUS_SUMMARY_CACHE_TIMEOUT', 10 * 60))
+    return summary
@@ -0,0 +1,415 @@
+from functools import partial
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Avg, Case, Count, Exists, F, Max, OuterRef, Q, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import University, UniversityReadOnly, Space, SpaceTombstone, SpaceVersionConflict
+from .outbox import publish_occupancy_change, publish_occupancy_changes
+from .sharding import shard_for_university
+from .tree import build_tree, aggregate_occupancies
+
+
+# Columns sent to delta-sync clients
+SYNC_FIELDS = (
+    'id', 'parent_id', 'name', 'location', 'space_type',
+    'current_occupancy', 'aggregate_occupancy', 'last_updated',
+    'latitude', 'longitude', 'floor', 'change_seq',
+)
+
+# Type-specific attributes sent along, read from their side table with a LEFT JOIN
+ATTRIBUTE_VALUES = {
+    'has_wifi': F('studying_attributes__has_wifi'),
+    'has_plugs': F('studying_attributes__has_plugs'),
+}
+
+
+def next_change_seq(university_id, using, count=1):
+    """
+    Hand out the university's next change sequence number (the last of `count` new ones).
+
+    Must run inside the transaction of the write being stamped: the row lock
+    taken by the UPDATE is held until commit, so numbers become visible in
+    order and a client never skips a change that commits later. Raises
+    UniversityReadOnly while the university is being moved to another shard.
+    """
+    counter = University.objects.using(using).filter(pk=university_id)
+    if not counter.filter(read_only=False).update(change_seq=F('change_seq') + count):
+        raise UniversityReadOnly(f'University {university_id} is being moved and is read-only')
+    return counter.values_list('change_seq', flat=True).get()
+
+
+def compute_aggregate(space_id, own_occupancy, using):
+    # Avg() skips children without data, like Space.get_occupancy()
+    stats = Space.objects.using(using).filter(parent_id=space_id).aggregate(
+        average=Avg('aggregate_occupancy'),
+        count=Count('id'),
+    )
+    return stats['average'] if stats['count'] else own_occupancy
+
+
+def refresh_ancestors(university_id, parent_id, using):
+    # Walks up until an aggregate comes out unchanged; every changed ancestor is re-stamped
+    while parent_id is not None:
+        row = (
+            Space.objects.using(using)
+            .filter(pk=parent_id)
+            .values_list('parent_id', 'current_occupancy', 'aggregate_occupancy')
+            .first()
+        )
+        if row is None:
+            return
+
+        grandparent_id, own_occupancy, stored = row
+        value = compute_aggregate(parent_id, own_occupancy, using)
+        if value == stored:
+            return
+
+        change_seq = next_change_seq(university_id, using)
+        Space.objects.using(using).filter(pk=parent_id).update(aggregate_occupancy=value, change_seq=change_seq)
+        publish_occupancy_change(parent_id, university_id, own_occupancy, value, change_seq, using)
+        parent_id = grandparent_id
+
+
+def claim_version(space, using):
+    # Compare-and-set on the row version; the UPDATE also locks the row until commit
+    claimed = Space.objects.using(using).filter(pk=space.pk, version=space.version).update(
+        version=F('version') + 1,
+    )
+    if claimed:
+        space.version += 1
+    elif Space.objects.using(using).filter(pk=space.pk).exists():
+        raise SpaceVersionConflict(
+            f'Space {space.pk} was changed by someone else since version {space.version} was loaded'
+        )
+
+
+def save_space(space, base_save, *args, **kwargs):
+    """
+    Space.save(): stamp the row, keep its aggregate and its ancestors' aggregates current.
+
+    Saving an existing space fails with SpaceVersionConflict when its version
+    moved since it was loaded, instead of overwriting the other write.
+    """
+    using = kwargs.get('using') or router.db_for_write(Space, instance=space)
+
+    with transaction.atomic(using=using):
+        # The university counter is always locked before space rows, so writers cannot deadlock
+        space.change_seq = next_change_seq(space.associated_university_id, using)
+        if space._state.adding:
+            space.aggregate_occupancy = space.current_occupancy
+        else:
+            claim_version(space, using)
+            space.aggregate_occupancy = compute_aggregate(space.pk, space.current_occupancy, using)
+
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = {*kwargs['update_fields'], 'aggregate_occupancy', 'change_seq', 'version'}
+        base_save(*args, **kwargs)
+        space.save_attributes(using)
+
+        if (space.current_occupancy, space.aggregate_occupancy) != getattr(space, '_loaded_occupancy', (None, None)):
+            publish_occupancy_change(
+                space.pk, space.associated_university_id, space.current_occupancy,
+                space.aggregate_occupancy, space.change_seq, using,
+            )
+
+        refresh_ancestors(space.associated_university_id, space.parent_id, using)
+        former_parent_id = getattr(space, '_loaded_parent_id', None)
+        if former_parent_id != space.parent_id:
+            refresh_ancestors(space.associated_university_id, former_parent_id, using)
+        space.remember_stored_state()
+
+
+def report_occupancy(university_id, space_id, occupancy, user_id, spaces=None):
+    """
+    Record an occupancy report with a single conditional UPDATE of the space.
+
+    Only the occupancy columns are written, so a report never overwrites a
+    concurrent edit of the space. The space is not read before the write; only
+    the university's change counter is (next_change_seq(), an UPDATE and a
+    SELECT). `spaces` narrows the spaces that can be reported on, e.g. to
+    Space.objects.authorized(request, REPORT). Returns False when the university
+    has no such space (or `spaces` leaves it out), in which case the counter is
+    rolled back and no sequence number is used up.
+    """
+    using = shard_for_university(university_id)
+    now = timezone.now()
+
+    with transaction.atomic(using=using):
+        change_seq = next_change_seq(university_id, using)
+        updated = (spaces if spaces is not None else Space.objects).using(using).filter(
+            pk=space_id, associated_university_id=university_id,
+        ).update(
+            current_occupancy=occupancy,
+            last_updated=now,
+            last_updated_by_id=user_id,
+            # Composites keep the average of their children
+            aggregate_occupancy=Case(
+                When(Exists(Space.objects.filter(parent_id=OuterRef('pk'))), then=F('aggregate_occupancy')),
+                default=Value(occupancy, output_field=Space._meta.get_field('aggregate_occupancy')),
+            ),
+            version=F('version') + 1,
+            change_seq=change_seq,
+        )
+        if not updated:
+            # Hands the sequence number back (up to the savepoint, inside an outer transaction)
+            transaction.set_rollback(True, using=using)
+            return False
+
+        parent_id, aggregate = (
+            Space.objects.using(using)
+            .filter(pk=space_id)
+            .values_list('parent_id', 'aggregate_occupancy')
+            .get()
+        )
+        # The event is committed with the report or not at all; delivery happens out of band
+        publish_occupancy_change(space_id, university_id, occupancy, aggregate, change_seq, using)
+        refresh_ancestors(university_id, parent_id, using)
+
+    from . import readmodel
+    # Runs right away unless an outer transaction is still open
+    transaction.on_commit(
+        partial(readmodel.update_occupancy, university_id, space_id, occupancy, now), using=using,
+    )
+    return True
+
+
+def report_occupancies(university_id, occupancies):
+    """
+    Record many occupancy reports ({space_id: occupancy}) of one university in one transaction.
+
+    The bulk path of report_occupancy() for sensors (universities.sensors): the
+    rows are locked and read with one SELECT and written with one UPDATE, and
+    events and ancestor refreshes are only paid for spaces whose occupancy
+    changed. Unchanged readings still move `last_updated`. Returns the ids of
+    the spaces found in the university.
+    """
+    using = shard_for_university(university_id)
+    now = timezone.now()
+
+    with transaction.atomic(using=using):
+        # Counter first, then the spaces: the lock order of every other writer
+        list(University.objects.using(using).select_for_update().filter(pk=university_id).values_list('pk'))
+        rows = list(
+            Space.objects.using(using)
+            .select_for_update()
+            .filter(pk__in=occupancies, associated_university_id=university_id)
+            .order_by('pk')
+            .annotate(is_composite=Exists(Space.objects.filter(parent_id=OuterRef('pk'))))
+            .values_list('id', 'parent_id', 'current_occupancy', 'is_composite')
+        )
+        if not rows:
+            return []
+
+        # One sequence number per space, so delta-sync pages never split a tie
+        last_seq = next_change_seq(university_id, using, count=len(rows))
+        seqs = {space_id: last_seq - len(rows) + number for number, (space_id, *_) in enumerate(rows, start=1)}
+        # Readings take one of five values, so the occupancy columns are set per value, not per space
+        by_value, leaves_by_value = {}, {}
+        for space_id, _, _, is_composite in rows:
+            by_value.setdefault(occupancies[space_id], []).append(space_id)
+            if not is_composite:
+                leaves_by_value.setdefault(occupancies[space_id], []).append(space_id)
+        Space.objects.using(using).filter(pk__in=seqs).update(
+            current_occupancy=Case(*[When(pk__in=ids, then=Value(value)) for value, ids in by_value.items()]),
+            # Composites keep the average of their children
+            aggregate_occupancy=Case(
+                *[When(pk__in=ids, then=Value(float(value))) for value, ids in leaves_by_value.items()],
+                default=F('aggregate_occupancy'),
+            ),
+            last_updated=now,
+            last_updated_by=None,
+            version=F('version') + 1,
+            change_seq=Case(*[When(pk=space_id, then=Value(seq)) for space_id, seq in seqs.items()]),
+        )
+
+        changed = [row for row in rows if row[2] != occupancies[row[0]]]
+        if changed:
+            aggregates = dict(
+                Space.objects.using(using)
+                .filter(pk__in=[space_id for space_id, *_ in changed])
+                .values_list('id', 'aggregate_occupancy')
+            )
+            publish_occupancy_changes(university_id, [
+                (space_id, occupancies[space_id], aggregates[space_id], seqs[space_id])
+                for space_id, *_ in changed
+            ], using)
+            for parent_id in {parent_id for _, parent_id, *_ in changed if parent_id is not None}:
+                refresh_ancestors(university_id, parent_id, using)
+
+    from . import readmodel
+
+    def update_read_model():
+        for space_id in seqs:
+            readmodel.update_occupancy(university_id, space_id, occupancies[space_id], now)
+    transaction.on_commit(update_read_model, using=using)
+    return list(seqs)
+
+
+def reserve_deletion_seq(space, using):
+    # pre_delete: takes the counter lock before the DELETE locks the space rows
+    space._deletion_seq = next_change_seq(space.associated_university_id, using)
+
+
+def record_deletion(space, using):
+    with transaction.atomic(using=using):
+        seq = getattr(space, '_deletion_seq', None) or next_change_seq(space.associated_university_id, using)
+        SpaceTombstone.objects.using(using).create(
+            university_id=space.associated_university_id,
+            space_id=space.id,
+            change_seq=seq,
+        )
+        refresh_ancestors(space.associated_university_id, space.parent_id, using)
+
+
+def get_stale_reports(using, space_type, cutoff):
+    # Leaves only: composites show the average of their children, which expire on their own
+    return (
+        Space.objects.using(using)
+        .filter(space_type=space_type, current_occupancy__isnull=False)
+        .filter(Q(last_updated__lt=cutoff) | Q(last_updated__isnull=True))
+        .filter(~Exists(Space.objects.filter(parent_id=OuterRef('pk'))))
+    )
+
+
+def expire_report_batch(stale, university_id, using, batch_size):
+    with transaction.atomic(using=using):
+        # Counter first, then the spaces: the lock order of every other writer
+        list(University.objects.using(using).select_for_update().filter(pk=university_id).values_list('pk'))
+        rows = list(
+            stale.filter(associated_university_id=university_id)
+            .select_for_update(skip_locked=True)
+            .order_by('last_updated')
+            .values_list('id', 'parent_id')[:batch_size]
+        )
+        if not rows:
+            return 0
+
+        # One sequence number per space, so delta-sync pages never split a tie
+        last_seq = next_change_seq(university_id, using, count=len(rows))
+        seqs = {space_id: last_seq - len(rows) + number for number, (space_id, _) in enumerate(rows, start=1)}
+        Space.objects.using(using).filter(pk__in=seqs).update(
+            current_occupancy=None,
+            aggregate_occupancy=None,
+            version=F('version') + 1,
+            change_seq=Case(*[When(pk=space_id, then=Value(seq)) for space_id, seq in seqs.items()]),
+        )
+
+        for space_id, seq in seqs.items():
+            publish_occupancy_change(space_id, university_id, None, None, seq, using)
+        for parent_id in {parent_id for _, parent_id in rows if parent_id is not None}:
+            refresh_ancestors(university_id, parent_id, using)
+    return len(rows)
+
+
+def expire_reports(space_type, older_than, batch_size=500):
+    """
+    Clear leaf reports of `space_type` older than `older_than`, on every database.
+
+    Each batch of at most `batch_size` spaces is one short transaction: a
+    set-based UPDATE plus the refresh of the composites above it. Spaces
+    locked by a concurrent report are skipped, they were just refreshed anyway.
+    Returns the number of expired reports.
+    """
+    cutoff = timezone.now() - older_than
+    expired = 0
+    for using in settings.DATABASES:
+        stale = get_stale_reports(using, space_type, cutoff)
+        university_ids = list(stale.order_by().values_list('associated_university_id', flat=True).distinct())
+        for university_id in university_ids:
+            while True:
+                count = expire_report_batch(stale, university_id, using, batch_size)
+                expired += count
+                if count < batch_size:
+                    break
+    return expired
+
+
+def get_changes(university_id, since=None, limit=1000):
+    """
+    Changes of a university's spaces after the sync token `since`.
+
+    Returns a dict with the changed spaces (ancestors whose aggregate moved are
+    included, since they were re-stamped), the ids of deleted spaces and the
+    token to pass next time. Without a token, or with one older than the
+    pruned tombstones, a full snapshot is returned with `reset` set.
+    """
+    using = shard_for_university(university_id)
+    current, horizon = (
+        University.objects.using(using)
+        .filter(pk=university_id)
+        .values_list('change_seq', 'sync_horizon')
+        .get()
+    )
+
+    reset = since is None or since < horizon
+    after = -1 if reset else since
+
+    spaces = list(
+        Space.objects.using(using)
+        .filter(associated_university_id=university_id, change_seq__gt=after)
+        .order_by('change_seq')
+        .values(*SYNC_FIELDS, **ATTRIBUTE_VALUES)[:limit + 1]
+    )
+    tombstones = [] if reset else list(
+        SpaceTombstone.objects.using(using)
+        .filter(university_id=university_id, change_seq__gt=after)
+        .order_by('change_seq')
+        .values_list('change_seq', 'space_id')[:limit + 1]
+    )
+
+    # Merge both streams by sequence number and cut the page at `limit`
+    merged = sorted(
+        [(space['change_seq'], 'space', space) for space in spaces]
+        + [(seq, 'deleted', space_id) for seq, space_id in tombstones],
+        key=lambda item: item[0],
+    )
+    has_more = len(merged) > limit
+    page = merged[:limit]
+
+    return {
+        'token': page[-1][0] if has_more else max(current, page[-1][0] if page else current),
+        'reset': reset,
+        'has_more': has_more,
+        'changed': [item for _, kind, item in page if kind == 'space'],
+        'deleted': [item for _, kind, item in page if kind == 'deleted'],
+    }
+
+
+def prune_tombstones(older_than):
+    """Delete old tombstones; clients with tokens from before them get a full snapshot."""
+    cutoff = timezone.now() - older_than
+    pruned = 0
+    for using in settings.DATABASES:
+        expired = SpaceTombstone.objects.using(using).filter(deleted_at__lt=cutoff)
+        horizons = expired.values('university_id').annotate(last=Max('change_seq'))
+        for row in horizons:
+            University.objects.using(using).filter(pk=row['university_id']).update(
+                sync_horizon=Greatest(F('sync_horizon'), row['last']),
+            )
+        pruned += expired.delete()[0]
+    return pruned
+
+
+def rebuild_aggregates(university_id):
+    """Recompute every aggregate of a university from scratch, re-stamping the spaces that change."""
+    using = shard_for_university(university_id)
+    with transaction.atomic(using=using):
+        spaces = list(
+            Space.objects.using(using)
+            .filter(associated_university_id=university_id)
+            .only('id', 'parent_id', 'current_occupancy', 'aggregate_occupancy')
+        )
+        roots, children = build_tree(spaces)
+        occupancies = aggregate_occupancies(roots, children)
+
+        changed = []
+        for space in spaces:
+            if space.aggregate_occupancy != occupancies[space.id]:
+                space.aggregate_occupancy = occupancies[space.id]
+                space.change_seq = next_change_seq(university_id, using)
+                changed.append(space)
+        Space.objects.using(using).bulk_update(changed, ['aggregate_occupancy', 'change_seq'], batch_size=500)
+    return len(changed)
@@ -0,0 +1,90 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from core.tasks import task
+from .models import University, Space, SpaceTombstone
+from .sharding import shard_for_university, use_shard
+from .history import prune_history, record_all_history
+from .sync import expire_reports, rebuild_aggregates
+
+
+logger = logging.getLogger(__name__)
+
+
+def delete_spaces_in_batches(queryset, batch_size):
+    # Deepest spaces go first, so no batch has to cascade through a large subtree
+    levels = []
+    level = list(queryset.values_list('id', flat=True))
+    while level:
+        levels.append(level)
+        # Unordered, so the lookup goes through the parent index
+        level = list(Space.objects.filter(parent_id__in=level).order_by().values_list('id', flat=True))
+
+    deleted = 0
+    for level in reversed(levels):
+        for start in range(0, len(level), batch_size):
+            deleted += Space.objects.filter(id__in=level[start:start + batch_size]).delete()[0]
+    return deleted
+
+
+@task()
+def delete_space_tree(space_id, university_id, batch_size=500):
+    with use_shard(shard_for_university(university_id)):
+        delete_spaces_in_batches(
+            Space.objects.filter(id=space_id, associated_university_id=university_id),
+            batch_size,
+        )
+
+
+@task()
+def delete_university(university_id, batch_size=500):
+    with use_shard(shard_for_university(university_id)):
+        delete_spaces_in_batches(
+            Space.objects.filter(associated_university_id=university_id, parent=None),
+            batch_size,
+        )
+
+        users = get_user_model().objects.filter(associated_university_id=university_id)
+        while True:
+            batch = list(users.values_list('id', flat=True)[:batch_size])
+            if not batch:
+                break
+            users.filter(id__in=batch).delete()
+
+        SpaceTombstone.objects.filter(university_id=university_id).delete()
+
+    University.objects.filter(pk=university_id).delete()
+
+
+@task()
+def rebuild_space_aggregates(university_id):
+    rebuild_aggregates(university_id)
+
+
+@task()
+def expire_stale_reports(batch_size=500):
+    # Runs every few minutes from TASKS_PERIODIC
+    counts = {
+        space_type: expire_reports(space_type, timedelta(seconds=ttl), batch_size)
+        for space_type, ttl in getattr(settings, 'OCCUPANCY_REPORT_TTL', {}).items()
+    }
+    logger.info('Expired occupancy reports: %s', counts)
+    return counts
+
+
+@task()
+def record_occupancy_history():
+    # Runs every minute from TASKS_PERIODIC; the recording interval is the resolution of the history
+    recorded = record_all_history()
+    logger.info('Recorded occupancy history of %s universities', recorded)
+    return recorded
+
+
+@task()
+def prune_occupancy_history():
+    pruned = prune_history(timedelta(days=getattr(settings, 'HISTORY_RETENTION_DAYS', 30)))
+    logger.info('Pruned %s occupancy history records', pruned)
+    return pruned
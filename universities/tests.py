@@ -0,0 +1,133 @@
+import threading
+
+from django.db import connections
+from django.test import TransactionTestCase, skipUnlessDBFeature
+
+from .models import University, Space, SpaceVersionConflict
+from .sync import report_occupancy
+
+
+class SpaceContentionTests(TransactionTestCase):
+    """Concurrent writes to one space: version checks on save, conditional UPDATEs for reports."""
+
+    def setUp(self):
+        self.university = University.objects.create(name='Contention', email_domain='@contention.test')
+        self.building = Space.objects.create(
+            name='Building', location='Test', space_type=Space.SPACE_TYPE_STUDYING,
+            associated_university=self.university,
+        )
+        self.room = Space.objects.create(
+            name='Room', location='Test', space_type=Space.SPACE_TYPE_STUDYING,
+            associated_university=self.university, parent=self.building,
+        )
+
+    def get_change_seq(self):
+        return University.objects.values_list('change_seq', flat=True).get(pk=self.university.pk)
+
+    def test_stale_save_raises_conflict(self):
+        stale = Space.objects.get(pk=self.room.pk)
+        fresh = Space.objects.get(pk=self.room.pk)
+        fresh.name = 'Room A'
+        fresh.save()
+        change_seq = self.get_change_seq()
+
+        stale.name = 'Room B'
+        with self.assertRaises(SpaceVersionConflict):
+            stale.save()
+
+        # The losing write is rolled back whole, sequence number included
+        self.room.refresh_from_db()
+        self.assertEqual(self.room.name, 'Room A')
+        self.assertEqual(self.room.version, 2)
+        self.assertEqual(self.get_change_seq(), change_seq)
+
+    def test_save_after_reload_succeeds(self):
+        stale = Space.objects.get(pk=self.room.pk)
+        report_occupancy(self.university.pk, self.room.pk, 3, None)
+
+        stale.name = 'Room B'
+        with self.assertRaises(SpaceVersionConflict):
+            stale.save()
+
+        # The retry of check_space_contention: reload, apply the edit again
+        space = Space.objects.get(pk=self.room.pk)
+        space.name = 'Room B'
+        space.save()
+
+        self.room.refresh_from_db()
+        self.assertEqual((self.room.name, self.room.current_occupancy, self.room.version), ('Room B', 3, 3))
+
+    def test_report_keeps_concurrent_edit(self):
+        loaded = Space.objects.get(pk=self.room.pk)
+        loaded.name = 'Room A'
+        self.assertTrue(report_occupancy(self.university.pk, self.room.pk, 4, None))
+
+        # The report only wrote the occupancy columns, so the edit is refused rather than undoing it
+        with self.assertRaises(SpaceVersionConflict):
+            loaded.save()
+
+        self.room.refresh_from_db()
+        self.building.refresh_from_db()
+        self.assertEqual((self.room.name, self.room.current_occupancy, self.room.version), ('Room', 4, 2))
+        self.assertEqual(self.building.aggregate_occupancy, 4)
+
+    def test_report_on_missing_space_uses_no_sequence_number(self):
+        change_seq = self.get_change_seq()
+        self.assertFalse(report_occupancy(self.university.pk, self.room.pk + 1000, 3, None))
+        self.assertEqual(self.get_change_seq(), change_seq)
+
+    def test_report_outside_narrowed_spaces_is_refused(self):
+        change_seq = self.get_change_seq()
+        spaces = Space.objects.exclude(pk=self.room.pk)
+        self.assertFalse(report_occupancy(self.university.pk, self.room.pk, 3, None, spaces=spaces))
+
+        self.room.refresh_from_db()
+        self.assertIsNone(self.room.current_occupancy)
+        self.assertEqual(self.get_change_seq(), change_seq)
+
+    @skipUnlessDBFeature('test_db_allows_multiple_connections')
+    def test_concurrent_reports_and_edits_lose_nothing(self):
+        reports, edits, errors = [], [], []
+        lock = threading.Lock()
+
+        def reporter():
+            for occupancy in (1, 2, 3, 4, 5):
+                report_occupancy(self.university.pk, self.room.pk, occupancy, None)
+                with lock:
+                    reports.append(occupancy)
+
+        def editor(number):
+            for attempt in range(3):
+                while True:
+                    space = Space.objects.get(pk=self.room.pk)
+                    space.name = f'Room {number}.{attempt}'
+                    try:
+                        space.save()
+                    except SpaceVersionConflict:
+                        continue
+                    break
+                with lock:
+                    edits.append(space.name)
+
+        def run(target, *args):
+            try:
+                target(*args)
+            except Exception as error:
+                with lock:
+                    errors.append(error)
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=run, args=(editor, number)) for number in range(2)]
+        threads += [threading.Thread(target=run, args=(reporter,)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.room.refresh_from_db()
+        self.building.refresh_from_db()
+        self.assertEqual(self.room.version, 1 + len(reports) + len(edits))
+        self.assertIn(self.room.name, edits)
+        self.assertEqual(self.building.aggregate_occupancy, self.room.aggregate_occupancy)
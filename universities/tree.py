@@ -0,0 +1,39 @@
+def build_tree(spaces):
+    """
+    Group an already loaded list of spaces by parent.
+
+    Returns (roots, children) where children maps a space id to its child spaces.
+    The input order (Space.Meta.ordering) is kept within every level.
+    """
+    roots = []
+    children = {}
+    for space in spaces:
+        if space.parent_id is None:
+            roots.append(space)
+        else:
+            children.setdefault(space.parent_id, []).append(space)
+    return roots, children
+
+
+def aggregate_occupancies(roots, children):
+    """
+    Same result as Space.get_occupancy() for every space of the tree, without queries.
+
+    Leaves report their own occupancy; composites the average of their
+    children that have data. Walks the tree iteratively, children before parents.
+    """
+    occupancies = {}
+    stack = [(root, False) for root in reversed(roots)]
+    while stack:
+        space, children_done = stack.pop()
+        kids = children.get(space.id)
+
+        if not kids:
+            occupancies[space.id] = space.current_occupancy
+        elif children_done:
+            values = [occupancies[kid.id] for kid in kids if occupancies[kid.id] is not None]
+            occupancies[space.id] = sum(values) / len(values) if values else None
+        else:
+            stack.append((space, True))
+            stack.extend((kid, False) for kid in kids)
+    return occupancies
@@ -21,4 +21,16 @@ urlpatterns = [
     path('delete/<int:pk>', views.UniversityDeleteView.as_view(), name='university_delete'),
 
     path('space/delete/<int:space_id>/', views.delete_space, name='delete_space'),
+
+    # Closest spaces to a position, as JSON
+    path('spaces/nearest', views.nearest_spaces, name='nearest_spaces'),
+
+    # Spaces changed or deleted since a sync token, as JSON
+    path('spaces/changes', views.space_changes, name='space_changes'),
+
+    # Occupancy summary of the whole campus, as JSON
+    path('spaces/summary', views.campus_summary, name='campus_summary'),
+
+    # Occupancy readings of sensors, authenticated with their API key (settings.MACHINE_ENDPOINT_PREFIX)
+    path('sensors/readings', views.sensor_readings, name='sensor_readings'),
 ]
@@ -2,27 +2,162 @@ from django.views import generic
 from django.urls import reverse_lazy
 from django.shortcuts import redirect, get_object_or_404
 from django.contrib import messages
+from django.utils.decorators import method_decorator
 from .models import University
 from .forms import UniversityForm
 
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_POST
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET, require_POST
 from django.shortcuts import get_object_or_404, redirect
-from .models import Space
+from .models import Space, UniversityReadOnly
+from .tasks import delete_space_tree, delete_university
+from .spatial import find_nearest
+from .sync import get_changes, report_occupancies
+from .summary import get_campus_summary
+from .sensors import InvalidReadings, authenticate, parse_readings
+from .sharding import get_shard_map_ttl
+from core.middleware import machine_endpoint
+from users.authorization import MANAGE, VIEW, for_request
+from core.pagecache import cache_public_page, invalidate_public_pages
 
 @login_required
 @require_POST
 def delete_space(request, space_id):
-    # Ensure the user belongs to the university the space is in
-    space = get_object_or_404(
-        Space,
-        id=space_id,
-        associated_university=request.user.associated_university
-    )
-    space.delete()
+    # Spaces the user may not manage are not found
+    space = get_object_or_404(Space.objects.authorized(request, MANAGE), id=space_id)
+    if space.children.exists():
+        # Whole subtrees are removed in the background to keep the request fast
+        delete_space_tree.enqueue(space_id=space.id, university_id=space.associated_university_id)
+    else:
+        space.delete()
     return redirect('homepage')
 
 
+def parse_flag(value):
+    return value is not None and value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def viewable_university_id(request):
+    # These views read the read model or raw SQL, so the Space rule is applied by university
+    return for_request(request).university_id(Space, VIEW)
+
+
+def no_campus():
+    return JsonResponse({'error': 'Only university users can read their campus'}, status=403)
+
+
+@login_required
+@require_GET
+def nearest_spaces(request):
+    # Example: /universities/spaces/nearest?lat=45.54&lon=13.73&type=studying&wifi=1&max_occupancy=2&k=5
+    try:
+        latitude = float(request.GET['lat'])
+        longitude = float(request.GET['lon'])
+        k = max(1, min(int(request.GET.get('k', 5)), 50))
+        floor = int(request.GET['floor']) if request.GET.get('floor') else None
+        max_occupancy = int(request.GET['max_occupancy']) if request.GET.get('max_occupancy') else None
+    except (KeyError, ValueError):
+        return JsonResponse({'error': 'lat and lon are required; k, floor and max_occupancy must be integers'},
+                            status=400)
+    # float() also accepts nan and inf
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return JsonResponse({'error': 'lat must be within [-90, 90] and lon within [-180, 180]'}, status=400)
+
+    space_type = request.GET.get('type') or None
+    if space_type is not None and space_type not in dict(Space.SPACE_TYPES):
+        return JsonResponse({'error': f'Unknown space type: {space_type}'}, status=400)
+
+    university_id = viewable_university_id(request)
+    if university_id is None:
+        return no_campus()
+
+    results = find_nearest(
+        university_id,
+        latitude,
+        longitude,
+        k=k,
+        floor=floor,
+        space_type=space_type,
+        has_wifi=parse_flag(request.GET.get('wifi')),
+        has_plugs=parse_flag(request.GET.get('plugs')),
+        max_occupancy=max_occupancy,
+        include_unknown=parse_flag(request.GET.get('include_unknown')),
+    )
+
+    return JsonResponse({'spaces': [
+        {
+            'id': space.id,
+            'name': space.name,
+            'location': space.location,
+            'space_type': space.space_type,
+            'floor': space.floor,
+            'occupancy': space.current_occupancy,
+            'last_updated': space.last_updated,
+            'distance_m': round(distance, 1),
+        }
+        for space, distance in results
+    ]})
+
+
+@login_required
+@require_GET
+def space_changes(request):
+    # Example: /universities/spaces/changes?since=1042&limit=500
+    # Omit `since` for a full snapshot; then pass the returned token on every call
+    try:
+        since = int(request.GET['since']) if request.GET.get('since') else None
+        limit = max(1, min(int(request.GET.get('limit', 500)), 1000))
+    except ValueError:
+        return JsonResponse({'error': 'since and limit must be integers'}, status=400)
+
+    university_id = viewable_university_id(request)
+    if university_id is None:
+        return no_campus()
+    return JsonResponse(get_changes(university_id, since=since, limit=limit))
+
+
+@login_required
+@require_GET
+def campus_summary(request):
+    # Average occupancy and FULL leaves per space type, per building and per building and type (heatmap)
+    university_id = viewable_university_id(request)
+    if university_id is None:
+        return no_campus()
+    return JsonResponse(get_campus_summary(university_id))
+
+
+@machine_endpoint
+@require_POST
+def sensor_readings(request):
+    # Example: POST /universities/sensors/readings with "Authorization: Bearer <key>" and a body of
+    # "<space id> <occupancy>" lines, or {"readings": [{"space": 12, "occupancy": 3}]} as application/json
+    scheme, _, key = request.headers.get('Authorization', '').partition(' ')
+    sensor = authenticate(key.strip()) if scheme.lower() == 'bearer' else None
+    if sensor is None:
+        response = JsonResponse({'error': 'Invalid sensor key'}, status=401)
+        response['WWW-Authenticate'] = 'Bearer'
+        return response
+
+    try:
+        readings = parse_readings(request.body, request.content_type)
+    except InvalidReadings as error:
+        return JsonResponse({'error': str(error)}, status=400)
+
+    # Spaces the sensor is not mapped to (or that were deleted) are reported back, not written
+    university_id, space_ids = sensor
+    allowed = {space_id: occupancy for space_id, occupancy in readings.items() if space_id in space_ids}
+    try:
+        accepted = report_occupancies(university_id, allowed) if allowed else []
+    except UniversityReadOnly:
+        # The university is being moved to another shard; the device retries later
+        response = JsonResponse({'error': 'University is read-only for now'}, status=503)
+        response['Retry-After'] = str(get_shard_map_ttl())
+        return response
+    return JsonResponse({'accepted': len(accepted), 'rejected': sorted(readings.keys() - set(accepted))})
+
+
+@method_decorator(cache_public_page, name='dispatch')
 class UniversityListView(generic.ListView):
     # Specifies which model to query from database
     model = University
@@ -106,9 +241,11 @@ class UniversityDeleteView(generic.View):
         university = get_object_or_404(University, pk=pk)
         # Store name before deleting (for success message)
         university_name = university.name
-        # Delete the associated_university from database
-        university.delete()
+        # Stop new signups right away, the spaces and users are deleted in the background
+        University.objects.filter(pk=pk).update(is_approved=False)
+        invalidate_public_pages()
+        delete_university.enqueue(university_id=university.pk)
         # Add success message
-        messages.success(request, f'University "{university_name}" deleted successfully!')
+        messages.success(request, f'University "{university_name}" is being deleted.')
         # Redirect back to list
         return redirect('university_list')
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from .authorization import MANAGE
 from .models import User
 
 
@@ -25,3 +26,7 @@ class CustomUserAdmin(UserAdmin):
             "fields": ("email", "password",  "is_staff", "is_active"),
         }),
     )
+
+    def get_queryset(self, request):
+        # Staff who are not system admins only reach their own account (users.authorization)
+        return super().get_queryset(request).authorized(request, MANAGE)
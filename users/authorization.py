@@ -0,0 +1,114 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.db import models
+
+
+VIEW = 'view'
+MANAGE = 'manage'
+REPORT = 'report'
+
+
+# RULES: (user, action) -> lookups every permitted row matches, {} for all rows, None for none.
+# Decided from the user row alone, so applying them never costs a query.
+
+def is_system_admin(user):
+    return user.is_authenticated and user.is_active and user.is_system_admin
+
+
+def university_of(user):
+    # The university an active university user acts within, None for everyone else
+    if user.is_authenticated and user.is_active and user.is_university_user:
+        return user.associated_university_id
+    return None
+
+
+def space_rule(user, action):
+    # System admins manage every space but do not report occupancy
+    if is_system_admin(user):
+        return {} if action in (VIEW, MANAGE) else None
+    university_id = university_of(user)
+    return None if university_id is None else {'associated_university_id': university_id}
+
+
+def user_rule(user, action):
+    if is_system_admin(user):
+        return {}
+    university_id = university_of(user)
+    if university_id is None:
+        return None
+    if action == VIEW:
+        return {'associated_university_id': university_id}
+    # Everyone manages their own account only
+    return {'pk': user.pk} if action == MANAGE else None
+
+
+def space_history_rule(user, action):
+    if action != VIEW:
+        return None
+    if is_system_admin(user):
+        return {}
+    university_id = university_of(user)
+    return None if university_id is None else {'university_id': university_id}
+
+
+RULES = {
+    'universities.space': space_rule,
+    'users.user': user_rule,
+    'universities.spacetombstone': space_history_rule,
+    'universities.occupancysnapshot': space_history_rule,
+}
+
+
+class Authorization:
+    """
+    What one user may do, applied as filters on querysets.
+
+    Every (model, action) decision is made once and kept for the life of the
+    object, which is one request (see for_request()). Scoping a queryset adds
+    a WHERE clause, so a row the user may not touch is simply not found.
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.decisions = {}
+
+    def lookups(self, model, action):
+        key = (model._meta.label_lower, action)
+        if key not in self.decisions:
+            rule = RULES.get(key[0])
+            if rule is None:
+                raise ImproperlyConfigured(f'No authorization rule for {key[0]}')
+            self.decisions[key] = rule(self.user, action)
+        return self.decisions[key]
+
+    def scope(self, queryset, action=VIEW):
+        lookups = self.lookups(queryset.model, action)
+        return queryset.none() if lookups is None else queryset.filter(**lookups)
+
+    def university_id(self, model, action=VIEW):
+        """
+        The one university the rows of `model` the user may `action` belong to, or None.
+
+        For code that reads a university's rows outside the ORM (the read model,
+        raw SQL); None also when the user is not limited to one university.
+        """
+        lookups = self.lookups(model, action) or {}
+        return lookups.get('associated_university_id', lookups.get('university_id'))
+
+    def allows(self, action, obj):
+        """Whether an object at hand is in scope, decided from its own fields without a query."""
+        lookups = self.lookups(type(obj), action)
+        return lookups is not None and all(getattr(obj, field) == value for field, value in lookups.items())
+
+
+def for_request(request):
+    # request.user changes on sign-in and sign-out, and the decisions with it
+    authorization = getattr(request, '_authorization', None)
+    if authorization is None or authorization.user is not request.user:
+        authorization = request._authorization = Authorization(request.user)
+    return authorization
+
+
+class AuthorizedQuerySet(models.QuerySet):
+    def authorized(self, request, action=VIEW):
+        """The rows the signed-in user of `request` may `action` (VIEW, MANAGE or REPORT)."""
+        return for_request(request).scope(self, action)
@@ -0,0 +1,89 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.db import DEFAULT_DB_ALIAS
+
+from universities.sharding import get_current_shard, shard_for_email, use_shard
+
+
+# (shard, user_id) -> (user with its university, expires_at), least recently used first;
+# see users.signals for invalidation. Threaded servers share it, so it is only touched under the lock
+_identities = OrderedDict()
+_identities_lock = threading.Lock()
+
+
+def get_identity_cache_ttl():
+    return getattr(settings, 'IDENTITY_CACHE_TTL', 30)
+
+
+def forget_identity(user_id):
+    # Runs on every User save (sign-ins included), so the user's keys are popped, not searched for
+    with _identities_lock:
+        for alias in settings.DATABASES:
+            _identities.pop((alias, user_id), None)
+
+
+def forget_university_identities(university_id):
+    with _identities_lock:
+        for key, (user, _) in list(_identities.items()):
+            if user.associated_university_id == university_id:
+                del _identities[key]
+
+
+def remember_identity(key, user):
+    with _identities_lock:
+        _identities[key] = (user, time.monotonic() + get_identity_cache_ttl())
+        _identities.move_to_end(key)
+        # Expired entries of users who left fall out here as well
+        while len(_identities) > getattr(settings, 'IDENTITY_CACHE_MAX_SIZE', 10_000):
+            _identities.popitem(last=False)
+
+
+def copy_identity(user):
+    # Every request gets its own instances, so nothing it changes leaks into the cache
+    clone = copy.copy(user)
+    clone._state = copy.copy(user._state)
+    clone._state.fields_cache = {name: copy.copy(value) for name, value in user._state.fields_cache.items()}
+    return clone
+
+
+class ShardedModelBackend(ModelBackend):
+    """ModelBackend that looks the user up on the shard of their email domain."""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(get_user_model().USERNAME_FIELD)
+
+        with use_shard(shard_for_email(username)):
+            return super().authenticate(request, username=username, password=password, **kwargs)
+
+    def get_user(self, user_id):
+        """
+        The signed-in user of a request, with their university, in at most one query.
+
+        Users are kept for IDENTITY_CACHE_TTL seconds per process, at most
+        IDENTITY_CACHE_MAX_SIZE of them; saving or deleting a user or a
+        university drops the affected entries right away.
+        """
+        key = (get_current_shard() or DEFAULT_DB_ALIAS, user_id)
+        with _identities_lock:
+            cached = _identities.get(key)
+            if cached and cached[1] > time.monotonic():
+                _identities.move_to_end(key)
+                return copy_identity(cached[0])
+
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.db_manager(key[0]).select_related('associated_university').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        if not self.user_can_authenticate(user):
+            return None
+
+        remember_identity(key, user)
+        return copy_identity(user)
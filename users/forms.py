@@ -2,6 +2,7 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm, PasswordChangeForm
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
+from universities.sharding import shard_for_email
 
 User = get_user_model()
 
@@ -44,8 +45,8 @@ class SignupForm(UserCreationForm):
     def clean_email(self):
         email = self.cleaned_data.get('email')
 
-        # CHECK IF USER ALREADY EXISTS
-        if User.objects.filter(email=email).exists():
+        # CHECK IF USER ALREADY EXISTS (ON THE SHARD OF ITS UNIVERSITY)
+        if User.objects.db_manager(shard_for_email(email)).filter(email=email).exists():
             raise ValidationError("An account with this email already exists.")
 
         # NORMALIZE EMAIL TO LOWERCASE
@@ -60,7 +61,7 @@ class SignupForm(UserCreationForm):
         from universities.models import University
 
         # CHECK IF AN APPROVED UNIVERSITY EXISTS WITH THIS DOMAIN
-        if not University.objects.filter(email_domain=email_domain, is_approved=True).exists():
+        if not University.objects.filter(email_domain=email_domain, is_approved=True, read_only=False).exists():
 
             raise ValidationError(
                 "This associated_university is not yet supported."
@@ -0,0 +1,41 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand
+
+from users.provisioning import provision_accounts
+
+
+class Command(BaseCommand):
+    help = (
+        "Create university accounts in bulk from a CSV file with 'email' and optional "
+        "'password' columns. Accounts without a password get an unusable one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file, or '-' for standard input")
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--workers', type=int, default=None, help='Hashing processes (default: CPU count)')
+        parser.add_argument('--inactive', action='store_true', help='Create the accounts inactive')
+
+    def handle(self, path, batch_size, workers, inactive, **options):
+        source = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            # Rows are streamed, the file is never loaded as a whole
+            accounts = ((row['email'], row.get('password')) for row in csv.DictReader(source))
+            result = provision_accounts(
+                accounts,
+                batch_size=batch_size,
+                workers=workers,
+                is_active=not inactive,
+            )
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        for email in result.rejected:
+            self.stderr.write(f'Rejected (no approved university): {email}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Created {result.created} accounts, {result.existing} already existed, '
+            f'{len(result.rejected)} rejected'
+        ))
@@ -0,0 +1,48 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    0002 as fresh installs run it: SystemAdmin and UniversityUser are dropped as
+    whole tables before User gains their fields. 0002 removes their columns one
+    by one first, which SQLite cannot do for a table left without columns.
+    Databases that applied 0002 keep it and just record this one as applied.
+    """
+
+    replaces = [
+        ('users', '0002_remove_systemadmin_user_ptr_and_more'),
+    ]
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('universities', '0002_initial'),
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='SystemAdmin',
+        ),
+        migrations.DeleteModel(
+            name='UniversityUser',
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='associated_university',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='users', to='universities.university'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='reputation_score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['email'], name='users_user_email_6f2530_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['associated_university'], name='users_user_associa_c2305c_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_remove_user_reputation_score'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='user',
+            name='users_user_email_6f2530_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='user',
+            name='users_user_associa_c2305c_idx',
+        ),
+    ]
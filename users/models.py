@@ -2,8 +2,10 @@ from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, Permis
 from django.core.exceptions import ValidationError
 from django.db import models
 
+from .authorization import MANAGE, REPORT, Authorization, AuthorizedQuerySet
 
-class CustomUserManager(BaseUserManager):
+
+class CustomUserManager(BaseUserManager.from_queryset(AuthorizedQuerySet)):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
             raise ValueError('The Email field must be set')
@@ -59,10 +61,6 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     class Meta:
         db_table = 'users_user'
-        indexes = [
-            models.Index(fields=['email']),
-            models.Index(fields=['associated_university']),
-        ]
 
     def __str__(self):
         return self.email
@@ -93,35 +91,19 @@ class User(AbstractBaseUser, PermissionsMixin):
     # Properties to check user type
     @property
     def is_university_user(self):
-        return self.associated_university is not None and not self.is_superuser
+        # The id alone, so checking does not load the university
+        return self.associated_university_id is not None and not self.is_superuser
 
     @property
     def is_system_admin(self):
         return self.is_superuser and self.is_staff
 
-    # Permission methods
+    # Permission methods (rules in users.authorization; querysets use .authorized(request, action))
     def can_manage_space(self, space):
-        if not self.is_active:
-            return False
-
-        if self.is_system_admin:
-            return True
-
-        # University users can only manage spaces in their university
-        return (
-                self.is_university_user and
-                space.university == self.associated_university
-        )
+        return Authorization(self).allows(MANAGE, space)
 
     def can_report_occupancy(self, space):
-        if not self.is_active:
-            return False
-
-        # Only university users can report (not system admins)
-        return (
-                self.is_university_user and
-                space.university == self.associated_university
-        )
+        return Authorization(self).allows(REPORT, space)
 
     def approve_university(self, university):
         if self.is_system_admin:
@@ -147,10 +129,11 @@ class User(AbstractBaseUser, PermissionsMixin):
         email_domain = '@' + email.split('@')[1]
 
         try:
-            # Only return approved universities
+            # Only return approved universities that are not in the middle of a move
             return University.objects.get(
                 email_domain=email_domain,
-                is_approved=True
+                is_approved=True,
+                read_only=False,
             )
         except University.DoesNotExist:
             return None
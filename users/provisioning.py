@@ -0,0 +1,136 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from itertools import islice
+
+import django
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, transaction
+
+from universities.models import University
+
+
+@dataclass
+class ProvisioningResult:
+    created: int = 0
+    existing: int = 0
+    rejected: list = field(default_factory=list)
+
+
+def _init_worker():
+    # Workers started with 'spawn' do not inherit the configured Django
+    if not apps.ready:
+        django.setup()
+
+
+def _hash_password(password):
+    # Accounts without a password get an unusable one and have to reset it
+    return make_password(password or None)
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def provision_accounts(accounts, batch_size=1000, workers=None, is_active=True):
+    """
+    Create university users in bulk from an iterable of (email, password) pairs.
+
+    Email domains are resolved against the approved universities once, passwords
+    are hashed in a process pool, and users are inserted with bulk_create, so
+    User.save() and its per-user queries are skipped. Existing emails are left untouched,
+    including ones signed up while the batch was being hashed. `workers=0` hashes in
+    the calling process instead of starting a pool, for small batches in a web request.
+    """
+    User = get_user_model()
+    result = ProvisioningResult()
+
+    # email domain -> (university id, shard)
+    universities = {
+        domain: (university_id, shard)
+        for university_id, domain, shard in University.objects.using(DEFAULT_DB_ALIAS)
+        .filter(is_approved=True, read_only=False)
+        .values_list('id', 'email_domain', 'shard')
+    }
+
+    pool = None
+    if workers != 0:
+        pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_init_worker)
+    with pool or nullcontext():
+        for chunk in _chunks(accounts, batch_size):
+            # 1. NORMALIZE AND MATCH EMAILS TO UNIVERSITIES
+            accepted = {}
+            for email, password in chunk:
+                email = (email or '').strip().lower()
+                domain = '@' + email.split('@')[1] if email.count('@') == 1 else None
+                if domain not in universities:
+                    result.rejected.append(email)
+                elif email not in accepted:
+                    accepted[email] = password
+
+            # 2. SKIP ACCOUNTS THAT ALREADY EXIST, PER SHARD
+            by_shard = {}
+            for email in accepted:
+                university_id, shard = universities['@' + email.split('@')[1]]
+                by_shard.setdefault(shard, []).append((email, university_id))
+
+            for shard, members in by_shard.items():
+                existing = set(
+                    User.objects.using(shard)
+                    .filter(email__in=[email for email, _ in members])
+                    .values_list('email', flat=True)
+                )
+                result.existing += len(existing)
+                members = [member for member in members if member[0] not in existing]
+
+                # 3. HASH IN PARALLEL, THEN INSERT THE WHOLE BATCH AT ONCE
+                passwords = [accepted[email] for email, _ in members]
+                if pool is None:
+                    hashes = map(_hash_password, passwords)
+                else:
+                    hashes = pool.map(
+                        _hash_password,
+                        passwords,
+                        chunksize=max(1, len(members) // (4 * (workers or os.cpu_count()))),
+                    )
+                users = [
+                    User(
+                        email=email,
+                        password=password_hash,
+                        associated_university_id=university_id,
+                        is_active=is_active,
+                    )
+                    for (email, university_id), password_hash in zip(members, hashes)
+                ]
+                created = _insert(User, users, shard, batch_size)
+                result.created += created
+                result.existing += len(users) - created
+
+    return result
+
+
+def _insert(User, users, using, batch_size):
+    # An email signed up since the existence check fails the whole batch; only then go row by row
+    try:
+        with transaction.atomic(using=using):
+            User.objects.using(using).bulk_create(users, batch_size=batch_size)
+        return len(users)
+    except IntegrityError:
+        pass
+
+    created = 0
+    for user in users:
+        # Ids set by the rolled back batch are not in the table
+        user.pk = None
+        try:
+            with transaction.atomic(using=using):
+                User.objects.using(using).bulk_create([user])
+            created += 1
+        except IntegrityError:
+            pass
+    return created
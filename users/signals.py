@@ -0,0 +1,18 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from universities.models import University
+from .backends import forget_identity, forget_university_identities
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def drop_cached_user(sender, instance, **kwargs):
+    forget_identity(instance.pk)
+
+
+@receiver(post_save, sender=University)
+@receiver(post_delete, sender=University)
+def drop_cached_university_users(sender, instance, **kwargs):
+    forget_university_identities(instance.pk)
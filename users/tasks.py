@@ -0,0 +1,29 @@
+from urllib.parse import urljoin
+
+from django.contrib.auth import get_user_model
+from django.template.loader import render_to_string
+
+from core.tasks import task
+from universities.sharding import shard_for_university, use_shard
+
+
+@task(max_attempts=8)
+def send_verification_email(user_id, university_id, base_url):
+    with use_shard(shard_for_university(university_id)):
+        user = get_user_model().objects.filter(pk=user_id, is_active=False).first()
+        if user is None:
+            # Already verified or removed in the meantime
+            return
+
+        # Only installed with settings.VERIFY_EMAIL
+        from verify_email.email_handler import ActivationMailManager
+
+        # send_verification_link() deletes the user when sending fails, which would
+        # make retries impossible, so the link and the mail are built separately here
+        mail_manager = ActivationMailManager()
+        link = urljoin(base_url, mail_manager._generate_verification_url(user, user.email))
+        msg = render_to_string(
+            mail_manager.settings.get('html_message_template', raise_exception=True),
+            {'link': link, 'inactive_user': user},
+        )
+        mail_manager._send_email(msg, user.email)
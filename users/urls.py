@@ -6,4 +6,7 @@ urlpatterns = [
     # AUTHENTICATION
     path('signup_form', views.SignupView.as_view(), name="signup_form"),
     path('signin_form', views.signin_user, name="signin_form"),
+
+    # PROVISIONING
+    path('provision', views.provision_accounts_api, name="provision_accounts"),
 ]
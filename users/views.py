@@ -1,9 +1,18 @@
+import csv
+from itertools import islice
+
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, logout, update_session_auth_hash
 from django.contrib.auth.decorators import login_required
 from .forms import SignupForm, SigninForm
 from django.views import View
-from verify_email.email_handler import ActivationMailManager
+from django.conf import settings
+from django.http import JsonResponse
+from django.views.decorators.http import require_POST
+from .authorization import is_system_admin
+from .provisioning import provision_accounts
+from .tasks import send_verification_email
+from core.ratelimit import ratelimit
 
 
 class SignupView(View):
@@ -26,17 +35,26 @@ class SignupView(View):
 
         form = self.form_class(request.POST)
         if form.is_valid():
-            # Send verification email using ActivationMailManager (disabled for mvp)
-            # mail_manager = ActivationMailManager()
-            # mail_manager.send_verification_link(request, form)
-            if form.is_valid():
-                user = form.save()  # Add this line!
-                return redirect('signin_form')
+            if settings.VERIFY_EMAIL:
+                # Account stays inactive until the emailed link is followed;
+                # the mail itself is sent by a background task
+                user = form.save(commit=False)
+                user.is_active = False
+                user.save()
+                send_verification_email.enqueue(
+                    user_id=user.pk,
+                    university_id=user.associated_university_id,
+                    base_url=request.build_absolute_uri('/'),
+                )
+            else:
+                form.save()
+            return redirect('signin_form')
 
         # 400 Bad Request
         return render(request, self.template_name, {'form': form}, status=400)
 
 
+@ratelimit('signin', condition=lambda request: request.method == 'POST')
 def signin_user(request):
     if request.user.is_authenticated:
         return redirect('homepage')
@@ -55,6 +73,35 @@ def signin_user(request):
                   context={'form': form})
 
 
+@require_POST
+def provision_accounts_api(request):
+    # Example: POST /users/provision?inactive=1 as a signed-in system admin, with the CSV
+    # `manage.py provision_accounts` reads ('email' and optional 'password' columns) as the body
+    if not is_system_admin(request.user):
+        return JsonResponse({'error': 'Only system admins can provision accounts'}, status=403)
+
+    # Passwords are hashed right here, one after the other, so only small batches are taken;
+    # larger imports go through the command and its process pool
+    max_accounts = getattr(settings, 'PROVISIONING_API_MAX_ACCOUNTS', 20)
+    try:
+        # At most one row past the limit is read from the body
+        rows = list(islice(csv.DictReader(line.decode() for line in request), max_accounts + 1))
+        if len(rows) > max_accounts:
+            return JsonResponse({
+                'error': f'At most {max_accounts} accounts per request, use `manage.py provision_accounts` for more',
+            }, status=413)
+        result = provision_accounts(
+            ((row['email'], row.get('password')) for row in rows),
+            workers=0,
+            is_active=request.GET.get('inactive') is None,
+        )
+    except (KeyError, UnicodeDecodeError, csv.Error):
+        return JsonResponse({'error': "Expected UTF-8 CSV with an 'email' and an optional 'password' column"},
+                            status=400)
+
+    return JsonResponse({'created': result.created, 'existing': result.existing, 'rejected': result.rejected})
+
+
 def handle_signout(view_func):
     def wrapper(request, *args, **kwargs):
         if request.method == 'POST' and request.POST.get('action') == 'signout':